@@ -0,0 +1,191 @@
+from datetime import date, datetime, time, timedelta
+from typing import List, Dict, Any, Optional
+from sqlalchemy import insert, func, select, text, type_coerce
+from sqlalchemy.dialects.postgresql import JSONB, array, insert as pg_insert
+from sqlalchemy.orm import Session, Query
+from app import deadline, timing
+from app.models import XiaohongshuNote, ClientAccount
+from app.services.fingerprint_service import fingerprint_service
+from app.services.analytics_service import analytics_service
+
+
+def apply_statement_timeout(db: Session, minimum_ms: int = 1000) -> None:
+    """按请求剩余时间设置当前事务的语句超时（仅 PostgreSQL）
+
+    模型调用已用掉大部分预算时，写库也不应超过请求的截止时间；
+    至少保留 minimum_ms，避免已生成的内容因预算耗尽而无法保存。
+    """
+    left = deadline.remaining()
+    if left is None or db.get_bind().dialect.name != "postgresql":
+        return
+    timeout_ms = max(minimum_ms, int(left * 1000))
+    db.execute(text(f"SET LOCAL statement_timeout = {timeout_ms}"))
+
+
+def existing_input_fingerprints(db: Session, notes: List[Dict[str, Any]]) -> set:
+    """写入前已存在的输入指纹，用于统计重新生成次数"""
+    input_fingerprints = {note["input_fingerprint"] for note in notes if note.get("input_fingerprint")}
+    if not input_fingerprints:
+        return set()
+    return {
+        row[0] for row in db.query(XiaohongshuNote.input_fingerprint)
+        .filter(XiaohongshuNote.input_fingerprint.in_(input_fingerprints))
+        .distinct()
+    }
+
+
+def bulk_create_notes(db: Session, notes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """批量写入笔记
+
+    使用单条多行 INSERT ... RETURNING 在一个事务内写入所有笔记，
+    直接用返回的 id/created_at 组装结果，无需逐条 commit + refresh。
+    """
+    if not notes:
+        return []
+
+    # 补全缺失的内容指纹
+    notes = [
+        note if "content_simhash" in note else {**note, **fingerprint_service.fingerprint_note(note)}
+        for note in notes
+    ]
+
+    with timing.stage("db", "insert notes"):
+        return _insert_notes(db, notes)
+
+
+def _insert_notes(db: Session, notes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    apply_statement_timeout(db)
+    existing_fingerprints = existing_input_fingerprints(db, notes)
+
+    stmt = (
+        insert(XiaohongshuNote)
+        .values(notes)
+        .returning(XiaohongshuNote.id, XiaohongshuNote.created_at)
+    )
+    try:
+        # PostgreSQL 对单条 INSERT ... VALUES 按写入顺序返回 RETURNING 行
+        rows = db.execute(stmt).fetchall()
+        saved_notes = [
+            {**note, "id": row.id, "created_at": row.created_at, "updated_at": None}
+            for note, row in zip(notes, rows)
+        ]
+        # 汇总统计与笔记在同一事务内更新
+        analytics_service.record_notes(db, saved_notes, existing_fingerprints)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return saved_notes
+
+
+def allocate_note_ids(db: Session, count: int) -> List[int]:
+    """从笔记表的序列中一次取出 count 个 id（仅 PostgreSQL）"""
+    rows = db.execute(
+        text("SELECT nextval(pg_get_serial_sequence('xiaohongshu_notes', 'id')) FROM generate_series(1, :count)"),
+        {"count": count}
+    ).fetchall()
+    db.commit()
+    return [row[0] for row in rows]
+
+
+def insert_notes_with_ids(db: Session, notes: List[Dict[str, Any]]) -> int:
+    """写入已分配 id 与 created_at 的笔记，返回实际新写入的条数
+
+    已存在的 (id, created_at) 会被跳过，重试一批部分已提交的写入时不会重复，
+    汇总统计也只累加新写入的笔记。
+    """
+    if not notes:
+        return 0
+    existing_fingerprints = existing_input_fingerprints(db, notes)
+    stmt = (
+        pg_insert(XiaohongshuNote)
+        .values(notes)
+        .on_conflict_do_nothing()
+        .returning(XiaohongshuNote.id)
+    )
+    try:
+        inserted_ids = {row.id for row in db.execute(stmt)}
+        analytics_service.record_notes(
+            db, [note for note in notes if note["id"] in inserted_ids], existing_fingerprints
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(inserted_ids)
+
+
+def filter_notes(
+    query: Query,
+    model: Optional[str] = None,
+    platform: Optional[str] = None,
+    account_id: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> Query:
+    """按模型、平台、账号和创建日期过滤笔记查询"""
+    if model:
+        query = query.filter(XiaohongshuNote.model == model)
+    if platform:
+        query = query.filter(XiaohongshuNote.input_platform == platform)
+    if account_id is not None:
+        query = query.filter(XiaohongshuNote.input_selected_account_id == account_id)
+    # 使用 created_at 范围条件，便于按月分区裁剪
+    if start_date:
+        query = query.filter(XiaohongshuNote.created_at >= datetime.combine(start_date, time.min))
+    if end_date:
+        query = query.filter(XiaohongshuNote.created_at < datetime.combine(end_date + timedelta(days=1), time.min))
+    return query
+
+
+def bulk_create_client_accounts(db: Session, accounts: List[Dict[str, Any]]) -> List[int]:
+    """使用单条多行 INSERT ... RETURNING 批量写入客户账号"""
+    if not accounts:
+        return []
+
+    stmt = insert(ClientAccount).values(accounts).returning(ClientAccount.id)
+    try:
+        ids = [row.id for row in db.execute(stmt)]
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return ids
+
+
+def search_client_accounts(
+    db: Session,
+    keywords: List[str],
+    match_all: bool = False,
+    platform: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100
+) -> List[ClientAccount]:
+    """按话题关键词查询客户账号（走 topic_keywords 的 GIN 索引）"""
+    topic_keywords = type_coerce(ClientAccount.topic_keywords, JSONB)
+    condition = topic_keywords.has_all(array(keywords)) if match_all else topic_keywords.has_any(array(keywords))
+    query = db.query(ClientAccount).filter(condition)
+    if platform:
+        query = query.filter(ClientAccount.platform == platform)
+    return query.order_by(ClientAccount.id).offset(skip).limit(limit).all()
+
+
+def get_keyword_frequencies(db: Session, platform: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+    """统计各话题关键词出现在多少个账号中"""
+    topic_keywords = type_coerce(ClientAccount.topic_keywords, JSONB)
+    keyword = func.jsonb_array_elements_text(topic_keywords).table_valued("value").alias("keyword")
+    query = (
+        select(keyword.c.value, func.count().label("account_count"))
+        .select_from(ClientAccount)
+        .join(keyword, True)
+        # 对非数组（JSON null 等标量）展开会报错，只统计数组
+        .where(func.jsonb_typeof(topic_keywords) == "array")
+    )
+    if platform:
+        query = query.where(ClientAccount.platform == platform)
+    query = query.group_by(keyword.c.value).order_by(func.count().desc(), keyword.c.value).limit(limit)
+    return [
+        {"keyword": row.value, "account_count": row.account_count}
+        for row in db.execute(query)
+    ]
@@ -1,6 +1,8 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
+from app import tracing
+from app.query_monitor import query_monitor
 
 # 直接使用 FASTAPI_DB_URL 环境变量
 DATABASE_URL = os.getenv(
@@ -9,6 +11,10 @@ DATABASE_URL = os.getenv(
 )
 
 engine = create_engine(DATABASE_URL)
+# 请求内执行的每条语句记录为追踪 span
+tracing.instrument_engine(engine)
+# 慢查询日志、按请求的语句计数与抽样执行计划
+query_monitor.instrument(engine)
 SessionLocal = sessionmaker(bind=engine)
 
 Base = declarative_base()
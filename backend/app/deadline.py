@@ -0,0 +1,78 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+# 请求的截止时间（time.monotonic() 时刻），由中间件在入口处设置
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+# 入口（nginx）传入的剩余时间预算，单位秒
+DEADLINE_HEADER = "x-request-timeout"
+# 未传入请求头时的默认预算，需小于 nginx 的 proxy_read_timeout
+DEFAULT_BUDGET = float(os.getenv("REQUEST_DEADLINE_SECONDS", "55"))
+# 为写库和返回响应预留的时间
+DB_RESERVE = float(os.getenv("REQUEST_DEADLINE_DB_RESERVE", "2"))
+
+
+class DeadlineExceeded(Exception):
+    """请求剩余时间不足以执行下一阶段"""
+
+
+def budget_from_header(value: Optional[str]) -> float:
+    """解析入口传入的预算，非法值或超过默认值时使用默认预算"""
+    try:
+        budget = float(value) if value else DEFAULT_BUDGET
+    except ValueError:
+        return DEFAULT_BUDGET
+    return max(0.0, min(budget, DEFAULT_BUDGET))
+
+
+def start(budget: float):
+    """为当前请求设置截止时间，返回用于恢复的 token"""
+    return _deadline.set(time.monotonic() + budget)
+
+
+def reset(token) -> None:
+    _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """剩余秒数；没有截止时间时返回 None"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def timeout_for(default: float) -> float:
+    """某个阶段可用的超时：不超过自身默认值，也不超过请求剩余时间"""
+    left = remaining()
+    if left is None:
+        return default
+    return max(0.0, min(default, left))
+
+
+def check(stage: str) -> None:
+    """剩余时间耗尽时抛出 DeadlineExceeded"""
+    if expired():
+        raise DeadlineExceeded(f"请求已超过截止时间，跳过: {stage}")
+
+
+@contextmanager
+def reserve(seconds: float) -> Iterator[None]:
+    """在上下文内把截止时间提前 seconds 秒，为后续阶段（如写库）预留时间"""
+    deadline = _deadline.get()
+    if deadline is None:
+        yield
+        return
+    token = _deadline.set(deadline - seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
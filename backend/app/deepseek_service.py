@@ -1,13 +1,13 @@
-import httpx
 import json
-import os
 from typing import Dict, Any, Optional
 import re
+from app.services.llm_gateway import llm_gateway
+from app.services.prompt_templates import render_note_prompt
 
 class DeepSeekService:
     def __init__(self):
-        self.api_key = os.getenv("DEEPSEEK_API_KEY", "")
-        self.base_url = "https://api.deepseek.com/v1/chat/completions"
+        # deepseek-chat 默认经统一网关直连 DeepSeek（LLM_DIRECT_ROUTES），共享连接池与并发限制
+        self.model = "deepseek-chat"
         
     async def generate_xiaohongshu_note(
         self, 
@@ -23,7 +23,7 @@ class DeepSeekService:
         调用DeepSeek API生成小红书笔记内容
         """
         # 如果没有API key，直接返回备用内容
-        if not self.api_key or self.api_key == "sk-your-deepseek-api-key-here":
+        if not llm_gateway.configured and not llm_gateway.backends["deepseek"].configured:
             return {
                 "success": True,
                 "data": self._get_fallback_content(
@@ -32,51 +32,30 @@ class DeepSeekService:
                 )
             }
         
-        # 构建提示词
-        prompt = self._build_prompt(
-            basic_content, note_purpose, recent_trends, 
-            writing_style, target_audience, content_type, reference_links
-        )
-        
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": "deepseek-chat",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "你是一个专业的小红书内容创作专家，擅长根据用户需求生成高质量的小红书图文笔记。请严格按照JSON格式返回结果。"
-                },
-                {
-                    "role": "user", 
-                    "content": prompt
-                }
-            ],
-            "temperature": 0.7,
-            "max_tokens": 2000
-        }
+        # 使用与 One-API 相同的预编译笔记模板
+        rendered = render_note_prompt({
+            "basic_content": basic_content,
+            "note_purpose": note_purpose,
+            "recent_trends": recent_trends,
+            "writing_style": writing_style,
+            "target_audience": target_audience,
+            "content_type": content_type,
+            "reference_links": reference_links
+        })
         
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(self.base_url, headers=headers, json=data)
-                response.raise_for_status()
-                
-                result = response.json()
-                content = result["choices"][0]["message"]["content"]
-                
-                # 解析JSON响应
-                try:
-                    parsed_content = json.loads(content)
-                    return {
-                        "success": True,
-                        "data": parsed_content
-                    }
-                except json.JSONDecodeError:
-                    # 如果不是标准JSON，尝试提取内容
-                    return self._parse_fallback_content(content)
+            result = await llm_gateway.chat_completion(self.model, rendered["messages"], temperature=0.7, max_tokens=2000)
+            content = llm_gateway.extract_content(result)
+            
+            # 解析JSON响应
+            parsed_content = llm_gateway.parse_json_object(content)
+            if parsed_content is not None:
+                return {
+                    "success": True,
+                    "data": parsed_content
+                }
+            # 如果不是标准JSON，尝试提取内容
+            return self._parse_fallback_content(content)
                     
         except Exception as e:
             return {
@@ -88,62 +67,6 @@ class DeepSeekService:
                 )
             }
     
-    def _build_prompt(
-        self, 
-        basic_content: str, 
-        note_purpose: Optional[str] = None, 
-        recent_trends: Optional[str] = None, 
-        writing_style: Optional[str] = None, 
-        target_audience: Optional[str] = None, 
-        content_type: Optional[str] = None, 
-        reference_links: Optional[str] = None
-    ) -> str:
-        """构建提示词"""
-        prompt = f"""
-请根据以下信息生成一篇小红书图文笔记：
-
-基本内容：{basic_content}
-"""
-        
-        if note_purpose:
-            prompt += f"笔记目的：{note_purpose}\n"
-        
-        if recent_trends:
-            prompt += f"近期热梗：{recent_trends}\n"
-            
-        if writing_style:
-            prompt += f"写作风格：{writing_style}\n"
-            
-        if target_audience:
-            prompt += f"目标受众：{target_audience}\n"
-            
-        if content_type:
-            prompt += f"内容类型：{content_type}\n"
-            
-        if reference_links:
-            prompt += f"参考链接：{reference_links}\n"
-            
-        prompt += """
-请生成以下内容，并以JSON格式返回：
-
-{
-    "note_title": "笔记标题（吸引人的标题，包含emoji）",
-    "note_content": "笔记正文（包含多个段落，使用emoji和换行符，适合小红书风格）",
-    "comment_guide": "评论区引导文案（鼓励用户互动的文案）",
-    "comment_questions": "评论区问题（3-5个引导性问题，用换行符分隔）"
-}
-
-要求：
-1. 标题要有吸引力，包含相关emoji
-2. 正文要符合指定的写作风格，多使用emoji，分段清晰
-3. 内容要针对目标受众，符合指定的内容类型
-4. 如果有近期热梗，要巧妙融入内容中
-5. 评论引导要能激发用户参与
-6. 问题要具体且容易回答
-7. 整体内容要围绕笔记目的展开
-"""
-        return prompt
-    
     def _parse_fallback_content(self, content: str) -> Dict[str, Any]:
         """备用内容解析"""
         # 尝试从内容中提取JSON
@@ -0,0 +1,108 @@
+import asyncio
+import os
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Any, Awaitable, Dict, Optional, TypeVar
+from fastapi import Request
+
+T = TypeVar("T")
+
+# 客户端断开后的处理策略：cancel 取消上游调用且不写库；persist 继续生成并保存
+DISCONNECT_POLICIES = ("cancel", "persist")
+
+
+class ClientDisconnected(Exception):
+    """客户端在生成完成前断开连接"""
+
+
+class _Watch:
+    """一次生成请求的断开状态，在请求内派生的任务间共享"""
+
+    def __init__(self):
+        self.disconnected = False
+
+
+_watch: ContextVar[Optional[_Watch]] = ContextVar("disconnect_watch", default=None)
+
+
+class DisconnectMonitor:
+    """检测生成接口的客户端断开，按策略取消进行中的上游请求
+
+    生成协程作为独立任务运行，同时等待客户端的 http.disconnect 消息；
+    断开时 cancel 策略取消该任务（任务内的模型请求随之取消，后续写库不会执行），
+    persist 策略只记录，继续等待生成完成并保存结果。
+    """
+
+    def __init__(self):
+        self.policy = os.getenv("CLIENT_DISCONNECT_POLICY", "cancel").lower()
+        if self.policy not in DISCONNECT_POLICIES:
+            print(f"⚠️ 未知的 CLIENT_DISCONNECT_POLICY: {self.policy}，使用 cancel")
+            self.policy = "cancel"
+        self.disconnected_requests = 0
+        self.cancelled_requests = 0
+        self.persisted_requests = 0
+        self.cancelled_calls: Dict[str, int] = defaultdict(int)
+
+    @staticmethod
+    async def _wait_disconnect(request: Request) -> None:
+        # 请求体已被解析，之后的 receive 只会在客户端断开时返回
+        while True:
+            message = await request.receive()
+            if message["type"] == "http.disconnect":
+                return
+
+    async def run(self, request: Request, awaitable: Awaitable[T]) -> T:
+        """运行生成协程；cancel 策略下客户端断开时取消并抛出 ClientDisconnected"""
+        watch = _Watch()
+        token = _watch.set(watch)
+        try:
+            task = asyncio.ensure_future(awaitable)
+        finally:
+            _watch.reset(token)
+        watcher = asyncio.ensure_future(self._wait_disconnect(request))
+        try:
+            await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            watcher.cancel()
+
+        if task.done():
+            return task.result()
+
+        watch.disconnected = True
+        self.disconnected_requests += 1
+        if self.policy == "persist":
+            print(f"🔌 客户端已断开，继续生成并保存: {request.url.path}")
+            self.persisted_requests += 1
+            return await task
+
+        print(f"🔌 客户端已断开，取消生成: {request.url.path}")
+        self.cancelled_requests += 1
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        raise ClientDisconnected(request.url.path)
+
+    def record_cancelled_call(self, model: str) -> None:
+        """上游请求被取消时调用；仅统计因客户端断开而取消的请求"""
+        watch = _watch.get()
+        if watch is not None and watch.disconnected:
+            self.cancelled_calls[model] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "disconnected_requests": self.disconnected_requests,
+            "cancelled_requests": self.cancelled_requests,
+            "persisted_requests": self.persisted_requests,
+            "cancelled_calls": dict(self.cancelled_calls),
+            "cancelled_calls_total": sum(self.cancelled_calls.values()),
+        }
+
+
+# 创建服务实例
+disconnect_monitor = DisconnectMonitor()
@@ -0,0 +1,62 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional
+from fastapi import Request, Response
+
+# 私有资源：浏览器可缓存但每次需用 ETag 重新验证
+PRIVATE_REVALIDATE = "private, no-cache"
+# 公共只读资源：nginx 与浏览器可短期缓存，过期后用 ETag 重新验证
+PUBLIC_SHORT = "public, max-age=300, stale-while-revalidate=60"
+
+
+def make_etag(*parts) -> str:
+    """根据若干部分生成弱 ETag"""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def content_etag(body: bytes) -> str:
+    """根据响应内容生成强 ETag"""
+    return f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+
+
+def _to_utc(value: datetime) -> datetime:
+    # 数据库中无时区的时间按 UTC 处理
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def cache_headers(etag: str, cache_control: str, last_modified: Optional[datetime] = None) -> Dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(_to_utc(last_modified).replace(microsecond=0), usegmt=True)
+    return headers
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """按 If-None-Match / If-Modified-Since 判断客户端缓存是否仍然有效"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match 存在时忽略 If-Modified-Since；比较时使用弱比较
+        if if_none_match.strip() == "*":
+            return True
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag.removeprefix("W/") in candidates
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since is None:
+            return False
+        return _to_utc(last_modified).replace(microsecond=0) <= _to_utc(since)
+    return False
+
+
+def not_modified(headers: Dict[str, str]) -> Response:
+    """返回不带响应体的 304"""
+    return Response(status_code=304, headers=headers)
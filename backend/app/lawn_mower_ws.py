@@ -0,0 +1,175 @@
+import asyncio
+import json
+import os
+from typing import Dict, Any, List
+from fastapi import WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from app import deadline, tracing
+from app.schemas import LawnMowerContentRequest
+from app.services.ai_service import AIModel
+from app.services.model_selector import model_selector
+from app.services.lawn_mower_service import LawnMowerService
+
+# 单个连接同时进行的生成数上限
+MAX_ACTIVE = int(os.getenv("LAWN_MOWER_WS_MAX_ACTIVE", "3"))
+# 服务端心跳间隔（秒），需小于 nginx 的 proxy_read_timeout
+PING_INTERVAL = float(os.getenv("LAWN_MOWER_WS_PING_INTERVAL", "25"))
+
+
+class LawnMowerSession:
+    """割草机内容生成的 WebSocket 会话
+
+    一个连接可提交多次生成，每个模型完成即推送结果，也可随时取消进行中的生成。
+
+    客户端消息：
+    - {"type": "generate", "request_id": "...", "payload": {割草机生成请求字段}}
+    - {"type": "cancel", "request_id": "..."}
+    - {"type": "ping"}
+    服务端消息：
+    - accepted（已受理，含解析后的模型列表）、progress（模型开始/完成计数）
+    - result（单个模型的结果）、model_error（单个模型失败）
+    - done（全部模型结束）、cancelled、error、ping/pong
+    """
+
+    def __init__(self, websocket: WebSocket, service: LawnMowerService):
+        self.websocket = websocket
+        self.service = service
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, message: Dict[str, Any]) -> None:
+        async with self._send_lock:
+            await self.websocket.send_json(message)
+
+    async def run(self) -> None:
+        await self.websocket.accept()
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            while True:
+                text = await self.websocket.receive_text()
+                try:
+                    message = json.loads(text)
+                except json.JSONDecodeError:
+                    await self.send({"type": "error", "error": "消息不是有效的 JSON"})
+                    continue
+                await self._dispatch(message)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            heartbeat.cancel()
+            # 连接关闭后不再需要的生成全部取消
+            for task in self.tasks.values():
+                task.cancel()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(PING_INTERVAL)
+            await self.send({"type": "ping"})
+
+    async def _dispatch(self, message: Any) -> None:
+        if not isinstance(message, dict):
+            await self.send({"type": "error", "error": "消息必须是 JSON 对象"})
+            return
+        message_type = message.get("type")
+        request_id = str(message.get("request_id") or "")
+
+        if message_type == "ping":
+            await self.send({"type": "pong"})
+        elif message_type == "cancel":
+            task = self.tasks.get(request_id)
+            if task is None:
+                await self.send({"type": "error", "request_id": request_id, "error": "没有进行中的该请求"})
+            else:
+                # 等待取消完成（未完成的模型请求随之取消）后再通知客户端
+                task.cancel()
+                await asyncio.wait({task})
+                await self.send({"type": "cancelled", "request_id": request_id})
+        elif message_type == "generate":
+            await self._start_generation(request_id, message.get("payload"))
+        else:
+            await self.send({"type": "error", "request_id": request_id, "error": f"未知的消息类型: {message_type}"})
+
+    async def _start_generation(self, request_id: str, payload: Any) -> None:
+        if not request_id:
+            await self.send({"type": "error", "error": "generate 消息需要 request_id"})
+            return
+        if request_id in self.tasks:
+            await self.send({"type": "error", "request_id": request_id, "error": "该 request_id 正在生成中"})
+            return
+        if len(self.tasks) >= MAX_ACTIVE:
+            await self.send({"type": "error", "request_id": request_id, "error": f"同时进行的生成不能超过 {MAX_ACTIVE} 个"})
+            return
+        try:
+            request = LawnMowerContentRequest.parse_obj(payload or {})
+        except ValidationError as e:
+            await self.send({"type": "error", "request_id": request_id, "error": "请求参数无效", "detail": e.errors()})
+            return
+        if request.variants != 1:
+            # 逐个推送模型结果，与 HTTP 的 race 模式一样每个模型只返回一个结果
+            await self.send({"type": "error", "request_id": request_id, "error": "WebSocket 生成每个模型只返回一个结果，不支持 variants"})
+            return
+
+        models = self._resolve_models(request.ai_model)
+        await self.send({"type": "accepted", "request_id": request_id, "models": models})
+        task = asyncio.create_task(self._generate(request_id, request, models))
+        self.tasks[request_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(request_id, None))
+
+    @staticmethod
+    def _resolve_models(requested: List[str]) -> List[str]:
+        resolved = []
+        for model in requested:
+            if model_selector.is_auto(model):
+                model = model_selector.choose([m.value for m in AIModel], preference=model, exclude=resolved)
+            resolved.append(model)
+        return resolved
+
+    async def _generate(self, request_id: str, request: LawnMowerContentRequest, models: List[str]) -> None:
+        # 每次生成有独立的截止时间和 trace，与 HTTP 接口一致
+        deadline.start(deadline.DEFAULT_BUDGET)
+        span = tracing.tracer.start_request_span(
+            "WS /api/lawn-mower/ws generate", None, None,
+            {"ws.request_id": request_id, "lawn_mower.models": models}
+        )
+        tracing.activate(span)
+        results = self.service.iter_lawn_mower_content(
+            models, **request.dict(exclude={"ai_model", "mode", "keep_others"})
+        )
+        models_used = []
+        failed = {}
+        try:
+            await self.send({"type": "progress", "request_id": request_id, "status": "started", "completed": 0, "total": len(models)})
+            async for item in results:
+                if item["success"]:
+                    models_used.append(item["model"])
+                    await self.send({"type": "result", "request_id": request_id, "model": item["model"], "data": item["data"]})
+                else:
+                    failed[item["model"]] = item["error"]
+                    await self.send({"type": "model_error", "request_id": request_id, "model": item["model"], "error": item["error"]})
+                await self.send({
+                    "type": "progress",
+                    "request_id": request_id,
+                    "status": "running",
+                    "completed": len(models_used) + len(failed),
+                    "total": len(models)
+                })
+            await self.send({
+                "type": "done",
+                "request_id": request_id,
+                "success": bool(models_used),
+                "models_used": models_used,
+                "failed_models": failed
+            })
+        except asyncio.CancelledError:
+            span.set_attribute("cancelled", True)
+            raise
+        except Exception as e:
+            span.set_error(e)
+            print(f"❌ WebSocket 生成失败 {request_id}: {e}")
+            try:
+                await self.send({"type": "error", "request_id": request_id, "error": f"生成失败: {str(e)}"})
+            except Exception:
+                pass
+        finally:
+            await results.aclose()
+            span.end()
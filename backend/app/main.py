@@ -1,21 +1,47 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request, UploadFile, File, WebSocket, Header
 from sqlalchemy.orm import Session
 from app.db import Base, engine, SessionLocal
-from app.models import User, XiaohongshuNote, ClientAccount
-from app.schemas import UserCreate, UserOut, NoteGenerateRequest, NoteCreate, NoteUpdate, NoteOut, ClientAccountCreate, LawnMowerContentRequest, LawnMowerContentResponse
-from app import schemas, models
-from app.services.ai_service import ai_service
+from app.models import User, XiaohongshuNote
+from app.schemas import UserCreate, UserOut, NoteGenerateRequest, NoteCreate, NoteUpdate, NoteOut, ClientAccountCreate, ClientAccountUpdate, LawnMowerContentRequest, LawnMowerContentResponse
+from app import schemas, models, crud, deadline, timing, tracing
+from app.profiler import profiler
+from app.query_monitor import query_monitor
+from app.deadline import DeadlineExceeded
+from app.disconnect import disconnect_monitor, ClientDisconnected
+from app.lawn_mower_ws import LawnMowerSession
+from app.serializers import (
+    FastJSONResponse, NOTE_OUT_FIELDS, NOTE_OUT_COLUMNS, CLIENT_ACCOUNT_FIELDS, CLIENT_ACCOUNT_COLUMNS,
+    row_to_dict, rows_to_dicts, obj_to_dict
+)
+from app.http_cache import (
+    make_etag, content_etag, cache_headers, is_not_modified, not_modified, PRIVATE_REVALIDATE, PUBLIC_SHORT
+)
+from app.services.ai_service import ai_service, AIModel
+from app.services.model_selector import model_selector
+from app.services.llm_gateway import llm_gateway
 from app.services.lawn_mower_service import LawnMowerService
+from app.services.race_store import race_store
+from app.services.fingerprint_service import fingerprint_service, MAX_DETECTABLE_DISTANCE
+from app.services.analytics_service import analytics_service, GROUP_DIMENSIONS
+from app.services.partition_service import partition_service
+from app.services.export_service import export_service, EXPORT_FORMATS
+from app.services.import_service import import_service, IMPORT_FORMATS
+from app.services.account_cache import account_cache
+from app.services.similarity_cache import similarity_cache
+from app.services.note_writer import note_writer
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from typing import List, Optional
 import os
 from dotenv import load_dotenv
 import asyncio
 from contextlib import asynccontextmanager
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from sqlalchemy.exc import SQLAlchemyError
 import logging
 import json
+import hmac
+import time
+from datetime import date
 
 # 加载环境变量
 load_dotenv()
@@ -30,6 +56,9 @@ logger = logging.getLogger(__name__)
 # 初始化割草机服务
 lawn_mower_service = LawnMowerService()
 
+# 每个模型单次请求最多生成的候选数
+MAX_VARIANTS = 5
+
 def run_database_migration():
     """运行数据库迁移"""
     try:
@@ -60,7 +89,16 @@ def run_database_migration():
                         'input_platform': 'VARCHAR(50)',
                         'input_selected_account_id': 'INTEGER',
                         'model': 'VARCHAR(50)',
-                        'updated_at': 'TIMESTAMP'
+                        'updated_at': 'TIMESTAMP',
+                        'input_fingerprint': 'VARCHAR(64)',
+                        'content_fingerprint': 'VARCHAR(64)',
+                        'content_simhash': 'BIGINT',
+                        'simhash_band_0': 'INTEGER',
+                        'simhash_band_1': 'INTEGER',
+                        'simhash_band_2': 'INTEGER',
+                        'simhash_band_3': 'INTEGER',
+                        'latency_ms': 'INTEGER',
+                        'total_tokens': 'INTEGER'
                     }
                     
                     # 添加缺失的字段
@@ -72,6 +110,20 @@ def run_database_migration():
                             except Exception as e:
                                 logger.warning(f"⚠️  添加字段 {column_name} 失败: {e}")
                     
+                    # 创建指纹相关索引
+                    index_statements = [
+                        "CREATE INDEX IF NOT EXISTS ix_xiaohongshu_notes_input_fingerprint ON xiaohongshu_notes (input_fingerprint)",
+                        "CREATE INDEX IF NOT EXISTS ix_notes_account_content_fp ON xiaohongshu_notes (input_selected_account_id, content_fingerprint)",
+                    ] + [
+                        f"CREATE INDEX IF NOT EXISTS ix_notes_account_band_{i} ON xiaohongshu_notes (input_selected_account_id, simhash_band_{i})"
+                        for i in range(4)
+                    ]
+                    for statement in index_statements:
+                        try:
+                            conn.execute(text(statement))
+                        except Exception as e:
+                            logger.warning(f"⚠️  创建索引失败: {e}")
+                    
                     # engine.begin() 会自动处理commit/rollback
                     logger.info("✅ 数据库结构更新完成")
                     
@@ -79,9 +131,35 @@ def run_database_migration():
                     logger.error(f"❌ 数据库迁移失败: {e}")
                     # engine.begin() 会自动rollback
         
+        if 'client_accounts' in inspector.get_table_names():
+            with engine.begin() as conn:
+                try:
+                    # topic_keywords 需为 JSONB 才能建立 GIN 索引
+                    column_types = {col['name']: str(col['type']).upper() for col in inspector.get_columns('client_accounts')}
+                    if column_types.get('topic_keywords') == 'JSON':
+                        conn.execute(text("ALTER TABLE client_accounts ALTER COLUMN topic_keywords TYPE JSONB USING topic_keywords::jsonb"))
+                        logger.info("✅ topic_keywords 已转换为 JSONB")
+                    # 早期写入的 None 被存成 JSON 'null'，统一改为 SQL NULL
+                    result = conn.execute(text("UPDATE client_accounts SET topic_keywords = NULL WHERE jsonb_typeof(topic_keywords) = 'null'"))
+                    if result.rowcount:
+                        logger.info(f"✅ {result.rowcount} 个账号的 topic_keywords 已从 JSON null 改为 NULL")
+                    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_client_accounts_topic_keywords ON client_accounts USING GIN (topic_keywords)"))
+                except Exception as e:
+                    logger.error(f"❌ client_accounts 迁移失败: {e}")
+        
     except Exception as e:
         logger.error(f"❌ 数据库迁移异常: {e}")
 
+async def run_partition_maintenance():
+    """定期创建未来的笔记分区并归档过期分区"""
+    interval = int(os.getenv("NOTE_PARTITION_MAINTENANCE_INTERVAL", "86400"))
+    while True:
+        try:
+            await asyncio.to_thread(partition_service.run_maintenance)
+        except Exception as e:
+            logger.error(f"❌ 笔记分区维护失败: {e}")
+        await asyncio.sleep(interval)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 启动时执行
@@ -102,10 +180,20 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"❌ AI服务初始化失败: {e}")
     
+    # 启动笔记分区维护任务
+    maintenance_task = asyncio.create_task(run_partition_maintenance())
+    # 启动笔记异步写入队列（NOTE_WRITE_BEHIND=true 时）
+    await note_writer.start()
+    
     yield
     
     # 关闭时执行
     logger.info("👋 应用关闭中...")
+    maintenance_task.cancel()
+    # 写完队列中尚未入库的笔记
+    await note_writer.stop()
+    await llm_gateway.close()
+    tracing.tracer.flush()
 
 app = FastAPI(
     title="小红书笔记生成器",
@@ -123,19 +211,113 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def request_query_stats(request: Request, call_next):
+    """统计请求内执行的数据库语句，写入 Server-Timing 并按路由汇总"""
+    token = query_monitor.start_request()
+    route = f"{request.method} {request.url.path}"
+    try:
+        response = await call_next(request)
+        route = f"{request.method} {route_template(request) or request.url.path}"
+        return response
+    finally:
+        stats = query_monitor.finish_request(token, route)
+        if stats.count:
+            timing.record("sql", stats.total_ms, f"{stats.count} queries")
+            span = tracing.current_span()
+            if span is not None:
+                span.set_attribute("db.query_count", stats.count)
+
+@app.middleware("http")
+async def request_timing(request: Request, call_next):
+    """记录各阶段耗时并通过 Server-Timing 响应头返回；按管理接口设置的比例对请求采样分析"""
+    token = timing.start()
+    profile_id = profiler.begin(f"{request.method} {request.url.path}") if profiler.should_sample() else None
+    start_time = time.perf_counter()
+    try:
+        response = await call_next(request)
+        total_ms = (time.perf_counter() - start_time) * 1000
+        header = timing.server_timing_header(total_ms)
+        if header:
+            response.headers["Server-Timing"] = header
+            response.headers["Timing-Allow-Origin"] = "*"
+        return response
+    finally:
+        if profile_id is not None:
+            profiler.end(profile_id, (time.perf_counter() - start_time) * 1000)
+        timing.reset(token)
+
+@app.middleware("http")
+async def request_deadline(request: Request, call_next):
+    """在入口设置请求截止时间，模型调用、重试和写库都在该时间内完成"""
+    token = deadline.start(deadline.budget_from_header(request.headers.get(deadline.DEADLINE_HEADER)))
+    try:
+        return await call_next(request)
+    finally:
+        deadline.reset(token)
+
+# 端点函数 -> 路由模板，用于 span 名称（首次请求时建立）
+_route_templates = {}
+
+def route_template(request: Request) -> Optional[str]:
+    """返回请求命中的路由模板，如 /notes/{note_id}"""
+    if not _route_templates:
+        _route_templates.update({route.endpoint: route.path for route in app.routes if hasattr(route, "endpoint")})
+    return _route_templates.get(request.scope.get("endpoint"))
+
+@app.middleware("http")
+async def request_tracing(request: Request, call_next):
+    """为每个请求创建根 span；响应头返回 X-Request-ID，模型调用时同样传给 One-API"""
+    span = tracing.tracer.start_request_span(
+        f"{request.method} {request.url.path}",
+        traceparent=request.headers.get("traceparent"),
+        request_id=request.headers.get(tracing.REQUEST_ID_HEADER),
+        attributes={"http.method": request.method, "http.target": request.url.path}
+    )
+    token = tracing.activate(span)
+    try:
+        response = await call_next(request)
+        route = route_template(request)
+        if route:
+            span.name = f"{request.method} {route}"
+            span.set_attribute("http.route", route)
+        span.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            span.set_error(f"HTTP {response.status_code}")
+        response.headers["X-Request-ID"] = span.request_id
+        return response
+    except Exception as e:
+        span.set_error(e)
+        raise
+    finally:
+        tracing.deactivate(token)
+        span.end()
+
 # 获取当前文件的目录路径
 current_dir = os.path.dirname(os.path.abspath(__file__))
 
-@app.get("/api/lawn-mower/products")
-async def get_lawn_mower_products():
-    try:
-        # 构建product_data.json的完整路径
-        json_path = os.path.join(current_dir, "data", "product_data.json")
-        
-        # 读取JSON文件
+# 产品目录缓存（文件修改后自动重新加载）
+_products_cache = {"mtime": None, "body": None, "etag": None}
+
+def load_products_payload():
+    """读取产品目录并缓存序列化结果与 ETag"""
+    json_path = os.path.join(current_dir, "data", "product_data.json")
+    mtime = os.path.getmtime(json_path)
+    if _products_cache["mtime"] != mtime:
         with open(json_path, "r", encoding="utf-8") as f:
             data = json.load(f)
-        return data
+        body = FastJSONResponse(data).body
+        _products_cache.update(mtime=mtime, body=body, etag=content_etag(body))
+    return _products_cache["body"], _products_cache["etag"]
+
+@app.get("/api/lawn-mower/products")
+async def get_lawn_mower_products(request: Request):
+    try:
+        body, etag = load_products_payload()
+        headers = cache_headers(etag, PUBLIC_SHORT)
+        if is_not_modified(request, etag):
+            return not_modified(headers)
+        return Response(content=body, media_type="application/json", headers=headers)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Product data file not found")
     except json.JSONDecodeError:
@@ -168,13 +350,59 @@ def read_users(db: Session = Depends(get_db)):
     return db.query(User).all()
 
 # AI模型相关接口
+# 模型列表在进程内不变，序列化结果只计算一次
+_models_payload = {}
+
 @app.get("/models/")
-async def get_available_models():
+async def get_available_models(request: Request):
     """获取可用的AI模型列表"""
-    return {
-        "success": True,
-        "data": ai_service.get_available_models()
-    }
+    if not _models_payload:
+        body = FastJSONResponse({
+            "success": True,
+            "data": ai_service.get_available_models()
+        }).body
+        _models_payload.update(body=body, etag=content_etag(body))
+    headers = cache_headers(_models_payload["etag"], PUBLIC_SHORT)
+    if is_not_modified(request, _models_payload["etag"]):
+        return not_modified(headers)
+    return Response(content=_models_payload["body"], media_type="application/json", headers=headers)
+
+@app.get("/models/stats")
+def get_model_stats(preference: str = "auto"):
+    """各模型的实测延迟、错误率、并发数及自动选择得分"""
+    if not model_selector.is_auto(preference):
+        raise HTTPException(status_code=400, detail="preference 只能是 auto、auto:fast 或 auto:quality")
+    return {"success": True, "data": model_selector.rank([m.value for m in AIModel], preference)}
+
+@app.get("/models/disconnects")
+def get_disconnect_stats():
+    """客户端断开的生成请求数及因此取消的模型调用数（当前进程）"""
+    return {"success": True, "data": disconnect_monitor.stats()}
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """管理接口校验 X-Admin-Token；未配置 ADMIN_TOKEN 时管理接口不可用"""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="未配置 ADMIN_TOKEN，管理接口已禁用")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, admin_token):
+        raise HTTPException(status_code=401, detail="管理员令牌无效")
+
+@app.get("/admin/profiling", dependencies=[Depends(require_admin)])
+def get_profiling_settings():
+    """请求采样分析的当前设置"""
+    return {"success": True, "data": {**profiler.settings(), "directory": profiler.directory}}
+
+@app.put("/admin/profiling", dependencies=[Depends(require_admin)])
+def update_profiling_settings(sample_rate: float):
+    """设置请求采样比例（0 关闭，1 采样全部请求），所有 worker 生效"""
+    if not 0 <= sample_rate <= 1:
+        raise HTTPException(status_code=400, detail="sample_rate 取值范围为 0-1")
+    return {"success": True, "data": profiler.configure(sample_rate)}
+
+@app.get("/admin/query-stats", dependencies=[Depends(require_admin)])
+def get_query_stats():
+    """本 worker 各路由的数据库语句统计（每请求语句数、慢查询数、疑似 N+1 次数）"""
+    return {"success": True, "data": query_monitor.status()}
 
 @app.get("/models/test")
 async def test_ai_connection():
@@ -192,153 +420,335 @@ async def test_ai_connection():
         }
 
 # 小红书笔记相关接口
+def hydrate_account(request: NoteGenerateRequest, db: Session):
+    """用服务端缓存的账号资料补全请求，返回 (请求, 预渲染的账号信息段落)"""
+    if request.selected_account_id is None:
+        return request, None
+    account = account_cache.get(db, request.selected_account_id)
+    if account is None:
+        raise HTTPException(status_code=404, detail="Account not found")
+    request = request.copy(update={
+        "account_name": account["account_name"],
+        "account_type": account["account_type"],
+        "topic_keywords": account["topic_keywords"],
+        "platform": account["platform"]
+    })
+    return request, account["prompt_block"]
+
+@app.post("/notes/generate/dry-run")
+def dry_run_generate_note(request: NoteGenerateRequest, budget: Optional[int] = None, db: Session = Depends(get_db)):
+    """只渲染笔记提示词，不调用模型，用于检查提示词内容和token预算"""
+    request, account_block = hydrate_account(request, db)
+    rendered = ai_service.build_note_prompt(
+        basic_content=request.basic_content,
+        note_purpose=request.note_purpose,
+        recent_trends=request.recent_trends,
+        writing_style=request.writing_style,
+        target_audience=request.target_audience,
+        content_type=request.content_type,
+        reference_links=request.reference_links,
+        account_name=request.account_name,
+        account_type=request.account_type,
+        topic_keywords=request.topic_keywords,
+        platform=request.platform,
+        account_block=account_block,
+        budget=budget
+    )
+    return {"success": True, "data": rendered}
+
+def parse_models(ai_model: Optional[str]) -> List[str]:
+    """解析逗号分隔的模型列表，未选择时默认使用 gpt-4o"""
+    models = [model.strip() for model in (ai_model or "").split(',') if model.strip()]
+    return models or ['gpt-4o']
+
+def generation_inputs(request: NoteGenerateRequest) -> dict:
+    """生成请求对应的笔记输入字段"""
+    return {
+        "input_basic_content": request.basic_content,
+        "input_note_purpose": request.note_purpose,
+        "input_recent_trends": request.recent_trends,
+        "input_writing_style": request.writing_style,
+        "input_target_audience": request.target_audience,
+        "input_content_type": request.content_type,
+        "input_reference_links": request.reference_links,
+        "input_account_name": request.account_name,
+        "input_account_type": request.account_type,
+        "input_topic_keywords": request.topic_keywords,
+        "input_platform": request.platform,
+        "input_selected_account_id": request.selected_account_id
+    }
+
+def find_similar_prior_notes(db: Session, inputs: dict, models: List[str], threshold: Optional[float]) -> List[dict]:
+    """在相似度索引中为每个模型查找输入最相近的历史笔记"""
+    matches = {}
+    for model in models:
+        for match in similarity_cache.find(db, {**inputs, "model": model}, threshold=threshold):
+            matches[match["note_id"]] = match["similarity"]
+    if not matches:
+        return []
+
+    rows = db.query(*NOTE_OUT_COLUMNS).filter(XiaohongshuNote.id.in_(list(matches))).all()
+    found = {row.id: row for row in rows}
+    results = []
+    for note_id, similarity in matches.items():
+        row = found.get(note_id)
+        if row is None:
+            # 异步写入时笔记可能尚未入库，保留索引以便入库后命中；否则已被其他 worker 删除
+            if not note_writer.enabled:
+                similarity_cache.discard(note_id)
+            continue
+        results.append({
+            "id": row.id,
+            "note_title": row.note_title,
+            "note_content": row.note_content,
+            "comment_guide": row.comment_guide,
+            "comment_questions": row.comment_questions,
+            "created_at": row.created_at,
+            "model": row.model,
+            "similar_notes": [],
+            "reused": True,
+            "similarity": similarity
+        })
+    return results
+
+@app.post("/notes/generate/draft")
+def draft_generate_note(request: NoteGenerateRequest, db: Session = Depends(get_db)):
+    """返回输入最相近的历史笔记作为即时草稿
+
+    前端可与 /notes/generate 并行调用，在新内容生成期间先展示草稿；不调用模型也不写库。
+    """
+    request, _ = hydrate_account(request, db)
+    threshold = request.similarity_threshold
+    if threshold is None:
+        threshold = similarity_cache.draft_threshold
+    drafts = find_similar_prior_notes(db, generation_inputs(request), parse_models(request.ai_model), threshold)
+    return FastJSONResponse({"success": True, "data": drafts})
+
 @app.post("/notes/generate", response_model=dict)
-async def generate_note(request: NoteGenerateRequest, db: Session = Depends(get_db)):
+async def generate_note(request: NoteGenerateRequest, http_request: Request, db: Session = Depends(get_db)):
     """生成小红书笔记"""
     try:
         # 解析选择的模型，如果没有选择则默认使用 gpt-4o
-        models = request.ai_model.split(',') if request.ai_model else ['gpt-4o']
-        # 过滤空字符串
-        models = [model.strip() for model in models if model.strip()]
-        if not models:
-            models = ['gpt-4o']  # 如果过滤后为空，使用默认模型
+        models = parse_models(request.ai_model)
         if len(models) > 3:
             raise HTTPException(status_code=400, detail="最多只能选择3个AI模型")
+        if not 1 <= request.variants <= MAX_VARIANTS:
+            raise HTTPException(status_code=400, detail=f"variants 取值范围为 1-{MAX_VARIANTS}")
+        
+        # 选择了存储账号时，以服务端缓存的账号资料为准
+        request, account_block = hydrate_account(request, db)
+        inputs = generation_inputs(request)
 
         # 并行调用多个模型生成内容
-        results = []
-        for model in models:
-            try:
-                # 调用AI服务生成内容
-                result = await ai_service.generate_note(
-                    basic_content=request.basic_content,
-                    model=model,
-                    note_purpose=request.note_purpose,
-                    recent_trends=request.recent_trends,
-                    writing_style=request.writing_style,
-                    target_audience=request.target_audience,
-                    content_type=request.content_type,
-                    reference_links=request.reference_links,
-                    account_name=request.account_name,
-                    account_type=request.account_type,
-                    topic_keywords=request.topic_keywords,
-                    platform=request.platform
-                )
-                
-                # 保存到数据库
-                note_data = NoteCreate(
-                    input_basic_content=request.basic_content,
-                    input_note_purpose=request.note_purpose,
-                    input_recent_trends=request.recent_trends,
-                    input_writing_style=request.writing_style,
-                    input_target_audience=request.target_audience,
-                    input_content_type=request.content_type,
-                    input_reference_links=request.reference_links,
-                    input_account_name=request.account_name,
-                    input_account_type=request.account_type,
-                    input_topic_keywords=request.topic_keywords,
-                    input_platform=request.platform,
-                    input_selected_account_id=request.selected_account_id,
-                    note_title=result.get("note_title", ""),
-                    note_content=result.get("note_content", ""),
-                    comment_guide=result.get("comment_guide", ""),
-                    comment_questions=result.get("comment_questions", "")
-                )
-                
-                db_note = XiaohongshuNote(**note_data.dict(), model=model)
-                db.add(db_note)
-                db.commit()
-                db.refresh(db_note)
+        pending_notes = []
+        reused_results = []
+        resolved_models = []
+        timed_out_models = []
+
+        async def call_models():
+            for model in models:
+                # auto 按实测延迟、错误率与负载选择模型，已选的模型不重复
+                model = ai_service.resolve_model(model, exclude=resolved_models)
+                resolved_models.append(model)
+            
+                # 调用方开启复用时，命中相似输入的历史笔记直接返回
+                if request.reuse_similar:
+                    prior = find_similar_prior_notes(db, inputs, [model], request.similarity_threshold)
+                    if prior:
+                        reused_results.extend(prior)
+                        continue
+                if deadline.expired():
+                    # 预算已用完，剩余模型不再调用
+                    timed_out_models.append(model)
+                    continue
+                try:
+                    # 调用AI服务生成内容，为写库预留时间
+                    with deadline.reserve(deadline.DB_RESERVE):
+                        results = await ai_service.generate_note_variants(
+                            request.variants,
+                            basic_content=request.basic_content,
+                            model=model,
+                            note_purpose=request.note_purpose,
+                            recent_trends=request.recent_trends,
+                            writing_style=request.writing_style,
+                            target_audience=request.target_audience,
+                            content_type=request.content_type,
+                            reference_links=request.reference_links,
+                            account_name=request.account_name,
+                            account_type=request.account_type,
+                            topic_keywords=request.topic_keywords,
+                            platform=request.platform,
+                            account_block=account_block
+                        )
                 
-                # 添加到结果列表
-                results.append({
-                    "id": db_note.id,
-                    "note_title": db_note.note_title,
-                    "note_content": db_note.note_content,
-                    "comment_guide": db_note.comment_guide,
-                    "comment_questions": db_note.comment_questions,
-                    "created_at": db_note.created_at,
-                    "model": model
-                })
+                    for result in results:
+                        note_data = NoteCreate(
+                            **inputs,
+                            note_title=result.get("note_title", ""),
+                            note_content=result.get("note_content", ""),
+                            comment_guide=result.get("comment_guide", ""),
+                            comment_questions=result.get("comment_questions", "")
+                        )
+                        note_dict = {
+                            **note_data.dict(),
+                            "model": model,
+                            "latency_ms": result.get("latency_ms"),
+                            "total_tokens": result.get("total_tokens")
+                        }
+                        note_dict.update(fingerprint_service.fingerprint_note(note_dict))
+                        pending_notes.append(note_dict)
                 
-            except Exception as e:
-                print(f"模型 {model} 生成失败: {str(e)}")
-                # 继续处理其他模型，不中断整个过程
-                continue
+                except DeadlineExceeded as e:
+                    print(f"模型 {model} 超时: {str(e)}")
+                    timed_out_models.append(model)
+                    continue
+                except Exception as e:
+                    print(f"模型 {model} 生成失败: {str(e)}")
+                    # 继续处理其他模型，不中断整个过程
+                    continue
+
+        # 客户端断开时按策略取消模型调用，取消后不再写库
+        await disconnect_monitor.run(http_request, call_models())
+        
+        # 写入前在账号历史中检查近似重复
+        similar_notes = [
+            fingerprint_service.find_similar_notes(db, note, account_id=request.selected_account_id)
+            for note in pending_notes
+        ]
+        
+        if note_writer.enabled:
+            # 异步写入：分配 id 后立即返回，后台批量入库
+            saved_notes = await note_writer.submit(pending_notes)
+        else:
+            # 所有模型结果在一个事务内批量写入数据库
+            saved_notes = crud.bulk_create_notes(db, pending_notes)
+        for note in saved_notes:
+            similarity_cache.add(note["id"], note)
+        results = reused_results + [
+            {
+                "id": note["id"],
+                "note_title": note["note_title"],
+                "note_content": note["note_content"],
+                "comment_guide": note["comment_guide"],
+                "comment_questions": note["comment_questions"],
+                "created_at": note["created_at"],
+                "model": note["model"],
+                "similar_notes": similar,
+                "reused": False
+            }
+            for note, similar in zip(saved_notes, similar_notes)
+        ]
         
         if not results:
+            if timed_out_models:
+                raise HTTPException(status_code=504, detail="生成超时，请减少模型数量后重试")
             raise HTTPException(status_code=500, detail="所有模型生成均失败")
             
-        return {
+        response = {
             "success": True,
             "message": f"成功生成 {len(results)} 个模型的内容",
             "data": results
         }
+        if timed_out_models:
+            # 部分模型超时，返回已生成的结果
+            response["timed_out_models"] = timed_out_models
+        return FastJSONResponse(response)
             
     except HTTPException as he:
         raise he
+    except ClientDisconnected:
+        raise HTTPException(status_code=499, detail="客户端已断开，生成已取消")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"生成失败: {str(e)}")
 
+def note_filters(
+    model: Optional[str] = None,
+    platform: Optional[str] = None,
+    account_id: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None
+) -> dict:
+    """笔记列表与导出共用的过滤参数"""
+    return {
+        "model": model,
+        "platform": platform,
+        "account_id": account_id,
+        "start_date": start_date,
+        "end_date": end_date
+    }
+
 @app.get("/notes/", response_model=List[NoteOut])
-def get_notes(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def get_notes(skip: int = 0, limit: int = 100, filters: dict = Depends(note_filters), db: Session = Depends(get_db)):
     """获取所有笔记"""
-    notes = db.query(XiaohongshuNote).offset(skip).limit(limit).all()
-    # 手动转换数据以避免序列化问题
-    result = []
-    for note in notes:
-        result.append({
-            "id": note.id,
-            "input_basic_content": note.input_basic_content,
-            "input_note_purpose": note.input_note_purpose,
-            "input_recent_trends": note.input_recent_trends,
-            "input_writing_style": note.input_writing_style,
-            "input_target_audience": note.input_target_audience,
-            "input_content_type": note.input_content_type,
-            "input_reference_links": note.input_reference_links,
-            "input_account_name": note.input_account_name,
-            "input_account_type": note.input_account_type,
-            "input_topic_keywords": note.input_topic_keywords,
-            "input_platform": note.input_platform,
-            "input_selected_account_id": note.input_selected_account_id,
-            "note_title": note.note_title,
-            "note_content": note.note_content,
-            "comment_guide": note.comment_guide,
-            "comment_questions": note.comment_questions,
-            "model": note.model,
-            "created_at": note.created_at,
-            "updated_at": note.updated_at
-        })
-    return result
+    rows = crud.filter_notes(db.query(*NOTE_OUT_COLUMNS), **filters).offset(skip).limit(limit).all()
+    return FastJSONResponse(rows_to_dicts(NOTE_OUT_FIELDS, rows))
+
+@app.post("/notes/import")
+def import_notes(file: UploadFile = File(...), format: Optional[str] = None, db: Session = Depends(get_db)):
+    """批量导入历史笔记（CSV/NDJSON）"""
+    import_format = import_service.detect_format(file.filename, format)
+    if not import_format:
+        raise HTTPException(status_code=400, detail=f"无法识别导入格式，可选: {', '.join(IMPORT_FORMATS)}")
+    return {
+        "success": True,
+        "data": import_service.import_notes(db, file.file, import_format)
+    }
+
+@app.get("/notes/export")
+def export_notes(
+    request: Request,
+    format: str = "ndjson",
+    filters: dict = Depends(note_filters)
+):
+    """流式导出笔记（NDJSON/CSV），客户端支持时 gzip 压缩"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的导出格式: {format}，可选: {', '.join(EXPORT_FORMATS)}")
+    
+    compress = "gzip" in request.headers.get("accept-encoding", "").lower()
+    headers = {
+        "Content-Disposition": f'attachment; filename="notes.{format}"',
+        # 关闭 nginx 缓冲，边查边发
+        "X-Accel-Buffering": "no"
+    }
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export_service.stream_notes(filters, export_format=format, compress=compress),
+        media_type=EXPORT_FORMATS[format],
+        headers=headers
+    )
+
+@app.get("/notes/duplicates")
+def get_duplicate_notes(account_id: Optional[int] = None, max_distance: Optional[int] = None, min_size: int = 2, db: Session = Depends(get_db)):
+    """列出近似重复的笔记簇"""
+    if max_distance is not None and not 0 <= max_distance <= MAX_DETECTABLE_DISTANCE:
+        raise HTTPException(status_code=400, detail=f"max_distance 取值范围为 0-{MAX_DETECTABLE_DISTANCE}")
+    clusters = fingerprint_service.find_duplicate_clusters(
+        db, account_id=account_id, max_distance=max_distance, min_size=min_size
+    )
+    return {
+        "success": True,
+        "data": clusters
+    }
+
+@app.get("/notes/write-queue")
+def get_note_write_queue():
+    """笔记异步写入队列的状态（当前进程）"""
+    return {"success": True, "data": note_writer.status()}
 
 @app.get("/notes/{note_id}", response_model=NoteOut)
-def get_note(note_id: int, db: Session = Depends(get_db)):
+def get_note(note_id: int, request: Request, db: Session = Depends(get_db)):
     """获取单个笔记"""
-    note = db.query(XiaohongshuNote).filter(XiaohongshuNote.id == note_id).first()
-    if not note:
+    row = db.query(*NOTE_OUT_COLUMNS).filter(XiaohongshuNote.id == note_id).first()
+    if not row:
         raise HTTPException(status_code=404, detail="笔记不存在")
-    return {
-        "id": note.id,
-        "input_basic_content": note.input_basic_content,
-        "input_note_purpose": note.input_note_purpose,
-        "input_recent_trends": note.input_recent_trends,
-        "input_writing_style": note.input_writing_style,
-        "input_target_audience": note.input_target_audience,
-        "input_content_type": note.input_content_type,
-        "input_reference_links": note.input_reference_links,
-        "input_account_name": note.input_account_name,
-        "input_account_type": note.input_account_type,
-        "input_topic_keywords": note.input_topic_keywords,
-        "input_platform": note.input_platform,
-        "input_selected_account_id": note.input_selected_account_id,
-        "note_title": note.note_title,
-        "note_content": note.note_content,
-        "comment_guide": note.comment_guide,
-        "comment_questions": note.comment_questions,
-        "model": note.model,
-        "created_at": note.created_at,
-        "updated_at": note.updated_at
-    }
+    
+    last_modified = row.updated_at or row.created_at
+    etag = make_etag("note", *row)
+    headers = cache_headers(etag, PRIVATE_REVALIDATE, last_modified)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(headers)
+    return FastJSONResponse(row_to_dict(NOTE_OUT_FIELDS, row), headers=headers)
 
 @app.put("/notes/{note_id}", response_model=NoteOut)
 def update_note(note_id: int, note_update: NoteUpdate, db: Session = Depends(get_db)):
@@ -351,9 +761,18 @@ def update_note(note_id: int, note_update: NoteUpdate, db: Session = Depends(get
     for field, value in update_data.items():
         setattr(note, field, value)
     
+    # 输入或内容变化后，相似度索引中的旧记录不再可复用
+    similarity_cache.discard(note_id)
+    
+    # 内容变化后重新计算指纹
+    if "note_title" in update_data or "note_content" in update_data:
+        note_dict = {column.name: getattr(note, column.name) for column in XiaohongshuNote.__table__.columns}
+        for field, value in fingerprint_service.fingerprint_note(note_dict).items():
+            setattr(note, field, value)
+    
     db.commit()
     db.refresh(note)
-    return note
+    return FastJSONResponse(obj_to_dict(NOTE_OUT_FIELDS, note))
 
 @app.delete("/notes/{note_id}")
 def delete_note(note_id: int, db: Session = Depends(get_db)):
@@ -362,56 +781,95 @@ def delete_note(note_id: int, db: Session = Depends(get_db)):
     if not note:
         raise HTTPException(status_code=404, detail="笔记不存在")
     
+    # 汇总统计与删除在同一事务内扣除
+    analytics_service.remove_note(db, note)
     db.delete(note)
     db.commit()
+    similarity_cache.discard(note_id)
     return {"message": "笔记删除成功"}
 
-@app.post("/client-accounts/")
+@app.post("/client-accounts/", response_model=schemas.ClientAccount)
 def create_client_account(account: ClientAccountCreate, db: Session = Depends(get_db)):
     db_account = models.ClientAccount(**account.dict())
     db.add(db_account)
     db.commit()
     db.refresh(db_account)
+    account_cache.invalidate()
+    return FastJSONResponse(obj_to_dict(CLIENT_ACCOUNT_FIELDS, db_account))
+
+@app.post("/client-accounts/import")
+def import_client_accounts(file: UploadFile = File(...), format: Optional[str] = None, db: Session = Depends(get_db)):
+    """批量导入客户账号（CSV/NDJSON）"""
+    import_format = import_service.detect_format(file.filename, format)
+    if not import_format:
+        raise HTTPException(status_code=400, detail=f"无法识别导入格式，可选: {', '.join(IMPORT_FORMATS)}")
+    result = import_service.import_client_accounts(db, file.file, import_format)
+    account_cache.invalidate()
     return {
-        "id": db_account.id,
-        "account_name": db_account.account_name,
-        "account_type": db_account.account_type,
-        "topic_keywords": db_account.topic_keywords,
-        "platform": db_account.platform,
-        "created_at": db_account.created_at,
-        "updated_at": db_account.updated_at
+        "success": True,
+        "data": result
     }
 
-@app.get("/client-accounts/")
+@app.get("/client-accounts/", response_model=List[schemas.ClientAccount])
 def get_client_accounts(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    accounts = db.query(models.ClientAccount).offset(skip).limit(limit).all()
-    return [
-        {
-            "id": account.id,
-            "account_name": account.account_name,
-            "account_type": account.account_type,
-            "topic_keywords": account.topic_keywords,
-            "platform": account.platform,
-            "created_at": account.created_at,
-            "updated_at": account.updated_at
-        }
-        for account in accounts
-    ]
+    rows = db.query(*CLIENT_ACCOUNT_COLUMNS).offset(skip).limit(limit).all()
+    return FastJSONResponse(rows_to_dicts(CLIENT_ACCOUNT_FIELDS, rows))
+
+@app.get("/client-accounts/search", response_model=List[schemas.ClientAccount])
+def search_client_accounts(
+    keywords: str,
+    match: str = "any",
+    platform: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    """按话题关键词查询账号，match=any 包含任一关键词，match=all 包含全部关键词"""
+    if match not in ("any", "all"):
+        raise HTTPException(status_code=400, detail="match 只能为 any 或 all")
+    keyword_list = [keyword.strip() for keyword in keywords.split(',') if keyword.strip()]
+    if not keyword_list:
+        raise HTTPException(status_code=400, detail="keywords 不能为空")
+    accounts = crud.search_client_accounts(
+        db, keyword_list, match_all=(match == "all"), platform=platform, skip=skip, limit=limit
+    )
+    return FastJSONResponse([obj_to_dict(CLIENT_ACCOUNT_FIELDS, account) for account in accounts])
 
-@app.get("/client-accounts/{account_id}")
-def get_client_account(account_id: int, db: Session = Depends(get_db)):
+@app.get("/client-accounts/keywords")
+def get_client_account_keywords(platform: Optional[str] = None, limit: int = 100, db: Session = Depends(get_db)):
+    """统计话题关键词在账号中的出现频次"""
+    return {
+        "success": True,
+        "data": crud.get_keyword_frequencies(db, platform=platform, limit=limit)
+    }
+
+@app.get("/client-accounts/{account_id}", response_model=schemas.ClientAccount)
+def get_client_account(account_id: int, request: Request, db: Session = Depends(get_db)):
+    row = db.query(*CLIENT_ACCOUNT_COLUMNS).filter(models.ClientAccount.id == account_id).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Account not found")
+    
+    last_modified = row.updated_at or row.created_at
+    etag = make_etag("client-account", *row)
+    headers = cache_headers(etag, PRIVATE_REVALIDATE, last_modified)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(headers)
+    return FastJSONResponse(row_to_dict(CLIENT_ACCOUNT_FIELDS, row), headers=headers)
+
+@app.put("/client-accounts/{account_id}", response_model=schemas.ClientAccount)
+def update_client_account(account_id: int, account_update: ClientAccountUpdate, db: Session = Depends(get_db)):
     account = db.query(models.ClientAccount).filter(models.ClientAccount.id == account_id).first()
     if account is None:
         raise HTTPException(status_code=404, detail="Account not found")
-    return {
-        "id": account.id,
-        "account_name": account.account_name,
-        "account_type": account.account_type,
-        "topic_keywords": account.topic_keywords,
-        "platform": account.platform,
-        "created_at": account.created_at,
-        "updated_at": account.updated_at
-    }
+    
+    update_data = account_update.dict(exclude_unset=True)
+    for field, value in update_data.items():
+        setattr(account, field, value)
+    
+    db.commit()
+    db.refresh(account)
+    account_cache.invalidate()
+    return FastJSONResponse(obj_to_dict(CLIENT_ACCOUNT_FIELDS, account))
 
 @app.delete("/client-accounts/{account_id}")
 def delete_client_account(account_id: int, db: Session = Depends(get_db)):
@@ -420,20 +878,73 @@ def delete_client_account(account_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Account not found")
     db.delete(account)
     db.commit()
+    account_cache.invalidate()
     return {"message": "Account deleted successfully"}
 
+# 统计分析接口
+@app.get("/analytics/notes")
+def get_note_analytics(
+    group_by: str = "day",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: Session = Depends(get_db)
+):
+    """按天/模型/平台/账号查询笔记统计（读取汇总表）"""
+    dimensions = [dimension.strip() for dimension in group_by.split(',') if dimension.strip()]
+    invalid = [dimension for dimension in dimensions if dimension not in GROUP_DIMENSIONS]
+    if invalid:
+        raise HTTPException(
+            status_code=400,
+            detail=f"不支持的分组维度: {', '.join(invalid)}，可选: {', '.join(GROUP_DIMENSIONS)}"
+        )
+    return {
+        "success": True,
+        "data": analytics_service.get_stats(db, dimensions, start_date=start_date, end_date=end_date)
+    }
+
 @app.get("/")
 def root():
     return {"message": "小红书笔记生成器 API", "docs": "/docs"}
 
-# 割草机内容生成接口
-@app.post("/api/lawn-mower/generate", response_model=LawnMowerContentResponse)
-async def generate_lawn_mower_content(request: LawnMowerContentRequest):
-    """生成割草机推广内容"""
+@app.post("/api/lawn-mower/generate/dry-run")
+async def dry_run_lawn_mower_content(request: LawnMowerContentRequest):
+    """只渲染割草机推广内容提示词，不调用模型"""
+    rendered = lawn_mower_service.render_prompt(**request.dict(exclude={"ai_model", "mode", "keep_others"}))
+    return {"success": True, "data": rendered}
+
+@app.get("/api/lawn-mower/race/{race_id}")
+def get_lawn_mower_race(race_id: str):
+    """获取竞速模式中后台继续运行的其余模型结果"""
+    record = race_store.get(race_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="竞速结果不存在或已过期")
+    return {"success": True, "data": record}
+
+async def run_lawn_mower_generation(request: LawnMowerContentRequest) -> LawnMowerContentResponse:
+    """按 mode 调用所选模型生成割草机推广内容，失败时返回 success=False"""
     try:
+        resolved_models = []
+        for model in request.ai_model:
+            if model_selector.is_auto(model):
+                model = model_selector.choose([m.value for m in AIModel], preference=model, exclude=resolved_models)
+            resolved_models.append(model)
+        
+        # 竞速模式：并发调用，返回第一个有效结果
+        if request.mode == "race":
+            result = await lawn_mower_service.race_lawn_mower_content(
+                resolved_models,
+                keep_others=request.keep_others,
+                **request.dict(exclude={"ai_model", "mode", "keep_others"})
+            )
+            return LawnMowerContentResponse(success=result["success"], data=result["data"], error=result.get("error"))
+        
         # 处理多模型生成
         all_results = []
-        for model in request.ai_model:
+        timed_out_models = []
+        for model in resolved_models:
+            if deadline.expired():
+                timed_out_models.append(model)
+                continue
             try:
                 result = await lawn_mower_service.generate_lawn_mower_content(
                     spu=request.spu,
@@ -449,13 +960,19 @@ async def generate_lawn_mower_content(request: LawnMowerContentRequest):
                     user_persona=request.user_persona,
                     content_style=request.content_style,
                     holiday_season=request.holiday_season,
-                    ai_model=[model]  # 单个模型
+                    ai_model=[model],  # 单个模型
+                    variants=request.variants
                 )
                 
                 if result.get("success"):
                     result_data = result.get("data", {})
-                    result_data["model"] = model
-                    all_results.append(result_data)
+                    # 多个候选时 data 为 {"results": [...]}
+                    variants = result_data["results"] if isinstance(result_data.get("results"), list) else [result_data]
+                    for variant in variants:
+                        variant["model"] = model
+                        all_results.append(variant)
+                elif deadline.expired():
+                    timed_out_models.append(model)
                     
             except Exception as e:
                 logger.error(f"模型 {model} 生成失败: {str(e)}")
@@ -464,7 +981,7 @@ async def generate_lawn_mower_content(request: LawnMowerContentRequest):
         if not all_results:
             return LawnMowerContentResponse(
                 success=False,
-                error="所有模型生成均失败"
+                error="生成超时" if timed_out_models else "所有模型生成均失败"
             )
         
         # 返回第一个成功的结果，但包含所有模型的信息
@@ -472,7 +989,8 @@ async def generate_lawn_mower_content(request: LawnMowerContentRequest):
             success=True,
             data={
                 "results": all_results,
-                "models_used": [result.get("model") for result in all_results]
+                "models_used": [result.get("model") for result in all_results],
+                "timed_out_models": timed_out_models
             }
         )
         
@@ -483,3 +1001,24 @@ async def generate_lawn_mower_content(request: LawnMowerContentRequest):
             error=f"生成失败: {str(e)}"
         )
 
+# 割草机内容生成接口
+@app.post("/api/lawn-mower/generate", response_model=LawnMowerContentResponse)
+async def generate_lawn_mower_content(request: LawnMowerContentRequest, http_request: Request):
+    """生成割草机推广内容"""
+    if request.mode not in ("all", "race"):
+        raise HTTPException(status_code=400, detail="mode 只能是 all 或 race")
+    if not 1 <= request.variants <= MAX_VARIANTS:
+        raise HTTPException(status_code=400, detail=f"variants 取值范围为 1-{MAX_VARIANTS}")
+    if request.mode == "race" and request.variants > 1:
+        raise HTTPException(status_code=400, detail="race 模式只返回一个结果，不支持 variants")
+    
+    try:
+        # 客户端断开时按策略取消模型调用
+        return await disconnect_monitor.run(http_request, run_lawn_mower_generation(request))
+    except ClientDisconnected:
+        raise HTTPException(status_code=499, detail="客户端已断开，生成已取消")
+
+@app.websocket("/api/lawn-mower/ws")
+async def lawn_mower_websocket(websocket: WebSocket):
+    """割草机内容生成的 WebSocket 会话：逐个推送模型结果，可取消进行中的生成"""
+    await LawnMowerSession(websocket, lawn_mower_service).run()
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, func, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Date, DateTime, func, JSON, Index, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
 from app.db import Base
 
 class User(Base):
@@ -32,16 +33,58 @@ class XiaohongshuNote(Base):
     comment_guide = Column(Text, nullable=False)  # 评论区引导文案
     comment_questions = Column(Text, nullable=False)  # 评论区问题
     model = Column(String(50), nullable=True)  # 添加模型字段
+    latency_ms = Column(Integer, nullable=True)  # 模型调用耗时（毫秒）
+    total_tokens = Column(Integer, nullable=True)  # 模型调用token用量
+    # 内容指纹字段（用于重复检测）
+    input_fingerprint = Column(String(64), nullable=True, index=True)  # 输入精确指纹
+    content_fingerprint = Column(String(64), nullable=True)  # 输出精确指纹
+    content_simhash = Column(BigInteger, nullable=True)  # 输出 SimHash
+    simhash_band_0 = Column(Integer, nullable=True)  # SimHash 分段，用于近似重复索引
+    simhash_band_1 = Column(Integer, nullable=True)
+    simhash_band_2 = Column(Integer, nullable=True)
+    simhash_band_3 = Column(Integer, nullable=True)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    __table_args__ = (
+        Index("ix_notes_account_content_fp", "input_selected_account_id", "content_fingerprint"),
+        Index("ix_notes_account_band_0", "input_selected_account_id", "simhash_band_0"),
+        Index("ix_notes_account_band_1", "input_selected_account_id", "simhash_band_1"),
+        Index("ix_notes_account_band_2", "input_selected_account_id", "simhash_band_2"),
+        Index("ix_notes_account_band_3", "input_selected_account_id", "simhash_band_3"),
+    )
+
 class ClientAccount(Base):
     __tablename__ = "client_accounts"
     
     id = Column(Integer, primary_key=True, index=True)
     account_name = Column(String(100), nullable=False)  # 账号名称
     account_type = Column(String(50), nullable=False)  # 账号类型
-    topic_keywords = Column(JSON, nullable=True)  # 常驻话题关键词，使用JSON类型存储数组
+    topic_keywords = Column(JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql"), nullable=True)  # 常驻话题关键词，PostgreSQL 中使用 JSONB 存储数组；None 存为 SQL NULL
     platform = Column(String(50), nullable=False)  # 发布平台
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_client_accounts_topic_keywords", "topic_keywords", postgresql_using="gin"),
+    )
+
+class NoteDailyStat(Base):
+    """笔记按天汇总统计（随笔记写入增量维护）"""
+    __tablename__ = "note_daily_stats"
+
+    id = Column(Integer, primary_key=True, index=True)
+    stat_date = Column(Date, nullable=False)  # 统计日期
+    model = Column(String(50), nullable=False, default="")  # 模型，空字符串表示未知
+    platform = Column(String(50), nullable=False, default="")  # 发布平台，空字符串表示未知
+    account_id = Column(Integer, nullable=False, default=0)  # 客户账号ID，0表示未选择账号
+    note_count = Column(Integer, nullable=False, default=0)  # 生成笔记数
+    regenerate_count = Column(Integer, nullable=False, default=0)  # 相同输入重复生成数
+    latency_ms_sum = Column(BigInteger, nullable=False, default=0)  # 耗时总和
+    latency_samples = Column(Integer, nullable=False, default=0)  # 有耗时记录的笔记数
+    tokens_sum = Column(BigInteger, nullable=False, default=0)  # token总和
+    token_samples = Column(Integer, nullable=False, default=0)  # 有token记录的笔记数
+
+    __table_args__ = (
+        UniqueConstraint("stat_date", "model", "platform", "account_id", name="uq_note_daily_stats_key"),
+    )
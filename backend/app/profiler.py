@@ -0,0 +1,137 @@
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+
+class RequestProfile:
+    """一次被采样请求的调用栈计数"""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.stacks: Counter = Counter()
+        self.samples = 0
+
+
+class SamplingProfiler:
+    """按比例对请求做采样分析，输出火焰图可用的折叠栈文件
+
+    被选中的请求运行期间，后台线程每 PROFILE_INTERVAL_MS 毫秒采集一次所有线程的调用栈
+    （根节点为线程名），请求结束后写入 PROFILE_DIR 下的 .folded 文件，
+    可直接用 flamegraph.pl 或 speedscope 打开。
+    同一事件循环上的并发请求会出现在同一份采样中，分析时以请求所在路径的栈为准。
+
+    采样比例保存在 PROFILE_DIR/profiling.json 中，由管理接口修改，同一容器内的所有 worker 共享。
+    """
+
+    def __init__(self):
+        self.directory = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "request_profiles"))
+        self.interval = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+        self.max_depth = 128
+        self._active: Dict[int, RequestProfile] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._config = {"sample_rate": float(os.getenv("PROFILE_SAMPLE_RATE", "0"))}
+        self._config_mtime = None
+        self._config_checked = 0.0
+
+    @property
+    def _config_path(self) -> str:
+        return os.path.join(self.directory, "profiling.json")
+
+    def settings(self) -> Dict[str, Any]:
+        # 每秒最多检查一次配置文件是否被其他 worker 修改
+        now = time.monotonic()
+        if now - self._config_checked >= 1:
+            self._config_checked = now
+            try:
+                mtime = os.path.getmtime(self._config_path)
+                if mtime != self._config_mtime:
+                    with open(self._config_path, "r", encoding="utf-8") as f:
+                        self._config = json.load(f)
+                    self._config_mtime = mtime
+            except (OSError, json.JSONDecodeError):
+                pass
+        return dict(self._config)
+
+    def configure(self, sample_rate: float) -> Dict[str, Any]:
+        os.makedirs(self.directory, exist_ok=True)
+        config = {"sample_rate": sample_rate, "updated_at": datetime.now().isoformat()}
+        temp_path = f"{self._config_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(config, f)
+        os.replace(temp_path, self._config_path)
+        self._config = config
+        self._config_checked = 0.0
+        return config
+
+    def should_sample(self) -> bool:
+        rate = self.settings().get("sample_rate", 0)
+        return rate > 0 and random.random() < rate
+
+    def begin(self, label: str) -> int:
+        profile = RequestProfile(label)
+        profile_id = id(profile)
+        with self._lock:
+            self._active[profile_id] = profile
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._sample_loop, name="request-profiler", daemon=True)
+                self._thread.start()
+        return profile_id
+
+    def end(self, profile_id: int, duration_ms: float) -> Optional[str]:
+        """结束采样并写入折叠栈文件，返回文件路径"""
+        with self._lock:
+            profile = self._active.pop(profile_id, None)
+        if profile is None or not profile.stacks:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        name = "{}-{}-{:.0f}ms-{}.folded".format(
+            datetime.now().strftime("%Y%m%d-%H%M%S"),
+            re.sub(r"[^A-Za-z0-9_-]+", "_", profile.label).strip("_")[:80],
+            duration_ms,
+            profile_id % 100000
+        )
+        path = os.path.join(self.directory, name)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in profile.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"🔥 请求采样已保存: {path}（{profile.samples} 次采样）")
+        return path
+
+    def _sample_loop(self) -> None:
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                profiles = list(self._active.values())
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                frames = []
+                while frame is not None and len(frames) < self.max_depth:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                frames.append(names.get(thread_id, str(thread_id)))
+                # 折叠栈格式中分号是分隔符
+                stacks.append(";".join(part.replace(";", ":") for part in reversed(frames)))
+            for profile in profiles:
+                profile.samples += 1
+                profile.stacks.update(stacks)
+            time.sleep(self.interval)
+
+
+# 创建服务实例
+profiler = SamplingProfiler()
@@ -0,0 +1,248 @@
+import json
+import os
+import queue
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from app import tracing
+
+
+class RequestQueries:
+    """一次请求内执行的语句统计；在请求派生的任务和线程间共享"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.slow = 0
+        self.statements: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, statement: str, duration_ms: float, slow: bool) -> None:
+        with self._lock:
+            self.count += 1
+            self.total_ms += duration_ms
+            self.slow += int(slow)
+            self.statements[statement] += 1
+
+
+# 有副作用的函数调用：EXPLAIN ANALYZE 会真正执行，SELECT 中出现时不分析
+_SIDE_EFFECT_RE = re.compile(r"\b(nextval|setval|pg_\w*lock\w*)\s*\(", re.IGNORECASE)
+
+_request_queries: ContextVar[Optional[RequestQueries]] = ContextVar("request_queries", default=None)
+
+
+def redact(parameters: Any) -> Any:
+    """只保留参数的类型（字符串附带长度），不记录取值"""
+    if isinstance(parameters, dict):
+        return {key: redact(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [redact(value) for value in parameters]
+    if parameters is None:
+        return "<NULL>"
+    if isinstance(parameters, (str, bytes)):
+        return f"<{type(parameters).__name__}:{len(parameters)}>"
+    return f"<{type(parameters).__name__}>"
+
+
+class QueryMonitor:
+    """数据库语句监控，挂在 app/db.py 的引擎上
+
+    - 耗时超过 SLOW_QUERY_MS 的语句打印并写入 SLOW_QUERY_LOG（JSON Lines），参数只记录类型
+    - 按请求统计语句数与耗时，写入 Server-Timing（sql 阶段）并按路由汇总；
+      单个请求的语句数超过 QUERY_COUNT_WARN，或同一语句重复 QUERY_REPEAT_WARN 次以上时告警（疑似 N+1）
+    - PostgreSQL 上按 SLOW_QUERY_EXPLAIN_RATE 抽样，对慢 SELECT 在后台连接上执行
+      EXPLAIN (ANALYZE, BUFFERS)，执行计划写入同一日志；同一语句 SLOW_QUERY_EXPLAIN_INTERVAL 秒内只分析一次
+    """
+
+    def __init__(self):
+        self.slow_query_ms = float(os.getenv("SLOW_QUERY_MS", "200"))
+        self.log_path = os.getenv("SLOW_QUERY_LOG", os.path.join(tempfile.gettempdir(), "slow_queries.jsonl"))
+        self.count_warn = int(os.getenv("QUERY_COUNT_WARN", "30"))
+        self.repeat_warn = int(os.getenv("QUERY_REPEAT_WARN", "10"))
+        self.explain_rate = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0"))
+        self.explain_interval = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300"))
+        self.explain_timeout_ms = int(os.getenv("SLOW_QUERY_EXPLAIN_TIMEOUT_MS", "10000"))
+        self._engine = None
+        self._explain_queue: queue.Queue = queue.Queue(maxsize=10)
+        self._explain_thread: Optional[threading.Thread] = None
+        self._explained_at: Dict[str, float] = {}
+        self._log_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.routes: Dict[str, Dict[str, Any]] = defaultdict(
+            lambda: {"requests": 0, "queries": 0, "max_queries": 0, "query_ms": 0.0, "slow_queries": 0, "n_plus_one_warnings": 0}
+        )
+        self.slow_queries = 0
+        self.explains = 0
+
+    def instrument(self, engine) -> None:
+        from sqlalchemy import event
+
+        self._engine = engine
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(engine, "handle_error", self._handle_error)
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_times", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start_times = conn.info.get("query_start_times")
+        if not start_times:
+            return
+        duration_ms = (time.perf_counter() - start_times.pop()) * 1000
+        slow = duration_ms >= self.slow_query_ms
+        stats = _request_queries.get()
+        if stats is not None:
+            stats.add(statement, duration_ms, slow)
+        if slow:
+            self._log_slow_query(statement, parameters, duration_ms, executemany)
+
+    def _handle_error(self, exception_context) -> None:
+        # 执行失败（如语句超时）时不会触发 after_cursor_execute，需在此弹出开始时间，否则会残留在连接池的连接上
+        conn = exception_context.connection
+        start_times = conn.info.get("query_start_times") if conn is not None else None
+        if not start_times:
+            return
+        duration_ms = (time.perf_counter() - start_times.pop()) * 1000
+        stats = _request_queries.get()
+        if stats is not None:
+            stats.add(exception_context.statement or "", duration_ms, duration_ms >= self.slow_query_ms)
+
+    def _log_slow_query(self, statement: str, parameters: Any, duration_ms: float, executemany: bool) -> None:
+        self.slow_queries += 1
+        request_id = tracing.request_id()
+        if executemany:
+            redacted = {"rows": len(parameters), "first": redact(parameters[0]) if parameters else None}
+        else:
+            redacted = redact(parameters)
+        print(f"🐢 慢查询 {duration_ms:.0f}ms [{request_id or '-'}] {' '.join(statement.split())[:300]} 参数: {redacted}")
+        self._write_log({
+            "type": "slow_query",
+            "at": datetime.now().isoformat(),
+            "request_id": request_id,
+            "duration_ms": round(duration_ms, 1),
+            "statement": statement,
+            "parameters": redacted
+        })
+        if not executemany:
+            self._maybe_explain(statement, parameters, duration_ms, request_id)
+
+    def _maybe_explain(self, statement: str, parameters: Any, duration_ms: float, request_id: Optional[str]) -> None:
+        # EXPLAIN ANALYZE 会真正执行语句，只分析只读的 SELECT
+        if self.explain_rate <= 0 or self._engine.dialect.name != "postgresql":
+            return
+        if not self._explainable(statement) or random.random() >= self.explain_rate:
+            return
+        now = time.monotonic()
+        if now - self._explained_at.get(statement, float("-inf")) < self.explain_interval:
+            return
+        self._explained_at[statement] = now
+        try:
+            # 参数只在内存中用于复现执行计划，不写入日志
+            self._explain_queue.put_nowait((statement, parameters, duration_ms, request_id))
+        except queue.Full:
+            return
+        if self._explain_thread is None or not self._explain_thread.is_alive():
+            self._explain_thread = threading.Thread(target=self._explain_loop, name="slow-query-explain", daemon=True)
+            self._explain_thread.start()
+
+    @staticmethod
+    def _explainable(statement: str) -> bool:
+        return statement.lstrip().upper().startswith("SELECT") and not _SIDE_EFFECT_RE.search(statement)
+
+    def _explain_loop(self) -> None:
+        while True:
+            statement, parameters, duration_ms, request_id = self._explain_queue.get()
+            try:
+                plan = self._explain(statement, parameters)
+            except Exception as e:
+                print(f"⚠️ 慢查询执行计划获取失败: {e}")
+                continue
+            self.explains += 1
+            self._write_log({
+                "type": "explain",
+                "at": datetime.now().isoformat(),
+                "request_id": request_id,
+                "duration_ms": round(duration_ms, 1),
+                "statement": statement,
+                "plan": plan
+            })
+
+    def _explain(self, statement: str, parameters: Any) -> str:
+        # 直接使用 DBAPI 连接，不经过引擎事件，避免被统计或再次触发分析
+        connection = self._engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            # 只读事务兜底：即使语句中有未识别的写操作也会报错而不是执行
+            cursor.execute("SET TRANSACTION READ ONLY")
+            cursor.execute(f"SET LOCAL statement_timeout = {self.explain_timeout_ms}")
+            cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters)
+            return "\n".join(row[0] for row in cursor.fetchall())
+        finally:
+            connection.rollback()
+            connection.close()
+
+    def _write_log(self, entry: Dict[str, Any]) -> None:
+        try:
+            with self._log_lock:
+                directory = os.path.dirname(self.log_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            print(f"⚠️ 慢查询日志写入失败: {e}")
+
+    def start_request(self):
+        """开始统计当前请求的语句，返回用于恢复的 token"""
+        return _request_queries.set(RequestQueries())
+
+    def finish_request(self, token, route: str) -> RequestQueries:
+        """结束统计，按路由汇总并检查疑似 N+1 的请求"""
+        stats = _request_queries.get()
+        _request_queries.reset(token)
+        repeated, repeats = max(stats.statements.items(), key=lambda item: item[1], default=(None, 0))
+        suspicious = stats.count > self.count_warn or repeats >= self.repeat_warn
+        with self._stats_lock:
+            summary = self.routes[route]
+            summary["requests"] += 1
+            summary["queries"] += stats.count
+            summary["max_queries"] = max(summary["max_queries"], stats.count)
+            summary["query_ms"] += stats.total_ms
+            summary["slow_queries"] += stats.slow
+            summary["n_plus_one_warnings"] += int(suspicious)
+        if suspicious:
+            print(f"⚠️ {route} 单次请求执行了 {stats.count} 条语句，重复最多的语句执行 {repeats} 次（疑似 N+1）: "
+                  f"{' '.join(repeated.split())[:200]}")
+        return stats
+
+    def status(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            routes = {
+                route: {
+                    **summary,
+                    "query_ms": round(summary["query_ms"], 1),
+                    "avg_queries": round(summary["queries"] / summary["requests"], 2) if summary["requests"] else 0
+                }
+                for route, summary in sorted(self.routes.items())
+            }
+        return {
+            "slow_query_ms": self.slow_query_ms,
+            "log_path": self.log_path,
+            "explain_rate": self.explain_rate,
+            "slow_queries": self.slow_queries,
+            "explains": self.explains,
+            "routes": routes
+        }
+
+
+# 创建服务实例
+query_monitor = QueryMonitor()
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, validator
 from typing import Optional, List
 from datetime import datetime
 
@@ -15,6 +15,7 @@ class UserOut(BaseModel):
     created_at: datetime
 
     class Config:
+        orm_mode = True
         from_attributes = True
 
 class NoteGenerateRequest(BaseModel):
@@ -32,6 +33,11 @@ class NoteGenerateRequest(BaseModel):
     topic_keywords: Optional[str] = None
     platform: Optional[str] = None
     selected_account_id: Optional[int] = None  # 选中的存储账号ID
+    # 相似输入复用：开启后命中相似历史笔记时直接返回，不再调用模型
+    reuse_similar: bool = False
+    similarity_threshold: Optional[float] = None
+    # 每个模型生成的候选篇数（1-5），支持 n 参数的模型一次调用返回全部候选
+    variants: int = 1
 
 class NoteCreate(BaseModel):
     input_basic_content: str
@@ -52,6 +58,11 @@ class NoteCreate(BaseModel):
     comment_guide: str
     comment_questions: str
 
+class NoteImport(NoteCreate):
+    """历史笔记导入"""
+    model: Optional[str] = None
+    created_at: Optional[datetime] = None
+
 class NoteUpdate(BaseModel):
     note_title: Optional[str] = None
     note_content: Optional[str] = None
@@ -82,6 +93,7 @@ class NoteOut(BaseModel):
     updated_at: Optional[datetime] = None
 
     class Config:
+        orm_mode = True
         from_attributes = True
 
 class ClientAccountBase(BaseModel):
@@ -93,12 +105,26 @@ class ClientAccountBase(BaseModel):
 class ClientAccountCreate(ClientAccountBase):
     pass
 
+class ClientAccountUpdate(BaseModel):
+    account_name: Optional[str] = None
+    account_type: Optional[str] = None
+    topic_keywords: Optional[List[str]] = None
+    platform: Optional[str] = None
+
+    @validator("account_name", "account_type", "platform")
+    def not_null(cls, value):
+        # 可以不传，但不能显式置空（数据库中为 NOT NULL）
+        if value is None:
+            raise ValueError("不能为 null")
+        return value
+
 class ClientAccount(ClientAccountBase):
     id: int
     created_at: datetime
     updated_at: Optional[datetime] = None
 
     class Config:
+        orm_mode = True
         from_attributes = True
 
 # 割草机内容生成相关Schema
@@ -117,6 +143,9 @@ class LawnMowerContentRequest(BaseModel):
     content_style: str
     holiday_season: Optional[str] = None
     ai_model: List[str]  # 支持多个AI模型
+    mode: str = "all"  # all: 等待所有模型; race: 返回最先完成的有效结果
+    keep_others: bool = False  # race 模式下其余模型是否在后台继续运行
+    variants: int = 1  # 每个模型生成的候选数（1-5），仅 all 模式
 
 class LawnMowerContentResponse(BaseModel):
     success: bool
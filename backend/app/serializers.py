@@ -0,0 +1,52 @@
+import json
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Sequence
+from fastapi.responses import JSONResponse
+from app import schemas, timing
+from app.models import XiaohongshuNote, ClientAccount
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，缺失时退回标准库
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(JSONResponse):
+    """直接序列化内容的 JSON 响应，优先使用 orjson
+
+    接口直接返回该响应时，FastAPI 会跳过 response_model 校验和 jsonable_encoder，
+    只做一次序列化。
+    """
+
+    def render(self, content: Any) -> bytes:
+        with timing.stage("serialize"):
+            if orjson is not None:
+                return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+            return json.dumps(content, ensure_ascii=False, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+# 响应字段与 ORM 列（按响应 schema 的字段顺序）
+NOTE_OUT_FIELDS = list(schemas.NoteOut.__fields__)
+NOTE_OUT_COLUMNS = [getattr(XiaohongshuNote, field) for field in NOTE_OUT_FIELDS]
+CLIENT_ACCOUNT_FIELDS = list(schemas.ClientAccount.__fields__)
+CLIENT_ACCOUNT_COLUMNS = [getattr(ClientAccount, field) for field in CLIENT_ACCOUNT_FIELDS]
+
+
+def row_to_dict(fields: Sequence[str], row: Sequence[Any]) -> Dict[str, Any]:
+    """把按列查询得到的行转换为响应字典"""
+    return dict(zip(fields, row))
+
+
+def rows_to_dicts(fields: Sequence[str], rows: Iterable[Sequence[Any]]) -> List[Dict[str, Any]]:
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def obj_to_dict(fields: Sequence[str], obj: Any) -> Dict[str, Any]:
+    """把 ORM 对象转换为响应字典"""
+    return {field: getattr(obj, field) for field in fields}
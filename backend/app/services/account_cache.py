@@ -0,0 +1,59 @@
+import os
+import threading
+import time
+from typing import Dict, Any, Optional
+from sqlalchemy.orm import Session
+from app.models import ClientAccount
+from app.services.ai_service import AIService
+
+
+class AccountCache:
+    """客户账号进程内缓存
+
+    一次性加载全部 client_accounts，并为每个账号预渲染提示词中的账号信息段落。
+    本进程内的增删改会立即失效缓存；其他 worker 的修改在 TTL 过期后生效。
+    """
+
+    def __init__(self):
+        self.ttl = float(os.getenv("ACCOUNT_CACHE_TTL", "60"))
+        self._profiles: Dict[int, Dict[str, Any]] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        """标记缓存失效，下次读取时重新加载"""
+        self._loaded_at = 0.0
+
+    @staticmethod
+    def _build_profile(account: ClientAccount) -> Dict[str, Any]:
+        topic_keywords = ", ".join(account.topic_keywords) if account.topic_keywords else None
+        return {
+            "id": account.id,
+            "account_name": account.account_name,
+            "account_type": account.account_type,
+            "topic_keywords": topic_keywords,
+            "platform": account.platform,
+            "prompt_block": AIService.render_account_block(
+                account.account_name, account.account_type, topic_keywords, account.platform
+            )
+        }
+
+    def _reload(self, db: Session) -> None:
+        with self._lock:
+            profiles = {account.id: self._build_profile(account) for account in db.query(ClientAccount).all()}
+            self._profiles = profiles
+            self._loaded_at = time.monotonic()
+
+    def get(self, db: Session, account_id: int) -> Optional[Dict[str, Any]]:
+        """获取账号资料，缓存过期或未命中时从数据库重新加载"""
+        age = time.monotonic() - self._loaded_at
+        if age > self.ttl:
+            self._reload(db)
+        elif account_id not in self._profiles and age > 1.0:
+            # 可能是其他 worker 新建的账号，限制每秒最多因未命中重载一次
+            self._reload(db)
+        return self._profiles.get(account_id)
+
+
+# 创建缓存实例
+account_cache = AccountCache()
@@ -1,8 +1,10 @@
-import os
-import httpx
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable, List
 from enum import Enum
 from datetime import datetime
+import time
+from app.services.prompt_templates import render_note_prompt
+from app.services.llm_gateway import llm_gateway
+from app.services.model_selector import model_selector
 
 class AIModel(str, Enum):
     CLAUDE_3_5_SONNET = "claude-3-5-sonnet-latest"
@@ -14,91 +16,75 @@ class AIModel(str, Enum):
 class AIService:
     def __init__(self):
         """初始化AI服务"""
-        # One-API配置
-        self.one_api_url = os.getenv("ONE_API_URL", "https://your-remote-oneapi-service.com").rstrip('/')
-        self.api_key = os.getenv("ONE_API_KEY")
+        # 上游地址、模型映射与连接池由统一网关管理
         self.default_model = AIModel.GPT_4O
 
-        # 模型映射到One-API中的实际模型名称
-        self.model_mapping = {
-            AIModel.CLAUDE_3_5_SONNET: "claude-3-5-sonnet-latest",
-            AIModel.CLAUDE_SONNET_4: "claude-sonnet-4-20250514",
-            AIModel.GPT_4O: "gpt-4o", 
-            AIModel.DEEPSEEK_R1: "deepseek-r1",
-            AIModel.GLM_4: "glm-4"
-        }
-
         print(f"🤖 AI服务已初始化")
-        print(f"📡 API地址: {self.one_api_url}")
         print(f"🎯 支持的模型: {', '.join([model.value for model in AIModel])}")
         print(f"⏰ 时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
-    def _get_headers(self) -> Dict[str, str]:
-        """获取请求头"""
-        return {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-
     async def _call_one_api(self, model: str, messages: list, temperature: float = 0.7) -> Dict[Any, Any]:
-        """调用One-API服务"""
-        headers = self._get_headers()
-        
-        # 获取实际的模型名称
-        actual_model = self.model_mapping.get(model, model)
-        
-        request_data = {
-            "model": actual_model,
-            "messages": messages,
-            "temperature": temperature,
-            "max_tokens": 2000
-        }
+        """通过统一网关调用模型"""
+        return await llm_gateway.chat_completion(model, messages, temperature=temperature, max_tokens=2000)
 
-        print(f"🚀 正在调用AI模型...")
-        print(f"📝 模型: {model} -> {actual_model}")
-        print(f"🔑 API Key: {self.api_key[:10]}...{self.api_key[-10:] if self.api_key else 'None'}")
-        print(f"🌐 请求URL: {self.one_api_url}/v1/chat/completions")
-        
-        async with httpx.AsyncClient() as client:
-            try:
-                start_time = datetime.now()
-                
-                response = await client.post(
-                    f"{self.one_api_url}/v1/chat/completions",
-                    headers=headers,
-                    json=request_data,
-                    timeout=60.0
-                )
-                
-                end_time = datetime.now()
-                duration = (end_time - start_time).total_seconds()
-                
-                print(f"📊 响应状态码: {response.status_code}")
-                print(f"📋 响应头: {dict(response.headers)}")
-                
-                if response.status_code != 200:
-                    error_text = response.text
-                    print(f"❌ API响应错误: {error_text}")
-                    raise httpx.HTTPStatusError(f"HTTP {response.status_code}: {error_text}", request=response.request, response=response)
-                
-                response_data = response.json()
-                print(f"✅ API调用成功！耗时: {duration:.2f}秒")
-                print(f"📄 响应数据结构: {list(response_data.keys()) if isinstance(response_data, dict) else type(response_data)}")
-                
-                return response_data
-                
-            except httpx.HTTPStatusError as e:
-                error_msg = f"HTTP错误 {e.response.status_code}: {e.response.text if hasattr(e, 'response') else str(e)}"
-                print(f"❌ {error_msg}")
-                raise Exception(error_msg)
-            except httpx.RequestError as e:
-                error_msg = f"请求错误: {str(e)}"
-                print(f"❌ {error_msg}")
-                raise Exception(error_msg)
-            except Exception as e:
-                error_msg = f"未知错误: {str(e)}"
-                print(f"❌ {error_msg}")
-                raise Exception(error_msg)
+    def resolve_model(self, model: Optional[str], exclude: Iterable[str] = ()) -> str:
+        """把请求中的模型名解析为实际使用的模型
+
+        auto / auto:fast / auto:quality 由模型选择器按实测数据挑选，exclude 中的模型不参与；
+        未知模型名使用默认模型。
+        """
+        if model_selector.is_auto(model):
+            return model_selector.choose([m.value for m in AIModel], preference=model, exclude=exclude)
+        return model if model in [m.value for m in AIModel] else self.default_model.value
+
+    @staticmethod
+    def render_account_block(account_name: Optional[str] = None,
+                             account_type: Optional[str] = None,
+                             topic_keywords: Optional[str] = None,
+                             platform: Optional[str] = None) -> str:
+        """渲染提示词中的账号信息段落"""
+        if not (account_name or account_type or topic_keywords or platform):
+            return ""
+        block = "\n账号信息：\n"
+        if account_name:
+            block += f"账号名称：{account_name}\n"
+        if account_type:
+            block += f"账号类型：{account_type}\n"
+        if platform:
+            block += f"发布平台：{platform}\n"
+        if topic_keywords:
+            block += f"常驻话题关键词：{topic_keywords}\n"
+            block += "请结合这些关键词优化内容，使其更符合该账号的定位和风格。\n"
+        return block
+
+    def build_note_prompt(self,
+                          basic_content: str,
+                          note_purpose: Optional[str] = None,
+                          recent_trends: Optional[str] = None,
+                          writing_style: Optional[str] = None,
+                          target_audience: Optional[str] = None,
+                          content_type: Optional[str] = None,
+                          reference_links: Optional[str] = None,
+                          account_name: Optional[str] = None,
+                          account_type: Optional[str] = None,
+                          topic_keywords: Optional[str] = None,
+                          platform: Optional[str] = None,
+                          account_block: Optional[str] = None,
+                          budget: Optional[int] = None) -> Dict[str, Any]:
+        """渲染小红书笔记提示词，返回消息列表、预估token数和裁剪记录"""
+        # 已存储账号使用预渲染的账号信息段落
+        if account_block is None:
+            account_block = self.render_account_block(account_name, account_type, topic_keywords, platform)
+        return render_note_prompt({
+            "account_block": account_block,
+            "basic_content": basic_content,
+            "note_purpose": note_purpose,
+            "recent_trends": recent_trends,
+            "writing_style": writing_style,
+            "target_audience": target_audience,
+            "content_type": content_type,
+            "reference_links": reference_links
+        }, budget=budget)
 
     async def generate_note(self, 
                           basic_content: str,
@@ -112,11 +98,46 @@ class AIService:
                           account_name: Optional[str] = None,
                           account_type: Optional[str] = None,
                           topic_keywords: Optional[str] = None,
-                          platform: Optional[str] = None) -> Dict[str, str]:
+                          platform: Optional[str] = None,
+                          account_block: Optional[str] = None) -> Dict[str, str]:
         """生成小红书笔记"""
+        notes = await self.generate_note_variants(
+            1,
+            basic_content=basic_content,
+            model=model,
+            note_purpose=note_purpose,
+            recent_trends=recent_trends,
+            writing_style=writing_style,
+            target_audience=target_audience,
+            content_type=content_type,
+            reference_links=reference_links,
+            account_name=account_name,
+            account_type=account_type,
+            topic_keywords=topic_keywords,
+            platform=platform,
+            account_block=account_block
+        )
+        return notes[0]
+
+    async def generate_note_variants(self,
+                                     variants: int,
+                                     basic_content: str,
+                                     model: Optional[str] = None,
+                                     note_purpose: Optional[str] = None,
+                                     recent_trends: Optional[str] = None,
+                                     writing_style: Optional[str] = None,
+                                     target_audience: Optional[str] = None,
+                                     content_type: Optional[str] = None,
+                                     reference_links: Optional[str] = None,
+                                     account_name: Optional[str] = None,
+                                     account_type: Optional[str] = None,
+                                     topic_keywords: Optional[str] = None,
+                                     platform: Optional[str] = None,
+                                     account_block: Optional[str] = None) -> List[Dict[str, str]]:
+        """用同一提示词生成 variants 篇候选笔记（支持 n 的模型只调用一次）"""
         
-        # 根据选择的模型确定使用哪个模型
-        selected_model = model if model in [m.value for m in AIModel] else self.default_model.value
+        # 根据选择的模型确定使用哪个模型（auto 按实测延迟与错误率自动选择）
+        selected_model = self.resolve_model(model)
         
         print(f"\n📝 开始生成笔记...")
         print(f"🤖 使用模型: {selected_model}")
@@ -124,134 +145,76 @@ class AIService:
         if account_name:
             print(f"👤 账号信息: {account_name} ({account_type}) - {platform}")
         
-        # 构建系统提示词
-        system_prompt = """你是一个专业的小红书内容创作专家，擅长根据用户需求生成高质量的小红书图文笔记。
-
-请严格按照以下JSON格式返回结果：
-{
-    "note_title": "笔记标题（吸引人的标题，包含emoji）",
-    "note_content": "笔记正文（包含多个段落，使用emoji和换行符，适合小红书风格）",
-    "comment_guide": "评论区引导文案（鼓励用户互动的文案）",
-    "comment_questions": "评论区问题（3-5个引导性问题，用换行符分隔）"
-}
-
-要求：
-1. 标题要有吸引力，包含相关emoji
-2. 正文要符合指定的写作风格，多使用emoji，分段清晰
-3. 内容要针对目标受众，符合指定的内容类型
-4. 如果有近期热梗，要巧妙融入内容中
-5. 评论引导要能激发用户参与
-6. 问题要具体且容易回答
-7. 整体内容要围绕笔记目的展开
-8. 如果提供了账号信息，要根据账号类型和常驻话题优化内容风格和关键词"""
-        
-        # 构建用户提示词
-        user_prompt = f"""请根据以下信息生成小红书笔记：
-
-基本内容：{basic_content}
-"""
-        
-        # 添加账号信息到提示词中
-        if account_name or account_type or topic_keywords or platform:
-            user_prompt += "\n账号信息：\n"
-            if account_name:
-                user_prompt += f"账号名称：{account_name}\n"
-            if account_type:
-                user_prompt += f"账号类型：{account_type}\n"
-            if platform:
-                user_prompt += f"发布平台：{platform}\n"
-            if topic_keywords:
-                user_prompt += f"常驻话题关键词：{topic_keywords}\n"
-                user_prompt += "请结合这些关键词优化内容，使其更符合该账号的定位和风格。\n"
-        
-        if note_purpose:
-            user_prompt += f"笔记目的：{note_purpose}\n"
-        if recent_trends:
-            user_prompt += f"近期热梗：{recent_trends}\n"
-        if writing_style:
-            user_prompt += f"写作风格：{writing_style}\n"
-        if target_audience:
-            user_prompt += f"目标受众：{target_audience}\n"
-        if content_type:
-            user_prompt += f"内容类型：{content_type}\n"
-        if reference_links:
-            user_prompt += f"参考链接：{reference_links}\n"
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
+        # 使用预编译模板构建提示词（超出预算时裁剪可选段落）
+        rendered = self.build_note_prompt(
+            basic_content,
+            note_purpose=note_purpose,
+            recent_trends=recent_trends,
+            writing_style=writing_style,
+            target_audience=target_audience,
+            content_type=content_type,
+            reference_links=reference_links,
+            account_name=account_name,
+            account_type=account_type,
+            topic_keywords=topic_keywords,
+            platform=platform,
+            account_block=account_block
+        )
+        messages = rendered["messages"]
+        if rendered["trimmed"]:
+            print(f"✂️ 提示词超出预算，已裁剪: {rendered['trimmed']}")
 
         try:
-            response = await self._call_one_api(selected_model, messages)
-            
-            # 解析AI返回的内容
-            content = response['choices'][0]['message']['content']
+            start_time = time.perf_counter()
+            if variants > 1:
+                results = await llm_gateway.chat_completion_variants(
+                    selected_model, messages, variants, temperature=0.7, max_tokens=2000
+                )
+            else:
+                response = await self._call_one_api(selected_model, messages)
+                results = [{
+                    "content": llm_gateway.extract_content(response),
+                    "total_tokens": (response.get('usage') or {}).get('total_tokens')
+                }]
+            latency_ms = int((time.perf_counter() - start_time) * 1000)
             
             print(f"✅ 内容生成成功，正在解析...")
             
-            # 尝试解析JSON响应
-            try:
-                import json
-                import re
-                
-                print(f"🔍 原始AI响应内容: {content[:200]}...")
-                
-                # 方法1: 尝试直接解析整个内容为JSON
-                try:
-                    parsed_content = json.loads(content.strip())
-                    if isinstance(parsed_content, dict) and 'note_title' in parsed_content:
-                        print(f"✨ 直接JSON解析成功！")
-                        print(f"📌 标题: {parsed_content.get('note_title', '')}")
-                        return parsed_content
-                except json.JSONDecodeError:
-                    pass
-                
-                # 方法2: 查找JSON代码块（```json 或 ```）
-                json_block_patterns = [
-                    r'```json\s*(\{.*?\})\s*```',
-                    r'```\s*(\{.*?\})\s*```',
-                    r'(\{[^{}]*"note_title"[^{}]*\})'
-                ]
-                
-                for pattern in json_block_patterns:
-                    json_matches = re.findall(pattern, content, re.DOTALL | re.IGNORECASE)
-                    for json_match in json_matches:
-                        try:
-                            parsed_content = json.loads(json_match.strip())
-                            if isinstance(parsed_content, dict) and 'note_title' in parsed_content:
-                                print(f"✨ JSON代码块解析成功！")
-                                print(f"📌 标题: {parsed_content.get('note_title', '')}")
-                                return parsed_content
-                        except json.JSONDecodeError:
-                            continue
-                
-                # 方法3: 查找更复杂的JSON结构（支持嵌套）
-                json_pattern = r'\{(?:[^{}]|{[^{}]*})*\}'
-                json_matches = re.findall(json_pattern, content, re.DOTALL)
-                
-                for json_match in json_matches:
-                    try:
-                        parsed_content = json.loads(json_match)
-                        if isinstance(parsed_content, dict) and 'note_title' in parsed_content:
-                            print(f"✨ 复杂JSON结构解析成功！")
-                            print(f"📌 标题: {parsed_content.get('note_title', '')}")
-                            return parsed_content
-                    except json.JSONDecodeError:
-                        continue
-                
-                # 如果所有JSON解析都失败，使用备用解析方法
-                print("⚠️ JSON解析失败，使用备用解析方法")
-                return self._parse_fallback_content(content)
-                    
-            except Exception as e:
-                print(f"⚠️ JSON解析异常: {str(e)}，使用备用解析方法")
-                return self._parse_fallback_content(content)
+            notes = []
+            for result in results:
+                # 解析AI返回的内容
+                note = self._parse_note_content(result["content"])
+                # 附带调用耗时与token用量，供统计使用
+                note['latency_ms'] = latency_ms
+                note['total_tokens'] = result["total_tokens"]
+                note['model'] = selected_model
+                notes.append(note)
+            return notes
             
         except Exception as e:
             print(f"❌ 生成笔记失败: {str(e)}")
             raise
 
+    def _parse_note_content(self, content: str) -> Dict[str, str]:
+        """解析AI返回的笔记内容"""
+        # 尝试解析JSON响应
+        try:
+            print(f"🔍 原始AI响应内容: {content[:200]}...")
+            
+            parsed_content = llm_gateway.parse_json_object(content, required_key='note_title')
+            if parsed_content is not None:
+                print(f"✨ JSON解析成功！")
+                print(f"📌 标题: {parsed_content.get('note_title', '')}")
+                return parsed_content
+            
+            # 如果所有JSON解析都失败，使用备用解析方法
+            print("⚠️ JSON解析失败，使用备用解析方法")
+            return self._parse_fallback_content(content)
+                
+        except Exception as e:
+            print(f"⚠️ JSON解析异常: {str(e)}，使用备用解析方法")
+            return self._parse_fallback_content(content)
+
     def _parse_fallback_content(self, content: str) -> Dict[str, str]:
         """备用内容解析方法"""
         print("🔄 使用备用解析方法...")
@@ -333,6 +296,10 @@ class AIService:
         return [
             {"value": model.value, "label": self._get_model_display_name(model.value)}
             for model in AIModel
+        ] + [
+            {"value": "auto", "label": "自动选择（综合速度与质量）"},
+            {"value": "auto:fast", "label": "自动选择（速度优先）"},
+            {"value": "auto:quality", "label": "自动选择（质量优先）"}
         ]
 
     def _get_model_display_name(self, model: str) -> str:
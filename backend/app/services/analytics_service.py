@@ -0,0 +1,214 @@
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Any, List, Optional, Set
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app.models import NoteDailyStat, XiaohongshuNote
+
+# 支持的分组维度 -> 汇总表字段
+GROUP_DIMENSIONS = {
+    "day": NoteDailyStat.stat_date,
+    "model": NoteDailyStat.model,
+    "platform": NoteDailyStat.platform,
+    "account": NoteDailyStat.account_id,
+}
+
+REBUILD_SQL = """
+INSERT INTO note_daily_stats (
+    stat_date, model, platform, account_id, note_count, regenerate_count,
+    latency_ms_sum, latency_samples, tokens_sum, token_samples
+)
+SELECT
+    CAST(created_at AS DATE),
+    COALESCE(model, ''),
+    COALESCE(input_platform, ''),
+    COALESCE(input_selected_account_id, 0),
+    COUNT(*),
+    SUM(CASE WHEN is_regenerate THEN 1 ELSE 0 END),
+    COALESCE(SUM(latency_ms), 0),
+    COUNT(latency_ms),
+    COALESCE(SUM(total_tokens), 0),
+    COUNT(total_tokens)
+FROM (
+    SELECT
+        created_at, model, input_platform, input_selected_account_id, latency_ms, total_tokens,
+        input_fingerprint IS NOT NULL
+            AND created_at > MIN(created_at) OVER (PARTITION BY input_fingerprint) AS is_regenerate
+    FROM xiaohongshu_notes
+    WHERE created_at IS NOT NULL
+) notes
+GROUP BY 1, 2, 3, 4
+"""
+
+
+class AnalyticsService:
+    """笔记统计服务
+
+    统计数据保存在 note_daily_stats 汇总表中，随笔记写入和删除在同一事务内增量维护，
+    查询只读取汇总表，不扫描 xiaohongshu_notes。
+    """
+
+    def record_notes(self, db: Session, notes: List[Dict[str, Any]], existing_fingerprints: Set[str]) -> None:
+        """把一批新写入的笔记累加到汇总表（不提交事务）
+
+        existing_fingerprints 为写入前已存在的输入指纹，命中即视为重新生成。
+        """
+        buckets: Dict[tuple, Dict[str, int]] = defaultdict(lambda: {
+            "note_count": 0,
+            "regenerate_count": 0,
+            "latency_ms_sum": 0,
+            "latency_samples": 0,
+            "tokens_sum": 0,
+            "token_samples": 0,
+        })
+
+        for note in notes:
+            created_at = note.get("created_at")
+            if created_at is None:
+                continue
+            key = (
+                created_at.date(),
+                note.get("model") or "",
+                note.get("input_platform") or "",
+                note.get("input_selected_account_id") or 0,
+            )
+            bucket = buckets[key]
+            bucket["note_count"] += 1
+            if note.get("input_fingerprint") in existing_fingerprints:
+                bucket["regenerate_count"] += 1
+            if note.get("latency_ms") is not None:
+                bucket["latency_ms_sum"] += note["latency_ms"]
+                bucket["latency_samples"] += 1
+            if note.get("total_tokens") is not None:
+                bucket["tokens_sum"] += note["total_tokens"]
+                bucket["token_samples"] += 1
+
+        if not buckets:
+            return
+
+        rows = [
+            {"stat_date": key[0], "model": key[1], "platform": key[2], "account_id": key[3], **values}
+            for key, values in buckets.items()
+        ]
+        stmt = pg_insert(NoteDailyStat).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_note_daily_stats_key",
+            set_={
+                field: getattr(NoteDailyStat, field) + getattr(stmt.excluded, field)
+                for field in (
+                    "note_count", "regenerate_count", "latency_ms_sum",
+                    "latency_samples", "tokens_sum", "token_samples"
+                )
+            }
+        )
+        db.execute(stmt)
+
+    @staticmethod
+    def _bucket_filter(query, stat_date: date, model: Optional[str], platform: Optional[str], account_id: Optional[int]):
+        return query.filter(
+            NoteDailyStat.stat_date == stat_date,
+            NoteDailyStat.model == (model or ""),
+            NoteDailyStat.platform == (platform or ""),
+            NoteDailyStat.account_id == (account_id or 0),
+        )
+
+    def remove_note(self, db: Session, note: XiaohongshuNote) -> None:
+        """从汇总表中扣除一条即将删除的笔记（不提交事务），结果与 rebuild 一致
+
+        同一输入指纹中最早的笔记不算重新生成；删除它后，剩余笔记中最早的一批不再算作重新生成。
+        """
+        if note.created_at is None:
+            return
+        is_regenerate = False
+        if note.input_fingerprint:
+            same_input = db.query(XiaohongshuNote).filter(
+                XiaohongshuNote.input_fingerprint == note.input_fingerprint,
+                XiaohongshuNote.id != note.id
+            )
+            earliest = same_input.with_entities(func.min(XiaohongshuNote.created_at)).scalar()
+            if earliest is not None and earliest < note.created_at:
+                is_regenerate = True
+            elif earliest is not None and earliest > note.created_at:
+                promoted = (
+                    same_input.filter(XiaohongshuNote.created_at == earliest)
+                    .with_entities(
+                        XiaohongshuNote.created_at, XiaohongshuNote.model, XiaohongshuNote.input_platform,
+                        XiaohongshuNote.input_selected_account_id, func.count()
+                    )
+                    .group_by(
+                        XiaohongshuNote.created_at, XiaohongshuNote.model, XiaohongshuNote.input_platform,
+                        XiaohongshuNote.input_selected_account_id
+                    )
+                    .all()
+                )
+                for created_at, model, platform, account_id, count in promoted:
+                    self._bucket_filter(db.query(NoteDailyStat), created_at.date(), model, platform, account_id).update(
+                        {NoteDailyStat.regenerate_count: NoteDailyStat.regenerate_count - count},
+                        synchronize_session=False
+                    )
+
+        has_latency = note.latency_ms is not None
+        has_tokens = note.total_tokens is not None
+        self._bucket_filter(
+            db.query(NoteDailyStat), note.created_at.date(), note.model, note.input_platform, note.input_selected_account_id
+        ).update({
+            NoteDailyStat.note_count: NoteDailyStat.note_count - 1,
+            NoteDailyStat.regenerate_count: NoteDailyStat.regenerate_count - int(is_regenerate),
+            NoteDailyStat.latency_ms_sum: NoteDailyStat.latency_ms_sum - (note.latency_ms or 0),
+            NoteDailyStat.latency_samples: NoteDailyStat.latency_samples - int(has_latency),
+            NoteDailyStat.tokens_sum: NoteDailyStat.tokens_sum - (note.total_tokens or 0),
+            NoteDailyStat.token_samples: NoteDailyStat.token_samples - int(has_tokens),
+        }, synchronize_session=False)
+
+    def get_stats(
+        self,
+        db: Session,
+        group_by: List[str],
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None
+    ) -> List[Dict[str, Any]]:
+        """按指定维度查询汇总统计"""
+        columns = [GROUP_DIMENSIONS[dimension] for dimension in group_by]
+        note_count = func.sum(NoteDailyStat.note_count)
+        regenerate_count = func.sum(NoteDailyStat.regenerate_count)
+        latency_ms_sum = func.sum(NoteDailyStat.latency_ms_sum)
+        latency_samples = func.sum(NoteDailyStat.latency_samples)
+        tokens_sum = func.sum(NoteDailyStat.tokens_sum)
+        token_samples = func.sum(NoteDailyStat.token_samples)
+
+        query = db.query(
+            *columns,
+            note_count, regenerate_count, latency_ms_sum, latency_samples, tokens_sum, token_samples
+        )
+        if start_date:
+            query = query.filter(NoteDailyStat.stat_date >= start_date)
+        if end_date:
+            query = query.filter(NoteDailyStat.stat_date <= end_date)
+        if columns:
+            query = query.group_by(*columns).order_by(*columns)
+
+        result = []
+        for row in query.all():
+            values = list(row)
+            item = dict(zip(group_by, values[:len(columns)]))
+            count, regenerates, latency_sum, latency_n, tokens, tokens_n = [int(v or 0) for v in values[len(columns):]]
+            item.update({
+                "note_count": count,
+                "regenerate_count": regenerates,
+                "regenerate_rate": round(regenerates / count, 4) if count else 0.0,
+                "avg_latency_ms": round(latency_sum / latency_n, 1) if latency_n else None,
+                "avg_tokens": round(tokens / tokens_n, 1) if tokens_n else None,
+            })
+            result.append(item)
+        return result
+
+    def rebuild(self, db: Session) -> None:
+        """根据 xiaohongshu_notes 全量重建汇总表"""
+        db.execute(text("DELETE FROM note_daily_stats"))
+        db.execute(text(REBUILD_SQL))
+        db.commit()
+
+
+# 创建服务实例
+analytics_service = AnalyticsService()
@@ -0,0 +1,106 @@
+import csv
+import io
+import json
+import zlib
+from typing import Dict, Any, Iterator
+from app.db import SessionLocal
+from app.models import XiaohongshuNote
+from app import crud
+
+# 导出字段（与 NoteOut 一致）
+EXPORT_FIELDS = [
+    "id",
+    "input_basic_content",
+    "input_note_purpose",
+    "input_recent_trends",
+    "input_writing_style",
+    "input_target_audience",
+    "input_content_type",
+    "input_reference_links",
+    "input_account_name",
+    "input_account_type",
+    "input_topic_keywords",
+    "input_platform",
+    "input_selected_account_id",
+    "note_title",
+    "note_content",
+    "comment_guide",
+    "comment_questions",
+    "model",
+    "created_at",
+    "updated_at",
+]
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+class ExportService:
+    """笔记流式导出
+
+    通过服务端游标（yield_per）分批读取，按块编码并可选 gzip 压缩，
+    内存占用与导出总量无关。
+    """
+
+    def __init__(self, batch_size: int = 1000, chunk_size: int = 64 * 1024):
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+
+    def _iter_rows(self, filters: Dict[str, Any]) -> Iterator[tuple]:
+        """使用独立 session 和服务端游标逐行读取"""
+        db = SessionLocal()
+        try:
+            columns = [getattr(XiaohongshuNote, field) for field in EXPORT_FIELDS]
+            query = crud.filter_notes(db.query(*columns), **filters).order_by(XiaohongshuNote.id)
+            for row in query.yield_per(self.batch_size):
+                yield row
+        finally:
+            db.close()
+
+    def _iter_ndjson(self, filters: Dict[str, Any]) -> Iterator[str]:
+        for row in self._iter_rows(filters):
+            yield json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False, default=str) + "\n"
+
+    def _iter_csv(self, filters: Dict[str, Any]) -> Iterator[str]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # 写入 BOM 便于 Excel 识别中文
+        buffer.write("\ufeff")
+        writer.writerow(EXPORT_FIELDS)
+        for row in self._iter_rows(filters):
+            writer.writerow(["" if value is None else value for value in row])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+        yield buffer.getvalue()
+
+    def stream_notes(self, filters: Dict[str, Any], export_format: str = "ndjson", compress: bool = False) -> Iterator[bytes]:
+        """按块生成导出内容"""
+        lines = self._iter_csv(filters) if export_format == "csv" else self._iter_ndjson(filters)
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+
+        pending = []
+        pending_size = 0
+        for line in lines:
+            data = line.encode("utf-8")
+            pending.append(data)
+            pending_size += len(data)
+            if pending_size >= self.chunk_size:
+                chunk = b"".join(pending)
+                pending, pending_size = [], 0
+                if compressor:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    yield chunk
+
+        chunk = b"".join(pending)
+        if compressor:
+            chunk = compressor.compress(chunk) + compressor.flush()
+        if chunk:
+            yield chunk
+
+
+# 创建服务实例
+export_service = ExportService()
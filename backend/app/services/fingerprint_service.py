@@ -0,0 +1,235 @@
+import hashlib
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from app.models import XiaohongshuNote
+
+# 参与输入指纹计算的字段（顺序固定）
+INPUT_FIELDS = [
+    "input_basic_content",
+    "input_note_purpose",
+    "input_recent_trends",
+    "input_writing_style",
+    "input_target_audience",
+    "input_content_type",
+    "input_reference_links",
+    "input_account_name",
+    "input_account_type",
+    "input_topic_keywords",
+    "input_platform",
+    "input_selected_account_id",
+]
+
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 4
+BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+# 分段查找只能保证找到海明距离不超过（分段数-1）的笔记
+MAX_DETECTABLE_DISTANCE = SIMHASH_BANDS - 1
+_MASK = (1 << SIMHASH_BITS) - 1
+
+
+class FingerprintService:
+    def __init__(self):
+        """初始化笔记指纹服务"""
+        # 海明距离不超过该值视为近似重复；4个16位分段可保证距离<=3的笔记至少命中一个分段
+        self.max_distance = int(os.getenv("NOTE_DUPLICATE_MAX_DISTANCE", str(MAX_DETECTABLE_DISTANCE)))
+        if not 0 <= self.max_distance <= MAX_DETECTABLE_DISTANCE:
+            raise ValueError(f"NOTE_DUPLICATE_MAX_DISTANCE 取值范围为 0-{MAX_DETECTABLE_DISTANCE}，当前为 {self.max_distance}")
+        self.shingle_size = int(os.getenv("NOTE_SIMHASH_SHINGLE_SIZE", "3"))
+        self.band_columns = [
+            XiaohongshuNote.simhash_band_0,
+            XiaohongshuNote.simhash_band_1,
+            XiaohongshuNote.simhash_band_2,
+            XiaohongshuNote.simhash_band_3,
+        ]
+
+    @staticmethod
+    def _normalize(text: Optional[str]) -> str:
+        """归一化文本：小写并去除空白和标点"""
+        if not text:
+            return ""
+        return re.sub(r"[\W_]+", "", text.lower())
+
+    @staticmethod
+    def _sha256(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def input_fingerprint(self, note: Dict[str, Any]) -> str:
+        """根据生成输入计算精确指纹"""
+        parts = []
+        for field in INPUT_FIELDS:
+            value = note.get(field)
+            parts.append(self._normalize(str(value)) if value is not None else "")
+        return self._sha256("\x1f".join(parts))
+
+    def content_fingerprint(self, note_title: Optional[str], note_content: Optional[str]) -> str:
+        """根据生成结果计算精确指纹"""
+        return self._sha256(self._normalize(note_title) + "\x1f" + self._normalize(note_content))
+
+    def simhash(self, text: str) -> int:
+        """计算字符 n-gram 的 64 位 SimHash（无符号）"""
+        normalized = self._normalize(text)
+        if not normalized:
+            return 0
+
+        k = self.shingle_size
+        if len(normalized) <= k:
+            shingles = Counter([normalized])
+        else:
+            shingles = Counter(normalized[i:i + k] for i in range(len(normalized) - k + 1))
+
+        weights = [0] * SIMHASH_BITS
+        for shingle, count in shingles.items():
+            value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+            for bit in range(SIMHASH_BITS):
+                if (value >> bit) & 1:
+                    weights[bit] += count
+                else:
+                    weights[bit] -= count
+
+        result = 0
+        for bit, weight in enumerate(weights):
+            if weight > 0:
+                result |= 1 << bit
+        return result
+
+    @staticmethod
+    def to_signed(value: int) -> int:
+        """无符号64位转为 PostgreSQL BIGINT 可存储的有符号值"""
+        return value - (1 << SIMHASH_BITS) if value >= (1 << (SIMHASH_BITS - 1)) else value
+
+    @staticmethod
+    def simhash_bands(value: int) -> List[int]:
+        """把 SimHash 切分为若干16位分段，用于索引候选查找"""
+        value &= _MASK
+        return [(value >> (BAND_BITS * i)) & ((1 << BAND_BITS) - 1) for i in range(SIMHASH_BANDS)]
+
+    @staticmethod
+    def hamming_distance(a: int, b: int) -> int:
+        return bin((a ^ b) & _MASK).count("1")
+
+    def fingerprint_note(self, note: Dict[str, Any]) -> Dict[str, Any]:
+        """计算一条笔记需要写入数据库的全部指纹字段"""
+        simhash = self.simhash(f"{note.get('note_title') or ''}\n{note.get('note_content') or ''}")
+        bands = self.simhash_bands(simhash)
+        return {
+            "input_fingerprint": self.input_fingerprint(note),
+            "content_fingerprint": self.content_fingerprint(note.get("note_title"), note.get("note_content")),
+            "content_simhash": self.to_signed(simhash),
+            "simhash_band_0": bands[0],
+            "simhash_band_1": bands[1],
+            "simhash_band_2": bands[2],
+            "simhash_band_3": bands[3],
+        }
+
+    def find_similar_notes(
+        self,
+        db: Session,
+        fingerprints: Dict[str, Any],
+        account_id: Optional[int] = None,
+        max_distance: Optional[int] = None,
+        limit: int = 20
+    ) -> List[Dict[str, Any]]:
+        """在账号历史中查找与给定指纹近似重复的笔记
+
+        先通过分段索引取候选，再只对候选计算海明距离，不做全量两两比较。
+        account_id 为 None 时查找未关联账号的笔记，查询同样以账号为前缀走 (账号, 分段) 索引。
+        """
+        max_distance = self.max_distance if max_distance is None else max_distance
+        bands = [fingerprints[f"simhash_band_{i}"] for i in range(SIMHASH_BANDS)]
+
+        query = db.query(XiaohongshuNote.id, XiaohongshuNote.content_simhash, XiaohongshuNote.content_fingerprint).filter(
+            or_(
+                XiaohongshuNote.content_fingerprint == fingerprints["content_fingerprint"],
+                *[column == band for column, band in zip(self.band_columns, bands)]
+            )
+        )
+        if account_id is None:
+            query = query.filter(XiaohongshuNote.input_selected_account_id.is_(None))
+        else:
+            query = query.filter(XiaohongshuNote.input_selected_account_id == account_id)
+
+        similar = []
+        for note_id, simhash, content_fingerprint in query.all():
+            if content_fingerprint == fingerprints["content_fingerprint"]:
+                distance = 0
+            elif simhash is None:
+                continue
+            else:
+                distance = self.hamming_distance(simhash, fingerprints["content_simhash"])
+            if distance <= max_distance:
+                similar.append({"id": note_id, "distance": distance})
+
+        similar.sort(key=lambda item: (item["distance"], item["id"]))
+        return similar[:limit]
+
+    def find_duplicate_clusters(
+        self,
+        db: Session,
+        account_id: Optional[int] = None,
+        max_distance: Optional[int] = None,
+        min_size: int = 2
+    ) -> List[Dict[str, Any]]:
+        """列出近似重复的笔记簇
+
+        按 SimHash 分段分桶，仅在同一桶内比较，并用并查集合并成簇。
+        """
+        max_distance = self.max_distance if max_distance is None else max_distance
+
+        query = db.query(
+            XiaohongshuNote.id,
+            XiaohongshuNote.input_selected_account_id,
+            XiaohongshuNote.content_simhash
+        ).filter(XiaohongshuNote.content_simhash.isnot(None))
+        if account_id is not None:
+            query = query.filter(XiaohongshuNote.input_selected_account_id == account_id)
+
+        # 相同 SimHash 的笔记直接归为一组，桶内只比较不同的 SimHash 值
+        ids_by_hash: Dict[Tuple[Optional[int], int], List[int]] = defaultdict(list)
+        for note_id, note_account_id, simhash in query.yield_per(10000):
+            ids_by_hash[(note_account_id, simhash & _MASK)].append(note_id)
+
+        keys = list(ids_by_hash.keys())
+        parent = list(range(len(keys)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        buckets: Dict[Tuple[Optional[int], int, int], List[int]] = defaultdict(list)
+        for index, (note_account_id, simhash) in enumerate(keys):
+            for band_index, band in enumerate(self.simhash_bands(simhash)):
+                buckets[(note_account_id, band_index, band)].append(index)
+
+        for members in buckets.values():
+            for i, left in enumerate(members):
+                for right in members[i + 1:]:
+                    if find(left) == find(right):
+                        continue
+                    if self.hamming_distance(keys[left][1], keys[right][1]) <= max_distance:
+                        parent[find(left)] = find(right)
+
+        clusters: Dict[int, List[int]] = defaultdict(list)
+        for index, key in enumerate(keys):
+            clusters[find(index)].extend(ids_by_hash[key])
+
+        result = []
+        for root, note_ids in clusters.items():
+            if len(note_ids) < min_size:
+                continue
+            result.append({
+                "account_id": keys[root][0],
+                "size": len(note_ids),
+                "note_ids": sorted(note_ids)
+            })
+        result.sort(key=lambda cluster: cluster["size"], reverse=True)
+        return result
+
+
+# 创建服务实例
+fingerprint_service = FingerprintService()
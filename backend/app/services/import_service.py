@@ -0,0 +1,159 @@
+import csv
+import io
+import json
+import re
+from datetime import datetime
+from typing import Dict, Any, Iterator, List, Optional, Tuple, Callable, BinaryIO
+from pydantic import BaseModel, ValidationError
+from sqlalchemy.orm import Session
+from app import crud
+from app.schemas import ClientAccountCreate, NoteImport
+
+IMPORT_FORMATS = ("csv", "ndjson")
+
+
+class ImportService:
+    """客户账号与历史笔记批量导入
+
+    上传文件逐行读取和校验，按块批量写入，每块一个事务；块写入失败时二分重试定位失败的行。
+    校验或写入失败的行记录到错误报告中，不影响其他行。
+    """
+
+    def __init__(self, chunk_size: int = 1000, max_errors: int = 1000):
+        self.chunk_size = chunk_size
+        # 错误报告最多保留的条数，避免大文件全部出错时响应过大
+        self.max_errors = max_errors
+
+    @staticmethod
+    def detect_format(filename: Optional[str], import_format: Optional[str] = None) -> Optional[str]:
+        """根据参数或文件扩展名判断导入格式"""
+        if import_format:
+            return import_format if import_format in IMPORT_FORMATS else None
+        name = (filename or "").lower()
+        if name.endswith(".csv"):
+            return "csv"
+        if name.endswith((".ndjson", ".jsonl", ".json")):
+            return "ndjson"
+        return None
+
+    @staticmethod
+    def _iter_records(file: BinaryIO, import_format: str) -> Iterator[Tuple[int, Any]]:
+        """逐行读取上传文件，返回 (行号, 记录)"""
+        stream = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+        if import_format == "csv":
+            reader = csv.DictReader(stream)
+            for record in reader:
+                # 表头占第1行
+                yield reader.line_num, {key: (value if value != "" else None) for key, value in record.items()}
+        else:
+            for line_number, line in enumerate(stream, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_number, e
+
+    @staticmethod
+    def _parse_keywords(value: Any) -> Any:
+        """CSV 中的关键词支持 JSON 数组或逗号/顿号分隔"""
+        if not isinstance(value, str):
+            return value
+        value = value.strip()
+        if value.startswith("["):
+            return json.loads(value)
+        return [keyword.strip() for keyword in re.split(r"[,，、;；]", value) if keyword.strip()]
+
+    def _run_import(
+        self,
+        file: BinaryIO,
+        import_format: str,
+        schema: Callable[..., BaseModel],
+        prepare: Callable[[Dict[str, Any]], Dict[str, Any]],
+        write_chunk: Callable[[List[Dict[str, Any]]], Any]
+    ) -> Dict[str, Any]:
+        imported = 0
+        failed = 0
+        errors: List[Dict[str, Any]] = []
+
+        def record_error(line_number: int, message: str):
+            nonlocal failed
+            failed += 1
+            if len(errors) < self.max_errors:
+                errors.append({"row": line_number, "error": message})
+
+        def flush(chunk: List[Tuple[int, Dict[str, Any]]]):
+            nonlocal imported
+            if not chunk:
+                return
+            try:
+                write_chunk([record for _, record in chunk])
+                imported += len(chunk)
+            except Exception as e:
+                if len(chunk) == 1:
+                    record_error(chunk[0][0], f"写入失败: {str(e).splitlines()[0]}")
+                    return
+                # 整块回滚后二分重试（每次写入各自一个事务），只把真正写不进去的行记为失败
+                middle = len(chunk) // 2
+                flush(chunk[:middle])
+                flush(chunk[middle:])
+
+        chunk: List[Tuple[int, Dict[str, Any]]] = []
+        for line_number, record in self._iter_records(file, import_format):
+            if isinstance(record, Exception):
+                record_error(line_number, f"JSON格式错误: {record}")
+                continue
+            if not isinstance(record, dict):
+                record_error(line_number, "每行必须是一个JSON对象")
+                continue
+            try:
+                chunk.append((line_number, prepare(schema(**record).dict())))
+            except ValidationError as e:
+                record_error(line_number, "; ".join(
+                    f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors()
+                ))
+                continue
+            except (ValueError, TypeError) as e:
+                record_error(line_number, str(e))
+                continue
+
+            if len(chunk) >= self.chunk_size:
+                flush(chunk)
+                chunk = []
+        flush(chunk)
+
+        return {
+            "imported": imported,
+            "failed": failed,
+            "errors": errors,
+            "errors_truncated": failed > len(errors)
+        }
+
+    def import_client_accounts(self, db: Session, file: BinaryIO, import_format: str) -> Dict[str, Any]:
+        """导入客户账号"""
+        def validate(**record) -> ClientAccountCreate:
+            if "topic_keywords" in record:
+                record["topic_keywords"] = self._parse_keywords(record["topic_keywords"])
+            return ClientAccountCreate(**record)
+
+        return self._run_import(
+            file, import_format, validate, lambda account: account,
+            lambda accounts: crud.bulk_create_client_accounts(db, accounts)
+        )
+
+    def import_notes(self, db: Session, file: BinaryIO, import_format: str) -> Dict[str, Any]:
+        """导入历史笔记"""
+        def prepare(note: Dict[str, Any]) -> Dict[str, Any]:
+            # 多行 INSERT 要求每行字段一致，缺失的创建时间使用导入时间
+            if note.get("created_at") is None:
+                note["created_at"] = datetime.now()
+            return note
+
+        return self._run_import(
+            file, import_format, NoteImport, prepare,
+            lambda notes: crud.bulk_create_notes(db, notes)
+        )
+
+
+# 创建服务实例
+import_service = ImportService()
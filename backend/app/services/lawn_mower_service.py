@@ -1,30 +1,21 @@
-import httpx
+import asyncio
 import json
 import os
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, AsyncIterator, Optional, List, Tuple
 import re
+from app import deadline
+from app.services.llm_gateway import llm_gateway
+from app.services.race_store import race_store
+from app.services.prompt_templates import render_lawn_mower_prompt
 
 class LawnMowerService:
     def __init__(self):
-        # 使用 One-API 配置，与 ai_service.py 保持一致
-        self.one_api_url = os.getenv("ONE_API_URL", "https://your-remote-oneapi-service.com").rstrip('/')
-        self.api_key = os.getenv("ONE_API_KEY")
-        
-        # 模型映射到One-API中的实际模型名称，与 ai_service.py 保持一致
-        self.model_mapping = {
-            'claude-3-5-sonnet-latest': 'claude-3-5-sonnet-latest',
-            'claude-sonnet-4-20250514': 'claude-sonnet-4-20250514',
-            'gpt-4o': 'gpt-4o',
-            'deepseek-r1': 'deepseek-r1',
-            'glm-4': 'glm-4'
-        }
+        # 上游地址、模型映射与连接池由统一网关管理（与 ai_service.py 共享）
         
         # 加载产品数据
         self.products_data = self._load_products_data()
         
         print(f"🤖 割草机服务已初始化")
-        print(f"📡 One-API地址: {self.one_api_url}")
-        print(f"🔑 API Key: {self.api_key[:10]}...{self.api_key[-10:] if self.api_key else 'None'}")
         
     def _load_products_data(self) -> Dict[str, Any]:
         """加载产品数据"""
@@ -40,64 +31,10 @@ class LawnMowerService:
             print(f"Failed to load products data: {e}")
             return {}
     
-    def _get_headers(self) -> Dict[str, str]:
-        """获取请求头"""
-        return {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
-        }
-
     async def _call_one_api(self, model: str, messages: list, temperature: float = 0.7) -> Dict[Any, Any]:
-        """调用One-API服务"""
-        headers = self._get_headers()
-        
-        # 获取实际的模型名称
-        actual_model = self.model_mapping.get(model, model)
-        
-        request_data = {
-            "model": actual_model,
-            "messages": messages,
-            "temperature": temperature,
-            "max_tokens": 3000
-        }
+        """通过统一网关调用模型"""
+        return await llm_gateway.chat_completion(model, messages, temperature=temperature, max_tokens=3000)
 
-        print(f"🚀 正在调用AI模型...")
-        print(f"📝 模型: {model} -> {actual_model}")
-        print(f"🌐 请求URL: {self.one_api_url}/v1/chat/completions")
-        
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            try:                
-                response = await client.post(
-                    f"{self.one_api_url}/v1/chat/completions",
-                    headers=headers,
-                    json=request_data
-                )
-                
-                print(f"📊 响应状态码: {response.status_code}")
-                
-                if response.status_code != 200:
-                    error_text = response.text
-                    print(f"❌ API响应错误: {error_text}")
-                    raise httpx.HTTPStatusError(f"HTTP {response.status_code}: {error_text}", request=response.request, response=response)
-                
-                response_data = response.json()
-                print(f"✅ API调用成功！")
-                
-                return response_data
-                
-            except httpx.HTTPStatusError as e:
-                error_msg = f"HTTP错误 {e.response.status_code}: {e.response.text if hasattr(e, 'response') else str(e)}"
-                print(f"❌ {error_msg}")
-                raise Exception(error_msg)
-            except httpx.RequestError as e:
-                error_msg = f"请求错误: {str(e)}"
-                print(f"❌ {error_msg}")
-                raise Exception(error_msg)
-            except Exception as e:
-                error_msg = f"未知错误: {str(e)}"
-                print(f"❌ {error_msg}")
-                raise Exception(error_msg)
-    
     def _get_product_specs(self, spu: str, sku: Optional[str] = None) -> str:
         """根据SPU和SKU获取产品规格详情"""
         try:
@@ -159,10 +96,11 @@ class LawnMowerService:
         user_persona: str = "",
         content_style: str = "",
         holiday_season: Optional[str] = None,
-        ai_model: List[str] = None
+        ai_model: List[str] = None,
+        variants: int = 1
     ) -> Dict[str, Any]:
         """
-        调用One-API生成割草机推广内容
+        调用One-API生成割草机推广内容，variants > 1 时每个模型返回多个候选
         """
         try:
             # 处理AI模型参数
@@ -172,8 +110,8 @@ class LawnMowerService:
             # 获取产品规格详情
             product_specs = self._get_product_specs(spu, sku)
             
-            # 检查API key是否配置
-            if not self.api_key:
+            # 检查API key是否配置（回放模式不需要）
+            if not llm_gateway.configured:
                 print("⚠️ 未配置 ONE_API_KEY，返回备用内容")
                 return {
                     "success": True,
@@ -185,8 +123,8 @@ class LawnMowerService:
                     )
                 }
             
-            # 构建提示词
-            prompt = self._build_prompt(
+            # 使用按语言预编译的模板构建提示词
+            rendered = self.build_prompt(
                 spu, sku, language, target_platform, opening_hook,
                 narrative_perspective, content_logic, value_proposition,
                 key_selling_points, specific_scenario, user_persona,
@@ -197,32 +135,19 @@ class LawnMowerService:
             results = []
             for model in ai_model:
                 try:
-                    print(f"🎯 正在使用模型 {model} 生成内容...")
-                    
-                    messages = [
-                        {
-                            "role": "system",
-                            "content": "你是一位资深的内容运营专家，深耕智能家居与户外科技领域，专为库犸科技Mammotion品牌服务，擅长通过生活化内容拉近用户与智能割草机器人的距离。请严格按照要求的JSON格式返回结果。"
-                        },
-                        {
-                            "role": "user", 
-                            "content": prompt
-                        }
-                    ]
-                    
-                    response = await self._call_one_api(model, messages, temperature=0.7)
-                    content = response["choices"][0]["message"]["content"]
-                    
-                    # 解析JSON响应
-                    try:
-                        parsed_content = json.loads(content)
-                        results.append(parsed_content)
-                        print(f"✅ 模型 {model} 生成成功")
-                    except json.JSONDecodeError:
-                        # 如果不是标准JSON，尝试提取内容
-                        print(f"⚠️ 模型 {model} 返回非标准JSON，尝试解析...")
-                        parsed_content = self._parse_fallback_content(content, spu, sku, language, target_platform)
-                        results.append(parsed_content.get('data', {}))
+                    if variants > 1:
+                        generated = await self._generate_variants_with_model(model, rendered["messages"], variants)
+                    else:
+                        generated = [await self._generate_with_model(model, rendered["messages"])]
+                    for content, parsed_content in generated:
+                        if parsed_content is not None:
+                            results.append(parsed_content)
+                            print(f"✅ 模型 {model} 生成成功")
+                        else:
+                            # 如果不是标准JSON，尝试提取内容
+                            print(f"⚠️ 模型 {model} 返回非标准JSON，尝试解析...")
+                            parsed_content = self._parse_fallback_content(content, spu, sku, language, target_platform)
+                            results.append(parsed_content.get('data', {}))
                         
                 except Exception as e:
                     print(f"❌ 模型 {model} 生成失败: {str(e)}")
@@ -261,7 +186,177 @@ class LawnMowerService:
                 )
             }
 
-    def _build_prompt(
+    async def _generate_with_model(self, model: str, messages: list) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """调用单个模型，返回 (原始内容, 解析出的JSON对象或None)"""
+        print(f"🎯 正在使用模型 {model} 生成内容...")
+        response = await self._call_one_api(model, messages, temperature=0.7)
+        content = llm_gateway.extract_content(response)
+        return content, llm_gateway.parse_json_object(content)
+
+    async def _generate_variants_with_model(
+        self, model: str, messages: list, variants: int
+    ) -> List[Tuple[str, Optional[Dict[str, Any]]]]:
+        """同一提示词取得多个候选（支持 n 的模型只调用一次），返回 [(原始内容, 解析结果)]"""
+        print(f"🎯 正在使用模型 {model} 生成 {variants} 个候选...")
+        results = await llm_gateway.chat_completion_variants(model, messages, variants, temperature=0.7, max_tokens=3000)
+        return [(result["content"], llm_gateway.parse_json_object(result["content"])) for result in results]
+
+    @staticmethod
+    def is_valid_content(content: Optional[Dict[str, Any]]) -> bool:
+        """是否为符合输出格式的结果（至少包含非空的标题和主体文案）"""
+        if not isinstance(content, dict):
+            return False
+        titles = content.get("titles")
+        main_content = content.get("main_content")
+        return (
+            isinstance(titles, dict) and any(titles.values())
+            and isinstance(main_content, dict) and any(main_content.values())
+        )
+
+    def _content_args(self, params: Dict[str, Any]) -> tuple:
+        """把请求参数整理为 build_prompt / _get_fallback_content 的位置参数"""
+        product_specs = self._get_product_specs(params["spu"], params.get("sku"))
+        return (
+            params["spu"], params.get("sku"), params["language"], params["target_platform"], params["opening_hook"],
+            params["narrative_perspective"], params["content_logic"], params["value_proposition"],
+            params["key_selling_points"], params["specific_scenario"], params["user_persona"],
+            params["content_style"], params.get("holiday_season"), product_specs
+        )
+
+    def render_prompt(self, **params) -> Dict[str, Any]:
+        """只渲染提示词（不调用模型），参数与 iter_lawn_mower_content 相同"""
+        return self.build_prompt(*self._content_args(params))
+
+    async def iter_lawn_mower_content(self, models: List[str], **params) -> AsyncIterator[Dict[str, Any]]:
+        """并发调用所有模型，按完成顺序逐个产出结果
+
+        每项为 {"model", "success", "data"} 或 {"model", "success": False, "error"}；
+        调用方停止迭代或被取消时，尚未完成的模型请求一并取消。
+        """
+        fallback_args = self._content_args(params)
+        if not llm_gateway.configured:
+            print("⚠️ 未配置 ONE_API_KEY，返回备用内容")
+            for model in models:
+                yield {"model": model, "success": True, "data": self._get_fallback_content(*fallback_args)}
+            return
+
+        rendered = self.build_prompt(*fallback_args)
+        tasks = {
+            asyncio.create_task(self._generate_with_model(model, rendered["messages"])): model
+            for model in models
+        }
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=deadline.remaining(), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    for task in pending:
+                        yield {"model": tasks[task], "success": False, "error": "生成超时"}
+                    return
+                for task in done:
+                    model = tasks[task]
+                    if task.exception() is not None:
+                        yield {"model": model, "success": False, "error": str(task.exception())}
+                        continue
+                    content, parsed_content = task.result()
+                    if parsed_content is None:
+                        # 与多模型模式一致：非标准JSON时尝试提取内容
+                        parsed_content = self._parse_fallback_content(
+                            content, params["spu"], params.get("sku"), params["language"], params["target_platform"]
+                        ).get('data', {})
+                    yield {"model": model, "success": True, "data": parsed_content}
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def race_lawn_mower_content(
+        self,
+        models: List[str],
+        keep_others: bool = False,
+        **params
+    ) -> Dict[str, Any]:
+        """并发调用所有模型，返回第一个符合格式的结果
+
+        其余模型的请求默认立即取消（不再为其付费）；keep_others 为 True 时在后台继续运行，
+        结果写入竞速结果存储，可通过 race_id 稍后获取。
+        """
+        fallback_args = self._content_args(params)
+        if not llm_gateway.configured:
+            print("⚠️ 未配置 ONE_API_KEY，返回备用内容")
+            return {"success": True, "data": self._get_fallback_content(*fallback_args)}
+
+        rendered = self.build_prompt(*fallback_args)
+        tasks = {
+            asyncio.create_task(self._generate_with_model(model, rendered["messages"])): model
+            for model in models
+        }
+        pending = set(tasks)
+        winner = None
+        # 与优胜结果同一批完成的其他有效结果
+        extra_results = []
+        failed = {}
+        timed_out = False
+        while pending and winner is None:
+            # 不超过请求剩余时间；到期仍无有效结果时取消全部请求
+            try:
+                done, pending = await asyncio.wait(
+                    pending, timeout=deadline.remaining(), return_when=asyncio.FIRST_COMPLETED
+                )
+            except asyncio.CancelledError:
+                # 调用方被取消（如客户端断开）时一并取消所有模型请求
+                for task in pending:
+                    task.cancel()
+                raise
+            if not done:
+                timed_out = True
+                break
+            for task in done:
+                model = tasks[task]
+                if task.exception() is not None:
+                    failed[model] = str(task.exception())
+                    continue
+                _, parsed_content = task.result()
+                if not self.is_valid_content(parsed_content):
+                    failed[model] = "返回内容不符合输出格式"
+                elif winner is None:
+                    winner = {**parsed_content, "model": model}
+                    print(f"🏁 模型 {model} 率先返回有效结果")
+                else:
+                    extra_results.append({**parsed_content, "model": model})
+
+        pending_models = [tasks[task] for task in pending]
+        race_id = None
+        if keep_others and not timed_out and (pending or extra_results):
+            race_id = race_store.create([winner] + extra_results, pending_models, failed)
+            for task in pending:
+                race_store.track(race_id, tasks[task], task, self.is_valid_content)
+        elif pending:
+            for task in pending:
+                task.cancel()
+            print(f"✂️ 已取消其余模型请求: {', '.join(pending_models)}")
+
+        if winner is None:
+            return {
+                "success": False,
+                "error": "生成超时" if timed_out else "所有模型均未返回有效结果",
+                "data": self._get_fallback_content(*fallback_args)
+            }
+        return {
+            "success": True,
+            "data": {
+                "results": [winner],
+                "models_used": [winner["model"]],
+                "mode": "race",
+                "race_id": race_id,
+                "pending_models": pending_models if keep_others else [],
+                "cancelled_models": [] if keep_others else pending_models,
+                "failed_models": failed
+            }
+        }
+
+    def build_prompt(
         self, 
         spu: str,
         sku: str,
@@ -277,72 +372,23 @@ class LawnMowerService:
         content_style: str,
         holiday_season: Optional[str],
         product_specs: str
-    ) -> str:
-        """构建提示词"""
-        
-        holiday_text = f"，结合{holiday_season}" if holiday_season else ""
-        
-        prompt = f"""
-你是一位资深的内容运营专家，深耕智能家居与户外科技领域，专为库犸科技Mammotion品牌服务，擅长通过生活化内容拉近用户与智能割草机器人的距离。
-
-请根据下方提供的【内容创作信息】，为Mammotion的智能割草机器人产品创作一篇用于{target_platform}的推广内容，核心目标是提升品牌认知、激发用户互动（点赞/评论/分享）并引导用户了解产品详情。
-
-你的所有创作都遵循 A-B-C 内容逻辑框架：
-A - 锚点 (Anchor): 用{opening_hook}精准锚定{user_persona}在{specific_scenario}中的草坪护理痛点或需求。
-B - 桥梁 (Bridge): 以{narrative_perspective}为线索，结合{content_logic}阐述Mammotion产品如何解决痛点，重点传递{value_proposition}。
-C - 共鸣 (Resonate): 结尾呼应生活场景，强化产品带来的"轻松生活"价值，搭配自然的互动引导。
-
-【内容创作信息】
-产品系列/型号: {spu} {sku}
-产品规格详情: {product_specs}
-内容价值主张: {value_proposition}
-具体场景: {specific_scenario}
-用户画像: {user_persona}
-叙事视角: {narrative_perspective}
-内容风格: {content_style}
-节日/时令: {holiday_season or "无特定节日"}
-目标发布平台: {target_platform}
-主打卖点: {key_selling_points}
-
-【内容输出要求】
-整体要求：符合 {target_platform} 社交属性，内容轻量化、有画面感，avoid过度技术化表述，适配{content_style}。
-标题要求：包含{opening_hook}元素{holiday_text}，引发{user_persona}好奇，控制在60字符内。
-文案要求: 主体遵循A-B-C逻辑，穿插表情符号增强亲和力，合理分段（每段不超过3行），融入产品功能但侧重"解决问题后的生活改变"。
-
-请严格按照以下JSON格式返回结果：
-
-{{
-    "titles": {{
-        "chinese": [
-            "备选标题1",
-            "备选标题2"
-        ],
-        "english": [
-            "Alternative Title 1",
-            "Alternative Title 2"
-        ]
-    }},
-    "main_content": {{
-        "chinese": "中文主体文案内容",
-        "english": "English main content"
-    }},
-    "visual_suggestions": {{
-        "image_video_content": "图片/视频内容建议",
-        "scene_atmosphere": "场景氛围描述",
-        "composition_focus": "构图重点说明",
-        "color_tone": "色调建议"
-    }},
-    "interaction_guide": {{
-        "chinese": "中文互动引导问题",
-        "english": "English interaction guide" 
-    }},
-    "hashtags": {{
-        "chinese": ["#中文标签1", "#中文标签2", "等"],
-        "english": ["#EnglishTag1", "#EnglishTag2", "etc"]
-    }}
-}}
-"""
-        return prompt
+    ) -> Dict[str, Any]:
+        """构建提示词，返回消息列表、预估token数和裁剪记录"""
+        return render_lawn_mower_prompt({
+            "spu": spu,
+            "sku": sku,
+            "product_specs": product_specs,
+            "value_proposition": value_proposition,
+            "specific_scenario": specific_scenario,
+            "user_persona": user_persona,
+            "narrative_perspective": narrative_perspective,
+            "content_logic": content_logic,
+            "opening_hook": opening_hook,
+            "content_style": content_style,
+            "holiday_season": holiday_season,
+            "target_platform": target_platform,
+            "key_selling_points": key_selling_points
+        }, language=language)
     
     def _parse_fallback_content(self, content: str, spu: str, sku: str, language: str, target_platform: str) -> Dict[str, Any]:
         """备用内容解析"""
@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+CASSETTE_MODES = ("off", "record", "replay", "auto")
+
+
+class LLMCassette:
+    """上游模型调用的录制/回放
+
+    - record: 正常调用 One-API，并把请求/响应对写入本地录制目录
+    - replay: 只从录制中返回响应，不访问网络；未录制的请求直接报错
+    - auto:   命中录制时回放，未命中时调用并录制
+    录制按归一化后的请求（模型、消息、温度、max_tokens、n）的哈希存储，
+    同一请求可保存多次响应，回放时轮流返回。
+    """
+
+    def __init__(self):
+        self.mode = os.getenv("LLM_CASSETTE_MODE", "off").lower()
+        if self.mode not in CASSETTE_MODES:
+            print(f"⚠️ 未知的 LLM_CASSETTE_MODE: {self.mode}，已关闭录制/回放")
+            self.mode = "off"
+        default_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "cassettes")
+        self.directory = os.getenv("LLM_CASSETTE_DIR", default_dir)
+        # 回放时按录制耗时乘以该系数等待，0 表示立即返回
+        self.latency_scale = float(os.getenv("LLM_CASSETTE_REPLAY_LATENCY", "0"))
+        # 同一请求最多保存的响应数
+        self.max_interactions = int(os.getenv("LLM_CASSETTE_MAX_PER_KEY", "5"))
+        self._replay_counters: Dict[str, int] = {}
+
+        if self.mode != "off":
+            print(f"📼 LLM录制/回放已启用: {self.mode}，目录: {self.directory}")
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    @property
+    def replaying(self) -> bool:
+        """是否只使用录制数据（不需要 API Key 和网络）"""
+        return self.mode == "replay"
+
+    @staticmethod
+    def _normalize(request_data: Dict[str, Any]) -> Dict[str, Any]:
+        messages = [
+            {"role": message.get("role"), "content": " ".join(str(message.get("content") or "").split())}
+            for message in request_data.get("messages") or []
+        ]
+        return {
+            "model": request_data.get("model"),
+            "messages": messages,
+            "temperature": request_data.get("temperature"),
+            "max_tokens": request_data.get("max_tokens"),
+            "n": request_data.get("n", 1),
+        }
+
+    def key(self, request_data: Dict[str, Any]) -> str:
+        payload = json.dumps(self._normalize(request_data), ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️ 读取录制失败 {key}: {e}")
+            return None
+
+    async def replay(self, request_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """返回录制的响应；record 模式或 auto 模式未命中时返回 None"""
+        if self.mode not in ("replay", "auto"):
+            return None
+        key = self.key(request_data)
+        cassette = self._load(key)
+        if not cassette or not cassette.get("interactions"):
+            if self.mode == "replay":
+                raise Exception(f"回放模式下未找到录制的响应: {key[:12]}")
+            return None
+
+        interactions = cassette["interactions"]
+        index = self._replay_counters.get(key, 0)
+        self._replay_counters[key] = index + 1
+        interaction = interactions[index % len(interactions)]
+        if self.latency_scale > 0 and interaction.get("latency_ms"):
+            await asyncio.sleep(interaction["latency_ms"] * self.latency_scale / 1000)
+        print(f"📼 回放录制响应: {key[:12]} ({index % len(interactions) + 1}/{len(interactions)})")
+        return interaction["response"]
+
+    def record(self, request_data: Dict[str, Any], response_data: Dict[str, Any], latency_ms: int) -> None:
+        """保存一次成功调用的请求/响应对"""
+        if self.mode not in ("record", "auto"):
+            return
+        key = self.key(request_data)
+        cassette = self._load(key) or {"key": key, "request": self._normalize(request_data), "interactions": []}
+        cassette["interactions"].append({
+            "response": response_data,
+            "latency_ms": latency_ms,
+            "recorded_at": datetime.now().isoformat()
+        })
+        cassette["interactions"] = cassette["interactions"][-self.max_interactions:]
+
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再替换，避免并发请求读到写了一半的文件
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(cassette, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, path)
+            print(f"📼 已录制响应: {key[:12]}")
+        except OSError as e:
+            print(f"⚠️ 写入录制失败 {key}: {e}")
+
+
+# 创建服务实例
+llm_cassette = LLMCassette()
@@ -0,0 +1,393 @@
+import asyncio
+import json
+import os
+import re
+import time
+from typing import Dict, Any, List, Optional
+import httpx
+from app import deadline, timing, tracing
+from app.deadline import DeadlineExceeded
+from app.disconnect import disconnect_monitor
+from app.services.llm_cassette import llm_cassette
+from app.services.model_selector import model_selector
+
+# 对外模型名 -> 上游实际模型名
+MODEL_REGISTRY = {
+    "claude-3-5-sonnet-latest": "claude-3-5-sonnet-latest",
+    "claude-sonnet-4-20250514": "claude-sonnet-4-20250514",
+    "gpt-4o": "gpt-4o",
+    "deepseek-r1": "deepseek-r1",
+    "glm-4": "glm-4",
+    "deepseek-chat": "deepseek-chat",
+}
+
+DEFAULT_BACKEND = "one_api"
+# 可重试的上游状态码
+RETRYABLE_STATUS = {429, 502, 503, 504}
+
+
+class RetryableError(Exception):
+    """上游限流、网关错误或网络错误，可在剩余时间内重试"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ProviderBackend:
+    """一个 OpenAI 兼容的上游（One-API 代理或服务商直连）
+
+    每个上游只有一个连接池和一个并发限制，所有服务共享。
+    """
+
+    def __init__(self, name: str, base_url: str, api_key: Optional[str], max_concurrency: int, timeout: float):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.in_flight = 0
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    def _ensure_client(self) -> None:
+        # 连接池和信号量绑定事件循环，循环变化时（如脚本多次 asyncio.run）重新创建
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+                headers={"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}"}
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+
+    async def post_chat(self, request_data: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        self._ensure_client()
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                return await self._client.post("/v1/chat/completions", json=request_data, headers=headers)
+            finally:
+                self.in_flight -= 1
+
+    async def close(self) -> None:
+        if self._client is not None:
+            try:
+                await self._client.aclose()
+            except RuntimeError:
+                # 所属事件循环已关闭
+                pass
+            self._client = None
+
+
+class LLMGateway:
+    """统一的大模型调用网关
+
+    负责模型注册、上游路由、连接池与并发限制、录制/回放以及响应解析。
+    默认所有模型经 One-API 代理；LLM_DIRECT_ROUTES 可把指定模型直连服务商，
+    格式为 "模型=上游[:上游模型名],..."，例如 "deepseek-r1=deepseek:deepseek-reasoner"。
+    直连上游未配置 API Key 时自动回退到 One-API。
+    """
+
+    def __init__(self):
+        timeout = float(os.getenv("LLM_TIMEOUT", "60"))
+        self.backends: Dict[str, ProviderBackend] = {
+            "one_api": ProviderBackend(
+                "one_api",
+                os.getenv("ONE_API_URL", "https://your-remote-oneapi-service.com"),
+                os.getenv("ONE_API_KEY"),
+                int(os.getenv("ONE_API_MAX_CONCURRENCY", "20")),
+                timeout
+            ),
+            "deepseek": ProviderBackend(
+                "deepseek",
+                os.getenv("DEEPSEEK_API_URL", "https://api.deepseek.com"),
+                os.getenv("DEEPSEEK_API_KEY"),
+                int(os.getenv("DEEPSEEK_MAX_CONCURRENCY", "10")),
+                timeout
+            ),
+        }
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", "1"))
+        self.retry_backoff = float(os.getenv("LLM_RETRY_BACKOFF", "1"))
+        # 剩余时间少于该值时不再发起重试
+        self.min_attempt_budget = float(os.getenv("LLM_MIN_ATTEMPT_SECONDS", "5"))
+        self.routes = self._parse_routes(os.getenv("LLM_DIRECT_ROUTES", "deepseek-chat=deepseek"))
+        # 支持 n 参数（一次调用返回多个候选）的模型，其余模型按 n 次并发调用
+        self.n_supported = {
+            model.strip() for model in os.getenv("LLM_N_SUPPORTED_MODELS", "gpt-4o").split(',') if model.strip()
+        }
+
+        print(f"🛣️ 模型网关已初始化")
+        for backend in self.backends.values():
+            print(f"📡 上游 {backend.name}: {backend.base_url} ({'已配置' if backend.configured else '未配置API Key'})")
+        if self.routes:
+            print(f"🔀 直连路由: {', '.join(f'{model}->{backend}' for model, (backend, _) in self.routes.items())}")
+
+    @staticmethod
+    def _parse_routes(value: str) -> Dict[str, tuple]:
+        routes = {}
+        for item in value.split(','):
+            if '=' not in item:
+                continue
+            model, target = (part.strip() for part in item.split('=', 1))
+            backend, _, upstream_model = target.partition(':')
+            routes[model] = (backend.strip(), upstream_model.strip() or None)
+        return routes
+
+    @property
+    def configured(self) -> bool:
+        """是否可以发起调用（One-API 已配置，或处于回放模式）"""
+        return self.backends[DEFAULT_BACKEND].configured or llm_cassette.replaying
+
+    def resolve(self, model: str) -> tuple:
+        """返回 (上游, 上游模型名)"""
+        backend_name, upstream_model = self.routes.get(model, (DEFAULT_BACKEND, None))
+        backend = self.backends.get(backend_name)
+        if backend is None or not backend.configured:
+            backend = self.backends[DEFAULT_BACKEND]
+            upstream_model = None
+        return backend, upstream_model or MODEL_REGISTRY.get(model, model)
+
+    def list_models(self) -> List[str]:
+        return list(MODEL_REGISTRY)
+
+    async def chat_completion(
+        self,
+        model: str,
+        messages: list,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        **extra
+    ) -> Dict[Any, Any]:
+        """调用模型并返回完整的响应 JSON，失败时抛出 Exception"""
+        backend, actual_model = self.resolve(model)
+        request_data = {
+            "model": actual_model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            **extra
+        }
+
+        # 录制/回放模式：命中录制时不访问网络
+        if llm_cassette.enabled:
+            with timing.stage("upstream", f"{model} replay"):
+                recorded = await llm_cassette.replay(request_data)
+            if recorded is not None:
+                return recorded
+
+        print(f"🚀 正在调用AI模型...")
+        print(f"📝 模型: {model} -> {actual_model} (上游: {backend.name})")
+
+        # 429/5xx/网络错误在剩余时间允许时重试，每次只使用请求剩余的时间预算
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self._send(backend, model, request_data, attempt)
+            except RetryableError as e:
+                delay = e.retry_after if e.retry_after is not None else self.retry_backoff * (2 ** attempt)
+                left = deadline.remaining()
+                if attempt >= self.max_retries or (left is not None and left < delay + self.min_attempt_budget):
+                    raise Exception(str(e))
+                print(f"🔁 {delay:.1f}秒后重试模型 {model}（第{attempt + 1}次）")
+                await asyncio.sleep(delay)
+
+    async def _send(self, backend: ProviderBackend, model: str, request_data: Dict[str, Any], attempt: int = 0) -> Dict[Any, Any]:
+        """发送一次请求，超时不超过请求剩余时间；每次尝试记录一个 span，并向 One-API 传递请求 id"""
+        attributes = {
+            "gen_ai.request.model": model,
+            "llm.upstream": backend.name,
+            "llm.upstream_model": request_data["model"],
+            "llm.attempt": attempt,
+            "llm.n": request_data.get("n"),
+        }
+        with tracing.tracer.span(f"chat {model}", attributes, tracing.KIND_CLIENT) as span:
+            return await self._send_in_span(backend, model, request_data, span)
+
+    async def _send_in_span(self, backend: ProviderBackend, model: str, request_data: Dict[str, Any],
+                            span: "tracing.Span") -> Dict[Any, Any]:
+        deadline.check(f"调用模型 {model}")
+        timeout = deadline.timeout_for(backend.timeout)
+
+        # 记录每次调用的耗时与成败，供自动选择模型使用
+        model_selector.start(model)
+        start_time = time.perf_counter()
+        succeeded = False
+        cancelled = False
+        try:
+            response = await asyncio.wait_for(backend.post_chat(request_data, tracing.outgoing_headers()), timeout)
+            duration = time.perf_counter() - start_time
+
+            print(f"📊 响应状态码: {response.status_code}")
+            span.set_attribute("http.status_code", response.status_code)
+            if response.status_code != 200:
+                error_text = response.text
+                print(f"❌ API响应错误: {error_text}")
+                error_msg = f"HTTP错误 {response.status_code}: {error_text}"
+                if response.status_code in RETRYABLE_STATUS:
+                    retry_after = response.headers.get("retry-after")
+                    raise RetryableError(error_msg, float(retry_after) if retry_after and retry_after.isdigit() else None)
+                raise Exception(error_msg)
+
+            response_data = response.json()
+            usage = response_data.get("usage") or {}
+            span.set_attributes({
+                "gen_ai.response.model": response_data.get("model"),
+                "gen_ai.usage.input_tokens": usage.get("prompt_tokens"),
+                "gen_ai.usage.output_tokens": usage.get("completion_tokens"),
+                "llm.usage.total_tokens": usage.get("total_tokens"),
+            })
+            print(f"✅ API调用成功！耗时: {duration:.2f}秒")
+            llm_cassette.record(request_data, response_data, int(duration * 1000))
+            succeeded = True
+            return response_data
+
+        except asyncio.TimeoutError:
+            if deadline.expired():
+                error_msg = f"模型 {model} 未在请求截止时间前返回"
+                print(f"⏱️ {error_msg}")
+                raise DeadlineExceeded(error_msg)
+            error_msg = f"请求错误: 超过 {timeout:.0f} 秒未响应"
+            print(f"❌ {error_msg}")
+            raise RetryableError(error_msg)
+        except httpx.RequestError as e:
+            error_msg = f"请求错误: {type(e).__name__} {str(e)}"
+            print(f"❌ {error_msg}")
+            raise RetryableError(error_msg)
+        except asyncio.CancelledError:
+            # 调用方主动取消（如竞速模式中落后的模型、客户端已断开），关闭连接后不计入错误率
+            cancelled = True
+            print(f"✂️ 已取消模型请求: {model}")
+            disconnect_monitor.record_cancelled_call(model)
+            raise
+        except (RetryableError, DeadlineExceeded):
+            raise
+        except Exception as e:
+            error_msg = str(e) if str(e).startswith("HTTP错误") else f"未知错误: {str(e)}"
+            print(f"❌ {error_msg}")
+            raise Exception(error_msg)
+        finally:
+            elapsed_ms = (time.perf_counter() - start_time) * 1000
+            timing.record("upstream", elapsed_ms, model)
+            if cancelled:
+                model_selector.abandon(model)
+            else:
+                model_selector.finish(model, elapsed_ms, succeeded)
+
+    def supports_n(self, model: str) -> bool:
+        return model in self.n_supported
+
+    async def chat_completion_variants(
+        self,
+        model: str,
+        messages: list,
+        n: int,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        **extra
+    ) -> List[Dict[str, Any]]:
+        """取得同一提示词的 n 个候选，返回 [{"content", "total_tokens"}]
+
+        支持 n 的模型一次调用返回全部候选，提示词 token 只计一次，用量按候选平均分摊；
+        其余模型（或上游返回的候选不足 n 个时的差额）并发调用补齐。
+        部分调用失败时返回成功的候选，全部失败时抛出第一个错误。
+        """
+        variants = []
+        if n > 1 and self.supports_n(model):
+            response = await self.chat_completion(model, messages, temperature, max_tokens, n=n, **extra)
+            choices = response.get("choices") or []
+            total_tokens = (response.get("usage") or {}).get("total_tokens")
+            for index in range(min(n, len(choices))):
+                variants.append({
+                    "content": self.extract_content(response, index),
+                    "total_tokens": round(total_tokens / len(choices)) if total_tokens is not None else None
+                })
+            if len(variants) < n:
+                print(f"⚠️ 模型 {model} 只返回 {len(variants)}/{n} 个候选，并发补齐")
+
+        missing = n - len(variants)
+        if missing <= 0:
+            return variants
+        responses = await asyncio.gather(
+            *(self.chat_completion(model, messages, temperature, max_tokens, **extra) for _ in range(missing)),
+            return_exceptions=True
+        )
+        errors = [response for response in responses if isinstance(response, BaseException)]
+        for response in responses:
+            if not isinstance(response, BaseException):
+                variants.append({
+                    "content": self.extract_content(response),
+                    "total_tokens": (response.get("usage") or {}).get("total_tokens")
+                })
+        if not variants:
+            raise errors[0]
+        if errors:
+            print(f"⚠️ 模型 {model} 有 {len(errors)} 个候选生成失败: {errors[0]}")
+        return variants
+
+    @staticmethod
+    def extract_content(response: Dict[str, Any], index: int = 0) -> str:
+        """取出响应中第 index 个候选的文本内容"""
+        return response["choices"][index]["message"]["content"]
+
+    @staticmethod
+    def parse_json_object(content: str, required_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """从模型输出中解析 JSON 对象
+
+        依次尝试：整体解析、```json 代码块、内容中的 JSON 片段（支持一层嵌套）。
+        指定 required_key 时只接受包含该键的对象；都失败时返回 None。
+        """
+        with tracing.tracer.span("llm.parse", {"parse.required_key": required_key, "parse.content_length": len(content)}) as span:
+            start_time = time.perf_counter()
+            parsed, path = LLMGateway._parse_json_object(content, required_key)
+            timing.record("parse", (time.perf_counter() - start_time) * 1000, path)
+            span.set_attribute("parse.path", path)
+        return parsed
+
+    @staticmethod
+    def _parse_json_object(content: str, required_key: Optional[str]) -> tuple:
+        """返回 (解析结果或None, 命中的解析方式)"""
+        def accept(text: str) -> Optional[Dict[str, Any]]:
+            try:
+                parsed = json.loads(text.strip())
+            except json.JSONDecodeError:
+                return None
+            if isinstance(parsed, dict) and (required_key is None or required_key in parsed):
+                return parsed
+            return None
+
+        parsed = accept(content)
+        if parsed is not None:
+            return parsed, "json"
+
+        for pattern in (r'```json\s*(\{.*?\})\s*```', r'```\s*(\{.*?\})\s*```'):
+            for match in re.findall(pattern, content, re.DOTALL | re.IGNORECASE):
+                parsed = accept(match)
+                if parsed is not None:
+                    return parsed, "code-block"
+
+        # 从第一个 { 到最后一个 } 的整体片段，再退回逐个片段
+        start, end = content.find('{'), content.rfind('}')
+        if 0 <= start < end:
+            parsed = accept(content[start:end + 1])
+            if parsed is not None:
+                return parsed, "fragment"
+        for match in re.findall(r'\{(?:[^{}]|{[^{}]*})*\}', content, re.DOTALL):
+            parsed = accept(match)
+            if parsed is not None:
+                return parsed, "fragment"
+        return None, "none"
+
+    async def close(self) -> None:
+        for backend in self.backends.values():
+            await backend.close()
+
+
+# 创建服务实例
+llm_gateway = LLMGateway()
@@ -0,0 +1,143 @@
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, Any, Iterable, List, Optional
+
+# 各模型的质量先验（0~1），可用 MODEL_QUALITY_SCORES="gpt-4o=0.9,glm-4=0.6" 覆盖
+DEFAULT_QUALITY_SCORES = {
+    "claude-sonnet-4-20250514": 1.0,
+    "claude-3-5-sonnet-latest": 0.9,
+    "gpt-4o": 0.9,
+    "deepseek-r1": 0.8,
+    "glm-4": 0.6,
+}
+
+# ai_model 取值 -> 速度权重（None 表示使用 AUTO_MODEL_SPEED_WEIGHT）
+AUTO_PREFERENCES = {
+    "auto": None,
+    "auto:fast": 0.9,
+    "auto:quality": 0.2,
+}
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class ModelSelector:
+    """根据自身调用的实测数据自动选择模型
+
+    每个模型保留最近 MODEL_STATS_WINDOW 次调用（且不超过 MODEL_STATS_MAX_AGE 秒）的耗时和成败，
+    结合 p50/p95 延迟、错误率、当前并发中的请求数和质量先验打分，选出得分最高的健康模型。
+    """
+
+    def __init__(self):
+        self.window = int(os.getenv("MODEL_STATS_WINDOW", "100"))
+        self.max_age = float(os.getenv("MODEL_STATS_MAX_AGE", "900"))
+        self.speed_weight = float(os.getenv("AUTO_MODEL_SPEED_WEIGHT", "0.6"))
+        # 少量随机探索，避免某个模型因一次慢请求长期得不到新数据
+        self.explore_rate = float(os.getenv("AUTO_MODEL_EXPLORE_RATE", "0.05"))
+        # 没有数据的模型按该延迟估计
+        self.default_latency_ms = float(os.getenv("AUTO_MODEL_DEFAULT_LATENCY_MS", "8000"))
+        # 样本足够且错误率超过该值视为不健康
+        self.max_error_rate = float(os.getenv("AUTO_MODEL_MAX_ERROR_RATE", "0.5"))
+        self.min_samples = 5
+        self.quality_scores = {**DEFAULT_QUALITY_SCORES, **self._parse_scores(os.getenv("MODEL_QUALITY_SCORES", ""))}
+        self._calls: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self.window))
+        self._in_flight: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _parse_scores(value: str) -> Dict[str, float]:
+        scores = {}
+        for item in value.split(','):
+            model, _, score = item.partition('=')
+            if model.strip() and score.strip():
+                scores[model.strip()] = float(score)
+        return scores
+
+    @staticmethod
+    def is_auto(model: Optional[str]) -> bool:
+        return model in AUTO_PREFERENCES
+
+    def start(self, model: str) -> None:
+        with self._lock:
+            self._in_flight[model] += 1
+
+    def finish(self, model: str, latency_ms: float, ok: bool) -> None:
+        with self._lock:
+            self._in_flight[model] = max(0, self._in_flight[model] - 1)
+            self._calls[model].append((time.monotonic(), latency_ms, ok))
+
+    def abandon(self, model: str) -> None:
+        """请求被取消时只减少并发计数，不记录样本"""
+        with self._lock:
+            self._in_flight[model] = max(0, self._in_flight[model] - 1)
+
+    def model_stats(self, model: str) -> Dict[str, Any]:
+        cutoff = time.monotonic() - self.max_age
+        with self._lock:
+            calls = [call for call in self._calls.get(model, ()) if call[0] >= cutoff]
+            in_flight = self._in_flight.get(model, 0)
+        latencies = sorted(latency for _, latency, ok in calls if ok)
+        errors = sum(1 for _, _, ok in calls if not ok)
+        return {
+            "model": model,
+            "samples": len(calls),
+            "p50_ms": round(_percentile(latencies, 50), 1) if latencies else None,
+            "p95_ms": round(_percentile(latencies, 95), 1) if latencies else None,
+            "error_rate": round(errors / len(calls), 3) if calls else 0.0,
+            "in_flight": in_flight,
+            "quality": self.quality_scores.get(model, 0.5),
+        }
+
+    def _expected_latency(self, stats: Dict[str, Any]) -> float:
+        if stats["p50_ms"] is None:
+            expected = self.default_latency_ms
+        else:
+            expected = 0.5 * stats["p50_ms"] + 0.5 * stats["p95_ms"]
+        # 并发中的请求越多，排队和上游限流的可能越大
+        return expected * (1 + 0.1 * stats["in_flight"])
+
+    def rank(self, candidates: Iterable[str], preference: str = "auto") -> List[Dict[str, Any]]:
+        """对候选模型打分，健康模型在前，按得分降序"""
+        speed_weight = AUTO_PREFERENCES.get(preference)
+        if speed_weight is None:
+            speed_weight = self.speed_weight
+
+        ranked = [self.model_stats(model) for model in candidates]
+        if not ranked:
+            return []
+        for stats in ranked:
+            stats["expected_ms"] = round(self._expected_latency(stats), 1)
+        fastest = min(stats["expected_ms"] for stats in ranked)
+        for stats in ranked:
+            speed_score = fastest / stats["expected_ms"] if stats["expected_ms"] else 1.0
+            score = speed_weight * speed_score + (1 - speed_weight) * stats["quality"]
+            stats["healthy"] = not (stats["samples"] >= self.min_samples and stats["error_rate"] > self.max_error_rate)
+            stats["score"] = round(score * (1 - stats["error_rate"]), 4)
+        ranked.sort(key=lambda stats: (stats["healthy"], stats["score"]), reverse=True)
+        return ranked
+
+    def choose(self, candidates: Iterable[str], preference: str = "auto", exclude: Iterable[str] = ()) -> str:
+        """选出一个模型；exclude 中的模型（如本次请求已选的）不参与"""
+        candidates = list(candidates)
+        excluded = set(exclude)
+        pool = [model for model in candidates if model not in excluded] or candidates
+        ranked = self.rank(pool, preference)
+        healthy = [stats for stats in ranked if stats["healthy"]] or ranked
+        if len(healthy) > 1 and random.random() < self.explore_rate:
+            choice = random.choice(healthy[1:])["model"]
+        else:
+            choice = healthy[0]["model"]
+        print(f"🧭 自动选择模型: {choice} ({preference})")
+        return choice
+
+
+# 创建服务实例
+model_selector = ModelSelector()
@@ -0,0 +1,215 @@
+import asyncio
+import glob
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from app import crud, deadline, timing
+from app.db import SessionLocal
+from app.models import XiaohongshuNote
+from app.services.fingerprint_service import fingerprint_service
+
+NOTE_COLUMNS = [column.name for column in XiaohongshuNote.__table__.columns]
+
+
+class NoteWriteBehind:
+    """生成笔记的异步写入队列（write-behind）
+
+    开启后 /notes/generate 不再等待数据库提交：笔记 id 从预先分配的序列区间中取得，
+    created_at 在本地生成，结果立即返回；后台任务按批写入 xiaohongshu_notes。
+    - 队列有上限（NOTE_WRITE_QUEUE_SIZE），满时该请求退回同步写入
+    - 写入失败按指数退避重试，插入对 (id, created_at) 幂等，重试不会重复写入
+    - 重试耗尽或关闭时仍未写入的笔记落盘到 NOTE_WRITE_SPILL_DIR，下次启动时重新入队
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("NOTE_WRITE_BEHIND", "false").lower() == "true"
+        self.queue_size = int(os.getenv("NOTE_WRITE_QUEUE_SIZE", "1000"))
+        self.batch_size = int(os.getenv("NOTE_WRITE_BATCH_SIZE", "50"))
+        self.flush_interval = float(os.getenv("NOTE_WRITE_FLUSH_INTERVAL", "0.5"))
+        self.max_retries = int(os.getenv("NOTE_WRITE_MAX_RETRIES", "5"))
+        self.id_block_size = int(os.getenv("NOTE_ID_BLOCK_SIZE", "50"))
+        self.spill_dir = os.getenv("NOTE_WRITE_SPILL_DIR", os.path.join(tempfile.gettempdir(), "note_write_behind"))
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._ids: List[int] = []
+        self._id_lock: Optional[asyncio.Lock] = None
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "retries": 0, "spilled": 0, "sync_fallbacks": 0}
+
+    async def start(self) -> None:
+        if not self.enabled:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._id_lock = asyncio.Lock()
+        self._worker = asyncio.create_task(self._run())
+        restored = self._restore_spilled()
+        print(f"📥 笔记异步写入已启用（批量 {self.batch_size}，队列上限 {self.queue_size}，恢复 {restored} 条）")
+
+    async def stop(self) -> None:
+        """关闭时写完队列中的笔记；数据库不可用时落盘"""
+        if self._worker is None:
+            return
+        await self._queue.put(None)
+        await self._worker
+        self._worker = None
+
+    async def _allocate_ids(self, count: int) -> List[int]:
+        async with self._id_lock:
+            if len(self._ids) < count:
+                with timing.stage("db", "allocate ids"):
+                    self._ids.extend(await asyncio.to_thread(self._fetch_ids, max(count, self.id_block_size)))
+            ids, self._ids = self._ids[:count], self._ids[count:]
+            return ids
+
+    @staticmethod
+    def _fetch_ids(count: int) -> List[int]:
+        db = SessionLocal()
+        try:
+            return crud.allocate_note_ids(db, count)
+        finally:
+            db.close()
+
+    async def submit(self, notes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """分配 id 后入队，返回与同步写入相同结构的笔记"""
+        if not notes:
+            return []
+        ids = await self._allocate_ids(len(notes))
+        created_at = datetime.now()
+        saved_notes = [
+            {
+                **note,
+                **({} if "content_simhash" in note else fingerprint_service.fingerprint_note(note)),
+                "id": note_id,
+                "created_at": created_at
+            }
+            for note, note_id in zip(notes, ids)
+        ]
+        rows = [self._row(note) for note in saved_notes]
+        if self._queue.full() or self._queue.qsize() + len(rows) > self.queue_size:
+            # 队列已满时退回同步写入，给数据库施加背压而不是丢弃；重试受请求截止时间约束
+            self.stats["sync_fallbacks"] += 1
+            await self._write_with_retry(rows)
+        else:
+            for row in rows:
+                self._queue.put_nowait(row)
+            self.stats["queued"] += len(rows)
+        return [{**note, "updated_at": None} for note in saved_notes]
+
+    @staticmethod
+    def _row(note: Dict[str, Any]) -> Dict[str, Any]:
+        # 只保留表中的列
+        return {column: note.get(column) for column in NOTE_COLUMNS if column in note}
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = []
+            item = await self._queue.get()
+            if item is None:
+                stopping = True
+            else:
+                batch.append(item)
+                # 攒批：最多等待 flush_interval 秒或凑满 batch_size 条
+                loop_deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    timeout = loop_deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+            if stopping:
+                # 关闭时一次性取出剩余笔记
+                while not self._queue.empty():
+                    item = self._queue.get_nowait()
+                    if item is not None:
+                        batch.append(item)
+            for start in range(0, len(batch), self.batch_size):
+                # 关闭时只重试一次即落盘，避免超出容器停止的宽限时间
+                await self._write_with_retry(
+                    batch[start:start + self.batch_size], max_retries=1 if stopping else self.max_retries
+                )
+
+    async def _write_with_retry(self, rows: List[Dict[str, Any]], max_retries: Optional[int] = None) -> None:
+        if not rows:
+            return
+        if max_retries is None:
+            max_retries = self.max_retries
+        for attempt in range(max_retries + 1):
+            try:
+                written = await asyncio.to_thread(self._write_batch, rows)
+                self.stats["written"] += written
+                self.stats["batches"] += 1
+                return
+            except Exception as e:
+                delay = min(30.0, 0.5 * (2 ** attempt))
+                # 请求内同步写入时，剩余时间不够等待下一次重试则直接落盘，不阻塞响应
+                left = deadline.remaining()
+                if attempt >= max_retries or (left is not None and left <= delay):
+                    print(f"❌ 笔记批量写入失败，已落盘 {len(rows)} 条: {e}")
+                    self._spill(rows)
+                    return
+                self.stats["retries"] += 1
+                print(f"⚠️ 笔记批量写入失败，{delay:.1f}秒后重试: {e}")
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _write_batch(rows: List[Dict[str, Any]]) -> int:
+        db = SessionLocal()
+        try:
+            return crud.insert_notes_with_ids(db, rows)
+        finally:
+            db.close()
+
+    def _spill(self, rows: List[Dict[str, Any]]) -> None:
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f"spill-{os.getpid()}-{time.time_ns()}.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps({**row, "created_at": row["created_at"].isoformat()}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.stats["spilled"] += len(rows)
+
+    def _restore_spilled(self) -> int:
+        """把上次落盘的笔记重新入队；多个 worker 通过重命名抢占文件，每个文件只恢复一次"""
+        restored = 0
+        for path in glob.glob(os.path.join(self.spill_dir, "spill-*.jsonl")):
+            claimed = f"{path}.{os.getpid()}.claimed"
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            with open(claimed, "r", encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+            for row in rows:
+                row["created_at"] = datetime.fromisoformat(row["created_at"])
+            free = self.queue_size - self._queue.qsize()
+            for row in rows[:free]:
+                self._queue.put_nowait(row)
+            restored += len(rows[:free])
+            if rows[free:]:
+                # 队列放不下的部分保留在新的落盘文件中
+                self._spill(rows[free:])
+            os.remove(claimed)
+        return restored
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "queue_size": self.queue_size,
+            "reserved_ids": len(self._ids),
+            **self.stats
+        }
+
+
+# 创建服务实例
+note_writer = NoteWriteBehind()
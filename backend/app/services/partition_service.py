@@ -0,0 +1,296 @@
+import gzip
+import json
+import os
+import re
+from datetime import date, datetime
+from typing import List, Optional
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Engine, Connection
+from app.db import engine as default_engine
+from app.models import XiaohongshuNote
+
+NOTES_TABLE = "xiaohongshu_notes"
+PARTITION_PATTERN = re.compile(rf"^{NOTES_TABLE}_p(\d{{4}})_(\d{{2}})$")
+# 多个 worker 同时启动时只允许一个执行分区维护
+MAINTENANCE_LOCK_ID = 724001
+
+
+def _add_months(day: date, months: int) -> date:
+    month_index = day.year * 12 + (day.month - 1) + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def _partition_name(month: date) -> str:
+    return f"{NOTES_TABLE}_p{month.year:04d}_{month.month:02d}"
+
+
+class PartitionService:
+    """笔记表按月分区、保留期归档与恢复"""
+
+    def __init__(self, engine: Engine = default_engine):
+        self.engine = engine
+        self.months_ahead = int(os.getenv("NOTE_PARTITION_MONTHS_AHEAD", "3"))
+        # 保留最近 N 个月的分区，0 表示不归档
+        self.retention_months = int(os.getenv("NOTE_RETENTION_MONTHS", "0"))
+        self.archive_dir = os.getenv(
+            "NOTE_ARCHIVE_DIR",
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "archive")
+        )
+
+    def is_partitioned(self, conn: Connection) -> bool:
+        """判断笔记表是否已是分区表"""
+        result = conn.execute(text(
+            "SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE c.relname = :name AND n.nspname = current_schema()"
+        ), {"name": NOTES_TABLE}).scalar()
+        return result == "p"
+
+    def list_partitions(self, conn: Connection) -> List[str]:
+        """列出已挂载的月分区"""
+        rows = conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :name ORDER BY c.relname"
+        ), {"name": NOTES_TABLE}).fetchall()
+        return [row[0] for row in rows if PARTITION_PATTERN.match(row[0])]
+
+    def create_partition(self, conn: Connection, month: date) -> str:
+        """创建指定月份的分区（已存在则跳过）
+
+        该月的分区还不存在时写入的笔记落在默认分区中，此时直接创建会因默认分区中已有该月数据而失败：
+        先卸载默认分区，创建月分区并把这些笔记移入，再重新挂载默认分区。
+        """
+        month = month.replace(day=1)
+        name = _partition_name(month)
+        if conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar():
+            return name
+
+        bounds = {"start": month, "end": _add_months(month, 1)}
+        default = f"{NOTES_TABLE}_default"
+        create = (
+            f"CREATE TABLE {name} PARTITION OF {NOTES_TABLE} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+        )
+        has_default = conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": default}).scalar()
+        stranded = has_default and conn.execute(text(
+            f"SELECT EXISTS (SELECT 1 FROM {default} WHERE created_at >= :start AND created_at < :end)"
+        ), bounds).scalar()
+        if not stranded:
+            conn.execute(text(create))
+            return name
+
+        conn.execute(text(f"ALTER TABLE {NOTES_TABLE} DETACH PARTITION {default}"))
+        conn.execute(text(create))
+        moved = conn.execute(text(
+            f"WITH moved AS (DELETE FROM {default} WHERE created_at >= :start AND created_at < :end RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ), bounds).rowcount
+        conn.execute(text(f"ALTER TABLE {NOTES_TABLE} ATTACH PARTITION {default} DEFAULT"))
+        print(f"🗂️  已从默认分区移入 {moved} 条笔记到 {name}")
+        return name
+
+    def ensure_future_partitions(self, months_ahead: Optional[int] = None) -> List[str]:
+        """预先创建当前月及之后若干个月的分区；每个月单独一个事务，某个月失败不影响其他月"""
+        months_ahead = self.months_ahead if months_ahead is None else months_ahead
+        current = date.today().replace(day=1)
+        created = []
+        for offset in range(months_ahead + 1):
+            month = _add_months(current, offset)
+            try:
+                with self.engine.begin() as conn:
+                    created.append(self.create_partition(conn, month))
+            except Exception as e:
+                print(f"❌ 创建分区 {_partition_name(month)} 失败: {e}")
+        return created
+
+    def partition_stranded_rows(self) -> List[str]:
+        """为默认分区中已有笔记的月份创建分区并移入这些笔记
+
+        导入的历史笔记、从归档恢复后又过了保留期的月份等，写入时没有对应的月分区，会留在默认分区；
+        移入月分区后才能被保留期归档。
+        """
+        default = f"{NOTES_TABLE}_default"
+        with self.engine.connect() as conn:
+            if not conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": default}).scalar():
+                return []
+            months = [row[0] for row in conn.execute(text(
+                f"SELECT DISTINCT date_trunc('month', created_at)::date FROM {default} ORDER BY 1"
+            )).fetchall()]
+
+        created = []
+        for month in months:
+            try:
+                with self.engine.begin() as conn:
+                    created.append(self.create_partition(conn, month))
+            except Exception as e:
+                print(f"❌ 创建分区 {_partition_name(month)} 失败: {e}")
+        return created
+
+    def migrate_to_partitioned(self) -> None:
+        """把现有的普通笔记表迁移为按 created_at 月分区的分区表"""
+        with self.engine.begin() as conn:
+            if self.is_partitioned(conn):
+                print("ℹ️  xiaohongshu_notes 已是分区表")
+                return
+
+            legacy = f"{NOTES_TABLE}_legacy"
+            print("🔄 开始迁移 xiaohongshu_notes 为分区表...")
+            conn.execute(text(f"UPDATE {NOTES_TABLE} SET created_at = now() WHERE created_at IS NULL"))
+            sequence = conn.execute(text(f"SELECT pg_get_serial_sequence('{NOTES_TABLE}', 'id')")).scalar()
+            conn.execute(text(f"ALTER TABLE {NOTES_TABLE} RENAME TO {legacy}"))
+            if sequence:
+                conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY NONE"))
+
+            conn.execute(text(
+                f"CREATE TABLE {NOTES_TABLE} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)"
+            ))
+            conn.execute(text(f"ALTER TABLE {NOTES_TABLE} ALTER COLUMN created_at SET NOT NULL"))
+            # 分区表主键必须包含分区键
+            conn.execute(text(f"ALTER TABLE {NOTES_TABLE} ADD PRIMARY KEY (id, created_at)"))
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {NOTES_TABLE}_default PARTITION OF {NOTES_TABLE} DEFAULT"))
+
+            oldest = conn.execute(text(f"SELECT MIN(created_at) FROM {legacy}")).scalar()
+            month = (oldest.date() if oldest else date.today()).replace(day=1)
+            last = _add_months(date.today().replace(day=1), self.months_ahead)
+            while month <= last:
+                self.create_partition(conn, month)
+                month = _add_months(month, 1)
+
+            conn.execute(text(f"INSERT INTO {NOTES_TABLE} SELECT * FROM {legacy}"))
+            conn.execute(text(f"DROP TABLE {legacy}"))
+            if sequence:
+                conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {NOTES_TABLE}.id"))
+
+            # 旧表索引随旧表一起删除，在分区表上重建
+            for index in XiaohongshuNote.__table__.indexes:
+                index.create(bind=conn)
+        print("✅ xiaohongshu_notes 已迁移为分区表")
+
+    def _partition_checksum(self, conn: Connection, name: str) -> tuple:
+        """分区内容的摘要：行数、id 之和与最近更新时间，用于确认导出后分区没有被修改"""
+        row = conn.execute(text(f"SELECT count(*), sum(id), max(updated_at) FROM {name}")).fetchone()
+        return tuple(row)
+
+    def archive_partition(self, name: str) -> str:
+        """把分区导出为 gzip 压缩的 NDJSON 文件，导出后卸载并删除分区表
+
+        导出在只读事务中读取仍挂载的分区，不锁笔记主表；之后在一个短事务中锁定该分区、
+        确认导出后没有新的写入，再卸载并删除。DETACH 持有主表的排他锁，只在最后的短事务里执行。
+        """
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"{name}.ndjson.gz")
+        if os.path.exists(path):
+            # 同一月份再次归档（恢复后或归档后又写入的笔记）时不覆盖之前的归档
+            path = os.path.join(self.archive_dir, f"{name}.{datetime.now():%Y%m%d%H%M%S}.ndjson.gz")
+
+        count = 0
+        # 先写临时文件并落盘，确认归档文件完整后才删除分区
+        temp_path = f"{path}.tmp"
+        with self.engine.begin() as conn:
+            conn.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY"))
+            checksum = self._partition_checksum(conn, name)
+            result = conn.execution_options(stream_results=True).execute(text(f"SELECT * FROM {name} ORDER BY id"))
+            with open(temp_path, "wb") as raw:
+                with gzip.open(raw, "wt", encoding="utf-8") as f:
+                    for row in result:
+                        f.write(json.dumps(dict(row._mapping), ensure_ascii=False, default=str) + "\n")
+                        count += 1
+                raw.flush()
+                os.fsync(raw.fileno())
+        os.replace(temp_path, path)
+        directory = os.open(self.archive_dir, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+        with self.engine.begin() as conn:
+            # SHARE 锁只阻塞对该分区的写入，不影响主表和其他分区的读写
+            conn.execute(text(f"LOCK TABLE {name} IN SHARE MODE"))
+            if self._partition_checksum(conn, name) != checksum:
+                raise RuntimeError(f"分区 {name} 在导出期间有写入，保留分区，下次维护时重新归档")
+            conn.execute(text(f"ALTER TABLE {NOTES_TABLE} DETACH PARTITION {name}"))
+            conn.execute(text(f"DROP TABLE {name}"))
+        print(f"📦 分区 {name} 已归档 {count} 条到 {path}")
+        return path
+
+    def apply_retention(self, retention_months: Optional[int] = None) -> List[str]:
+        """归档早于保留期的月分区"""
+        retention_months = self.retention_months if retention_months is None else retention_months
+        if retention_months <= 0:
+            return []
+
+        cutoff = _add_months(date.today().replace(day=1), -retention_months)
+        with self.engine.connect() as conn:
+            partitions = self.list_partitions(conn)
+
+        archived = []
+        for name in partitions:
+            match = PARTITION_PATTERN.match(name)
+            month = date(int(match.group(1)), int(match.group(2)), 1)
+            if month < cutoff:
+                # 每个分区单独归档，失败不影响已归档的分区
+                try:
+                    archived.append(self.archive_partition(name))
+                except Exception as e:
+                    print(f"❌ 归档分区 {name} 失败: {e}")
+        return archived
+
+    def restore_archive(self, path: str, batch_size: int = 1000) -> int:
+        """把归档文件恢复回笔记表"""
+        name = os.path.basename(path).split(".")[0]
+        match = PARTITION_PATTERN.match(name)
+        table = XiaohongshuNote.__table__
+        restored = 0
+
+        with self.engine.begin() as conn:
+            if match and self.is_partitioned(conn):
+                self.create_partition(conn, date(int(match.group(1)), int(match.group(2)), 1))
+
+            def flush(rows):
+                if rows:
+                    conn.execute(pg_insert(table).values(rows).on_conflict_do_nothing())
+
+            batch = []
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    row = json.loads(line)
+                    for column in ("created_at", "updated_at"):
+                        if row.get(column):
+                            row[column] = datetime.fromisoformat(row[column])
+                    batch.append({key: value for key, value in row.items() if key in table.c})
+                    if len(batch) >= batch_size:
+                        flush(batch)
+                        restored += len(batch)
+                        batch = []
+            flush(batch)
+            restored += len(batch)
+
+        print(f"✅ 已从 {path} 恢复 {restored} 条笔记")
+        return restored
+
+    def run_maintenance(self) -> None:
+        """定期维护：创建未来分区，把默认分区中的笔记移入月分区，并执行保留期归档"""
+        with self.engine.connect() as lock_conn:
+            if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": MAINTENANCE_LOCK_ID}).scalar():
+                return
+            try:
+                with self.engine.connect() as conn:
+                    if not self.is_partitioned(conn):
+                        return
+                created = self.ensure_future_partitions()
+                print(f"🗂️  笔记分区已就绪: {', '.join(created)}")
+                stranded = self.partition_stranded_rows()
+                if stranded:
+                    print(f"🗂️  已为默认分区中的笔记创建分区: {', '.join(stranded)}")
+                self.apply_retention()
+            finally:
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MAINTENANCE_LOCK_ID})
+
+
+# 创建服务实例
+partition_service = PartitionService()
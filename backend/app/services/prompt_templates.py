@@ -0,0 +1,284 @@
+import math
+import os
+import re
+from typing import Dict, Any, List, Optional, Tuple
+from app import timing
+
+# 中日韩字符按每字约 1 token 估算，其余字符按约 4 字符 1 token 估算
+_WIDE_CHAR_RE = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\ufe30-\ufe4f\uff00-\uffef]")
+# 每条消息的格式开销
+MESSAGE_OVERHEAD_TOKENS = 4
+TRUNCATION_MARK = "…（已截断）"
+
+
+def estimate_tokens(text: str) -> int:
+    """本地估算文本的 token 数（不依赖分词器）"""
+    if not text:
+        return 0
+    wide = len(_WIDE_CHAR_RE.findall(text))
+    return wide + math.ceil((len(text) - wide) / 4)
+
+
+class PromptSection:
+    """用户提示词中的一个可变段落
+
+    priority 越小越先被裁剪；required 段落不会被整段删除，只在 truncatable 时截断。
+    """
+
+    def __init__(self, key: str, template: str, priority: int = 0, required: bool = False, truncatable: bool = False):
+        self.key = key
+        self.template = template
+        self.priority = priority
+        self.required = required
+        self.truncatable = truncatable
+
+    def render(self, value: Any) -> str:
+        return self.template.format(value=value)
+
+
+class PromptTemplate:
+    """预编译的提示词模板
+
+    固定内容（系统提示词、任务说明、输出格式）放在最前面且逐字不变，便于服务商命中提示词前缀缓存；
+    可变内容按 sections 顺序追加在用户消息末尾，超出预算时按优先级裁剪。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        system_prompt: str,
+        user_prefix: str,
+        sections: List[PromptSection],
+        user_suffix: str = "",
+        budget: Optional[int] = None
+    ):
+        self.name = name
+        self.system_prompt = system_prompt
+        self.user_prefix = user_prefix
+        self.user_suffix = user_suffix
+        self.sections = sections
+        self.budget = budget or int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+        # 固定部分的 token 数只计算一次
+        self.static_tokens = (
+            estimate_tokens(system_prompt)
+            + estimate_tokens(user_prefix)
+            + estimate_tokens(user_suffix)
+            + MESSAGE_OVERHEAD_TOKENS * 2
+        )
+
+    @staticmethod
+    def _truncate(text: str, max_tokens: int) -> str:
+        """把文本截断到不超过 max_tokens，放不下时返回空字符串"""
+        keep = len(text)
+        for _ in range(20):
+            candidate = text[:keep].rstrip() + TRUNCATION_MARK
+            tokens = estimate_tokens(candidate)
+            if tokens <= max_tokens:
+                return candidate
+            keep = min(keep - 1, int(keep * max_tokens / tokens))
+            if keep <= 0:
+                break
+        return ""
+
+    def render(self, values: Dict[str, Any], budget: Optional[int] = None) -> Dict[str, Any]:
+        """渲染提示词并按预算裁剪可选段落"""
+        with timing.stage("prompt", self.name):
+            return self._render(values, budget)
+
+    def _render(self, values: Dict[str, Any], budget: Optional[int] = None) -> Dict[str, Any]:
+        budget = budget or self.budget
+        rendered: List[Tuple[PromptSection, str]] = [
+            (section, section.render(values[section.key]))
+            for section in self.sections
+            if values.get(section.key)
+        ]
+        texts = {section.key: text for section, text in rendered}
+        trimmed = []
+
+        def total_tokens() -> int:
+            return self.static_tokens + sum(estimate_tokens(text) for text in texts.values())
+
+        # 先处理可选段落，再截断必需段落
+        for required in (False, True):
+            candidates = sorted(
+                (section for section, _ in rendered if section.required == required),
+                key=lambda section: section.priority
+            )
+            for section in candidates:
+                over = total_tokens() - budget
+                if over <= 0:
+                    break
+                current = texts[section.key]
+                if section.truncatable:
+                    truncated = self._truncate(current, estimate_tokens(current) - over)
+                    if truncated or not required:
+                        texts[section.key] = truncated
+                        trimmed.append({"section": section.key, "action": "truncated" if truncated else "dropped"})
+                        continue
+                if not required:
+                    texts[section.key] = ""
+                    trimmed.append({"section": section.key, "action": "dropped"})
+
+        user_prompt = self.user_prefix + "".join(texts[section.key] for section, _ in rendered) + self.user_suffix
+        messages = [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        return {
+            "template": self.name,
+            "messages": messages,
+            "estimated_tokens": total_tokens(),
+            "budget": budget,
+            "trimmed": trimmed
+        }
+
+
+# ======================
+# 小红书笔记
+# ======================
+NOTE_SYSTEM_PROMPT = """你是一个专业的小红书内容创作专家，擅长根据用户需求生成高质量的小红书图文笔记。
+
+请严格按照以下JSON格式返回结果：
+{
+    "note_title": "笔记标题（吸引人的标题，包含emoji）",
+    "note_content": "笔记正文（包含多个段落，使用emoji和换行符，适合小红书风格）",
+    "comment_guide": "评论区引导文案（鼓励用户互动的文案）",
+    "comment_questions": "评论区问题（3-5个引导性问题，用换行符分隔）"
+}
+
+要求：
+1. 标题要有吸引力，包含相关emoji
+2. 正文要符合指定的写作风格，多使用emoji，分段清晰
+3. 内容要针对目标受众，符合指定的内容类型
+4. 如果有近期热梗，要巧妙融入内容中
+5. 评论引导要能激发用户参与
+6. 问题要具体且容易回答
+7. 整体内容要围绕笔记目的展开
+8. 如果提供了账号信息，要根据账号类型和常驻话题优化内容风格和关键词"""
+
+NOTE_TEMPLATE = PromptTemplate(
+    name="note",
+    system_prompt=NOTE_SYSTEM_PROMPT,
+    user_prefix="请根据以下信息生成小红书笔记：\n",
+    sections=[
+        # 账号信息段落按账号预渲染，同一账号的请求前缀保持一致
+        PromptSection("account_block", "{value}", priority=5),
+        PromptSection("basic_content", "\n基本内容：{value}\n", required=True, truncatable=True),
+        PromptSection("note_purpose", "笔记目的：{value}\n", priority=6),
+        PromptSection("recent_trends", "近期热梗：{value}\n", priority=2, truncatable=True),
+        PromptSection("writing_style", "写作风格：{value}\n", priority=4),
+        PromptSection("target_audience", "目标受众：{value}\n", priority=4),
+        PromptSection("content_type", "内容类型：{value}\n", priority=3),
+        PromptSection("reference_links", "参考链接：{value}\n", priority=1, truncatable=True),
+    ]
+)
+
+
+# ======================
+# 割草机推广内容
+# ======================
+LAWN_MOWER_SYSTEM_PROMPT = """你是一位资深的内容运营专家，深耕智能家居与户外科技领域，专为库犸科技Mammotion品牌服务，擅长通过生活化内容拉近用户与智能割草机器人的距离。
+
+请根据用户提供的【产品信息】和【内容创作信息】，为Mammotion的智能割草机器人产品创作一篇用于【目标发布平台】的推广内容，核心目标是提升品牌认知、激发用户互动（点赞/评论/分享）并引导用户了解产品详情。
+
+你的所有创作都遵循 A-B-C 内容逻辑框架：
+A - 锚点 (Anchor): 用【开头钩子】精准锚定【用户画像】在【具体场景】中的草坪护理痛点或需求。
+B - 桥梁 (Bridge): 以【叙事视角】为线索，结合【内容逻辑】阐述Mammotion产品如何解决痛点，重点传递【内容价值主张】。
+C - 共鸣 (Resonate): 结尾呼应生活场景，强化产品带来的"轻松生活"价值，搭配自然的互动引导。
+
+【内容输出要求】
+整体要求：符合【目标发布平台】社交属性，内容轻量化、有画面感，avoid过度技术化表述，适配【内容风格】。
+标题要求：包含【开头钩子】元素（有【节日/时令】时结合节日），引发【用户画像】好奇，控制在60字符内。
+文案要求: 主体遵循A-B-C逻辑，穿插表情符号增强亲和力，合理分段（每段不超过3行），融入产品功能但侧重"解决问题后的生活改变"。
+{language_hint}
+
+请严格按照以下JSON格式返回结果：
+
+{{
+    "titles": {{
+        "chinese": [
+            "备选标题1",
+            "备选标题2"
+        ],
+        "english": [
+            "Alternative Title 1",
+            "Alternative Title 2"
+        ]
+    }},
+    "main_content": {{
+        "chinese": "中文主体文案内容",
+        "english": "English main content"
+    }},
+    "visual_suggestions": {{
+        "image_video_content": "图片/视频内容建议",
+        "scene_atmosphere": "场景氛围描述",
+        "composition_focus": "构图重点说明",
+        "color_tone": "色调建议"
+    }},
+    "interaction_guide": {{
+        "chinese": "中文互动引导问题",
+        "english": "English interaction guide"
+    }},
+    "hashtags": {{
+        "chinese": ["#中文标签1", "#中文标签2", "等"],
+        "english": ["#EnglishTag1", "#EnglishTag2", "etc"]
+    }}
+}}"""
+
+LAWN_MOWER_LANGUAGE_HINTS = {
+    "chinese": "语言要求：中英文均需输出，以中文文案为主稿，英文为对应译写。",
+    "english": "Language: output both Chinese and English; the English copy is the primary version and Chinese is the adaptation.",
+}
+
+LAWN_MOWER_SECTIONS = [
+    # 产品信息只随 SPU/SKU 变化，放在可变内容最前面
+    PromptSection("product", "【产品信息】\n产品系列/型号: {value}\n", required=True),
+    PromptSection("product_specs", "产品规格详情: {value}\n", priority=1, truncatable=True),
+    PromptSection("value_proposition", "\n【内容创作信息】\n内容价值主张: {value}\n", required=True, truncatable=True),
+    PromptSection("specific_scenario", "具体场景: {value}\n", required=True, truncatable=True),
+    PromptSection("user_persona", "用户画像: {value}\n", required=True, truncatable=True),
+    PromptSection("narrative_perspective", "叙事视角: {value}\n", required=True),
+    PromptSection("content_logic", "内容逻辑: {value}\n", required=True),
+    PromptSection("opening_hook", "开头钩子: {value}\n", required=True),
+    PromptSection("content_style", "内容风格: {value}\n", required=True),
+    PromptSection("holiday_season", "节日/时令: {value}\n", priority=2),
+    PromptSection("target_platform", "目标发布平台: {value}\n", required=True),
+    PromptSection("key_selling_points", "主打卖点: {value}\n", required=True, truncatable=True),
+]
+
+
+def _lawn_mower_template(language: str) -> PromptTemplate:
+    return PromptTemplate(
+        name=f"lawn_mower:{language}",
+        system_prompt=LAWN_MOWER_SYSTEM_PROMPT.format(language_hint=LAWN_MOWER_LANGUAGE_HINTS[language]),
+        user_prefix="",
+        sections=LAWN_MOWER_SECTIONS
+    )
+
+
+# 按接口/语言预编译的模板
+TEMPLATES: Dict[Tuple[str, str], PromptTemplate] = {
+    ("note", "chinese"): NOTE_TEMPLATE,
+    ("lawn_mower", "chinese"): _lawn_mower_template("chinese"),
+    ("lawn_mower", "english"): _lawn_mower_template("english"),
+}
+
+
+def get_template(endpoint: str, language: str = "chinese") -> PromptTemplate:
+    """获取指定接口和语言的模板，未知语言回退到中文"""
+    return TEMPLATES.get((endpoint, language)) or TEMPLATES[(endpoint, "chinese")]
+
+
+def render_note_prompt(values: Dict[str, Any], budget: Optional[int] = None) -> Dict[str, Any]:
+    """渲染小红书笔记提示词"""
+    return get_template("note").render(values, budget=budget)
+
+
+def render_lawn_mower_prompt(values: Dict[str, Any], language: str = "chinese", budget: Optional[int] = None) -> Dict[str, Any]:
+    """渲染割草机推广内容提示词"""
+    values = {
+        **values,
+        "product": f"{values.get('spu', '')} {values.get('sku') or ''}".strip(),
+        "holiday_season": values.get("holiday_season") or "无特定节日",
+    }
+    return get_template("lawn_mower", language).render(values, budget=budget)
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Any, Callable, List, Optional
+
+_RACE_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+class RaceResultStore:
+    """竞速模式中后台继续运行的模型结果
+
+    结果以 JSON 文件保存在本机目录中，同一容器内的多个 uvicorn worker 都能读取；
+    超过 RACE_RESULT_TTL 秒的记录在写入新记录时清理。
+    """
+
+    def __init__(self):
+        self.directory = os.getenv("RACE_RESULT_DIR", os.path.join(tempfile.gettempdir(), "lawn_mower_races"))
+        self.ttl = float(os.getenv("RACE_RESULT_TTL", "600"))
+        # 持有后台任务的引用，避免被垃圾回收
+        self._tasks = set()
+
+    def _path(self, race_id: str) -> str:
+        return os.path.join(self.directory, f"{race_id}.json")
+
+    def _write(self, race_id: str, record: Dict[str, Any]) -> None:
+        path = self._path(race_id)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def _cleanup(self) -> None:
+        cutoff = time.time() - self.ttl
+        try:
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+        except OSError:
+            pass
+
+    def get(self, race_id: str) -> Optional[Dict[str, Any]]:
+        if not _RACE_ID_RE.match(race_id):
+            return None
+        try:
+            with open(self._path(race_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def create(self, results: List[Dict[str, Any]], pending_models: List[str], failed: Dict[str, str]) -> str:
+        """登记一次竞速（results 为已完成的有效结果，优胜结果在前），返回 race_id"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._cleanup()
+        race_id = uuid.uuid4().hex
+        self._write(race_id, {
+            "race_id": race_id,
+            "created_at": datetime.now().isoformat(),
+            "results": list(results),
+            "pending_models": list(pending_models),
+            "failed_models": dict(failed),
+            "completed": not pending_models
+        })
+        return race_id
+
+    def track(self, race_id: str, model: str, task: asyncio.Task, is_valid: Callable[[Any], bool]) -> None:
+        """后台任务完成后把结果追加到竞速记录"""
+        self._tasks.add(task)
+
+        def on_done(done: asyncio.Task):
+            self._tasks.discard(done)
+            record = self.get(race_id)
+            if record is None:
+                return
+            if done.cancelled():
+                record["failed_models"][model] = "已取消"
+            elif done.exception() is not None:
+                record["failed_models"][model] = str(done.exception())
+            else:
+                _, parsed_content = done.result()
+                if is_valid(parsed_content):
+                    record["results"].append({**parsed_content, "model": model})
+                else:
+                    record["failed_models"][model] = "返回内容不符合输出格式"
+            record["pending_models"] = [m for m in record["pending_models"] if m != model]
+            record["completed"] = not record["pending_models"]
+            try:
+                self._write(race_id, record)
+            except OSError as e:
+                print(f"⚠️ 写入竞速结果失败 {race_id}: {e}")
+
+        task.add_done_callback(on_done)
+
+
+# 创建服务实例
+race_store = RaceResultStore()
@@ -0,0 +1,209 @@
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from typing import Dict, Any, List, Optional, Set, Tuple
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from app.models import XiaohongshuNote
+
+# 参与相似度计算的输入字段，基本内容权重最高
+SIMILARITY_FIELDS = [
+    ("input_basic_content", 3),
+    ("input_recent_trends", 1),
+    ("input_note_purpose", 1),
+    ("input_writing_style", 1),
+    ("input_target_audience", 1),
+    ("input_content_type", 1),
+]
+
+NGRAM_SIZES = (2, 3)
+# 最多跟踪的 id 空洞区间数
+MAX_GAPS = 100
+
+
+class SimilarityCache:
+    """最近生成输入的进程内相似度索引
+
+    对输入文本提取字符 2/3-gram，按 TF-IDF 加权计算余弦相似度；
+    通过倒排表只对共享 n-gram 的候选打分。索引从 xiaohongshu_notes 增量加载，
+    只保留最近 SIMILARITY_CACHE_SIZE 条，全部在 CPU 上本地计算。
+
+    id 的分配顺序与提交顺序不一致（异步写入按区间预分配 id、并发事务先后提交），
+    水位之下可能还有未提交的笔记：加载时记录 id 空洞，之后的刷新中重新查询，
+    SIMILARITY_CACHE_GAP_TTL 秒后仍未出现的空洞视为已回滚或删除。
+    """
+
+    def __init__(self):
+        self.max_entries = int(os.getenv("SIMILARITY_CACHE_SIZE", "5000"))
+        self.threshold = float(os.getenv("SIMILARITY_REUSE_THRESHOLD", "0.75"))
+        # 草稿只用于生成期间先行展示，阈值可以更低
+        self.draft_threshold = float(os.getenv("SIMILARITY_DRAFT_THRESHOLD", "0.3"))
+        self.refresh_interval = float(os.getenv("SIMILARITY_CACHE_REFRESH", "30"))
+        self.gap_ttl = float(os.getenv("SIMILARITY_CACHE_GAP_TTL", "600"))
+        # 每次查询最多精确打分的候选数
+        self.max_candidates = 200
+        self._entries: "OrderedDict[int, Tuple[Tuple, Counter]]" = OrderedDict()
+        self._postings: Dict[str, Set[int]] = defaultdict(set)
+        self._document_frequency: Counter = Counter()
+        self._last_id = 0
+        # 水位之下尚未加载的 id 区间：(起始 id, 结束 id, 发现时刻)，均为闭区间
+        self._gaps: List[Tuple[int, int, float]] = []
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _ngrams(note: Dict[str, Any]) -> Counter:
+        grams: Counter = Counter()
+        for field, weight in SIMILARITY_FIELDS:
+            text = re.sub(r"[\W_]+", "", (note.get(field) or "").lower())
+            for size in NGRAM_SIZES:
+                if len(text) < size:
+                    continue
+                for i in range(len(text) - size + 1):
+                    grams[text[i:i + size]] += weight
+        return grams
+
+    @staticmethod
+    def _scope(note: Dict[str, Any]) -> Tuple:
+        """只在同一模型、同一账号的历史中复用"""
+        account = note.get("input_selected_account_id") or (note.get("input_account_name") or "").strip().lower()
+        return note.get("model"), account
+
+    def _idf(self, gram: str) -> float:
+        return math.log((len(self._entries) + 1) / (self._document_frequency[gram] + 1)) + 1.0
+
+    def _add_locked(self, note_id: int, note: Dict[str, Any]) -> None:
+        if note_id in self._entries:
+            return
+        grams = self._ngrams(note)
+        if not grams:
+            return
+        self._entries[note_id] = (self._scope(note), grams)
+        for gram in grams:
+            self._postings[gram].add(note_id)
+            self._document_frequency[gram] += 1
+        while len(self._entries) > self.max_entries:
+            self._remove_locked(next(iter(self._entries)))
+
+    def _remove_locked(self, note_id: int) -> None:
+        entry = self._entries.pop(note_id, None)
+        if entry is None:
+            return
+        for gram in entry[1]:
+            postings = self._postings.get(gram)
+            if postings is not None:
+                postings.discard(note_id)
+                if not postings:
+                    del self._postings[gram]
+            self._document_frequency[gram] -= 1
+            if self._document_frequency[gram] <= 0:
+                del self._document_frequency[gram]
+
+    def add(self, note_id: int, note: Dict[str, Any]) -> None:
+        """把新保存的笔记加入索引"""
+        with self._lock:
+            self._add_locked(note_id, note)
+
+    def discard(self, note_id: int) -> None:
+        """笔记被删除或修改后移出索引"""
+        with self._lock:
+            self._remove_locked(note_id)
+
+    @staticmethod
+    def _find_gaps(start: int, ids: List[int], seen_at: float) -> List[Tuple[int, int, float]]:
+        """[start, max(ids)] 中没有出现在 ids 里的区间"""
+        gaps = []
+        expected = start
+        for note_id in sorted(ids):
+            if note_id > expected:
+                gaps.append((expected, note_id - 1, seen_at))
+            expected = max(expected, note_id + 1)
+        return gaps
+
+    def refresh(self, db: Session, force: bool = False) -> None:
+        """增量加载上次之后新增的笔记（包括其他 worker 写入的），并重新查询水位之下的 id 空洞"""
+        if not force and time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+        now = time.monotonic()
+        with self._lock:
+            last_id = self._last_id
+            gaps = [gap for gap in self._gaps if now - gap[2] < self.gap_ttl]
+        columns = [XiaohongshuNote.id, XiaohongshuNote.model, XiaohongshuNote.input_selected_account_id,
+                   XiaohongshuNote.input_account_name] + [getattr(XiaohongshuNote, field) for field, _ in SIMILARITY_FIELDS]
+        keys = [column.key for column in columns]
+        rows = (
+            db.query(*columns)
+            .filter(or_(XiaohongshuNote.id > last_id, *[XiaohongshuNote.id.between(lo, hi) for lo, hi, _ in gaps]))
+            .order_by(XiaohongshuNote.id.desc())
+            .limit(self.max_entries)
+            .all()
+        )
+        with self._lock:
+            for row in reversed(rows):
+                note = dict(zip(keys, row))
+                self._add_locked(note["id"], note)
+            # 水位只由数据库加载推进，本进程直接加入的笔记不影响其他 worker 笔记的加载
+            loaded = [row.id for row in rows]
+            remaining = []
+            for lo, hi, seen_at in gaps:
+                remaining.extend(self._find_gaps(lo, [i for i in loaded if lo <= i <= hi] + [hi + 1], seen_at))
+            newer = [i for i in loaded if i > last_id]
+            if newer:
+                # 首次加载或新增笔记超过上限时只取最近的笔记，不跟踪更早的空洞
+                if last_id and len(rows) < self.max_entries:
+                    remaining.extend(self._find_gaps(last_id + 1, newer, now))
+                self._last_id = max(newer)
+            self._gaps = remaining[-MAX_GAPS:]
+            self._refreshed_at = time.monotonic()
+        if rows:
+            print(f"🧠 相似度索引已加载 {len(rows)} 条新笔记，共 {len(self._entries)} 条")
+
+    def find(
+        self,
+        db: Session,
+        note: Dict[str, Any],
+        threshold: Optional[float] = None,
+        limit: int = 1
+    ) -> List[Dict[str, Any]]:
+        """查找同模型、同账号下输入相似度不低于阈值的历史笔记，按相似度降序"""
+        threshold = self.threshold if threshold is None else threshold
+        self.refresh(db)
+        grams = self._ngrams(note)
+        if not grams:
+            return []
+        scope = self._scope(note)
+
+        with self._lock:
+            weights = {gram: count * self._idf(gram) for gram, count in grams.items()}
+            query_norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+
+            # 先按共享 n-gram 数粗筛候选，再精确计算余弦相似度
+            overlap: Counter = Counter()
+            for gram in grams:
+                for note_id in self._postings.get(gram, ()):
+                    if self._entries[note_id][0] == scope:
+                        overlap[note_id] += 1
+
+            matches = []
+            for note_id, _ in overlap.most_common(self.max_candidates):
+                document = self._entries[note_id][1]
+                dot = 0.0
+                norm = 0.0
+                for gram, count in document.items():
+                    weight = count * self._idf(gram)
+                    norm += weight * weight
+                    if gram in weights:
+                        dot += weight * weights[gram]
+                similarity = dot / (query_norm * math.sqrt(norm)) if norm else 0.0
+                if similarity >= threshold:
+                    matches.append({"note_id": note_id, "similarity": round(similarity, 4)})
+
+        matches.sort(key=lambda match: match["similarity"], reverse=True)
+        return matches[:limit]
+
+
+# 创建服务实例
+similarity_cache = SimilarityCache()
@@ -0,0 +1,55 @@
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional, Tuple
+
+# 当前请求已记录的阶段耗时 [(阶段, 毫秒, 说明)]；列表在请求派生的任务和线程间共享
+_timings: ContextVar[Optional[List[Tuple[str, float, Optional[str]]]]] = ContextVar("request_timings", default=None)
+
+_TOKEN_RE = re.compile(r"[^A-Za-z0-9!#$%&'*+.^_`|~-]")
+
+
+def start():
+    """开始记录当前请求的阶段耗时，返回用于恢复的 token"""
+    return _timings.set([])
+
+
+def reset(token) -> None:
+    _timings.reset(token)
+
+
+def record(name: str, duration_ms: float, description: Optional[str] = None) -> None:
+    """记录一个阶段；不在请求内（如后台任务、脚本）时忽略"""
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((name, duration_ms, description))
+
+
+@contextmanager
+def stage(name: str, description: Optional[str] = None) -> Iterator[None]:
+    """记录代码块的耗时"""
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - start_time) * 1000, description)
+
+
+def server_timing_header(total_ms: Optional[float] = None) -> Optional[str]:
+    """按 Server-Timing 规范格式化当前请求的阶段耗时，例如
+
+    prompt;dur=1.2, upstream;dur=5321.0;desc="gpt-4o", parse;dur=0.8;desc="json", db;dur=12.4, app;dur=5340.1
+    """
+    timings = list(_timings.get() or [])
+    if total_ms is not None:
+        timings.append(("app", total_ms, None))
+    if not timings:
+        return None
+    entries = []
+    for name, duration_ms, description in timings:
+        entry = f"{_TOKEN_RE.sub('-', name)};dur={duration_ms:.1f}"
+        if description:
+            entry += ';desc="{}"'.format(description.replace('\\', '\\\\').replace('"', '\\"'))
+        entries.append(entry)
+    return ", ".join(entries)
@@ -0,0 +1,313 @@
+import asyncio
+import atexit
+import json
+import os
+import random
+import re
+import secrets
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+# OTLP 中 SpanKind / StatusCode 的取值
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+REQUEST_ID_HEADER = "x-request-id"
+TRACE_EXPORTERS = ("none", "console", "file")
+# 记录到 span 中的 SQL 语句最大长度（只记录带占位符的语句，不含参数）
+MAX_STATEMENT_LENGTH = 2000
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+
+class Span:
+    """一个调用阶段，字段与 OpenTelemetry 的 span 对应（W3C trace id / span id）"""
+
+    def __init__(self, tracer: "Tracer", name: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 request_id: Optional[str], kind: int, attributes: Optional[Dict[str, Any]]):
+        self._tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.request_id = request_id
+        self.kind = kind
+        self.attributes: Dict[str, Any] = {}
+        self.events: List[tuple] = []
+        self.status = STATUS_UNSET
+        self.status_message: Optional[str] = None
+        # 本进程内的根 span（请求入口或无父 span 的调用），结束时导出整批
+        self.local_root = False
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.set_attributes(attributes or {})
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def add_event(self, name: str, attributes: Optional[Dict[str, Any]] = None) -> None:
+        self.events.append((time.time_ns(), name, attributes or {}))
+
+    def set_error(self, error: Union[BaseException, str]) -> None:
+        self.status = STATUS_ERROR
+        if isinstance(error, BaseException):
+            self.status_message = str(error) or type(error).__name__
+            self.add_event("exception", {"exception.type": type(error).__name__, "exception.message": str(error)})
+        else:
+            self.status_message = error
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self._tracer._on_end(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": self.status},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        if self.events:
+            span["events"] = [
+                {"timeUnixNano": str(at), "name": name, "attributes": _otlp_attributes(attributes)}
+                for at, name, attributes in self.events
+            ]
+        return span
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(item) for item in value]}}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[tuple]:
+    """解析 W3C traceparent，返回 (trace_id, parent_span_id, sampled)"""
+    match = _TRACEPARENT_RE.match((header or "").strip().lower())
+    if not match or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """与 OpenTelemetry 兼容的轻量追踪
+
+    不依赖 OpenTelemetry SDK：trace id / span id 与 traceparent 遵循 W3C Trace Context，
+    上游带 traceparent 时沿用其 trace；span 以 OTLP/JSON 格式导出，无需外部 collector。
+    - TRACE_EXPORTER=file：每个 worker 写 TRACE_DIR/traces-<pid>.jsonl，每行一个 ExportTraceServiceRequest，
+      可由 OpenTelemetry Collector 的 otlpjsonfile receiver 读取，或直接用 jq 分析
+    - TRACE_EXPORTER=console：每个 span 结束时打印一行摘要
+    - TRACE_EXPORTER=none（默认）：仍生成 trace id 并向 One-API 传递请求 id，但不导出
+    TRACE_SAMPLE_RATE 控制新 trace 的导出比例，上游 traceparent 的采样标记优先。
+    """
+
+    def __init__(self):
+        self.exporter = os.getenv("TRACE_EXPORTER", "none").lower()
+        if self.exporter not in TRACE_EXPORTERS:
+            print(f"⚠️ 未知的 TRACE_EXPORTER: {self.exporter}，不导出追踪数据")
+            self.exporter = "none"
+        self.directory = os.getenv("TRACE_DIR", os.path.join(tempfile.gettempdir(), "traces"))
+        self.sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", "1"))
+        self.batch_size = int(os.getenv("TRACE_BATCH_SIZE", "256"))
+        self.service_name = os.getenv("OTEL_SERVICE_NAME", "xiaohongshu-backend")
+        self._pending: List[Span] = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.exported_spans = 0
+        atexit.register(self.flush)
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter != "none"
+
+    def start_span(self, name: str, attributes: Optional[Dict[str, Any]] = None, kind: int = KIND_INTERNAL) -> Span:
+        """以当前 span 为父创建 span（不设为当前 span）"""
+        parent = _current.get()
+        if parent is None:
+            span = Span(self, name, secrets.token_hex(16), None, self._sample(), None, kind, attributes)
+            span.local_root = True
+            return span
+        return Span(self, name, parent.trace_id, parent.span_id, parent.sampled, parent.request_id, kind, attributes)
+
+    def start_request_span(self, name: str, traceparent: Optional[str], request_id: Optional[str],
+                           attributes: Optional[Dict[str, Any]] = None) -> Span:
+        """创建请求入口的 span；沿用上游 traceparent，请求 id 取 X-Request-ID，缺失或不合法时使用 trace id"""
+        remote = parse_traceparent(traceparent)
+        if remote is not None:
+            trace_id, parent_id, sampled = remote
+        else:
+            trace_id, parent_id, sampled = secrets.token_hex(16), None, self._sample()
+        if not request_id or not _REQUEST_ID_RE.match(request_id):
+            request_id = trace_id
+        span = Span(self, name, trace_id, parent_id, sampled, request_id, KIND_SERVER, attributes)
+        span.set_attribute("request.id", request_id)
+        span.local_root = True
+        return span
+
+    @contextmanager
+    def span(self, name: str, attributes: Optional[Dict[str, Any]] = None, kind: int = KIND_INTERNAL) -> Iterator[Span]:
+        """创建子 span 并在代码块内设为当前 span；代码块抛出异常时记录为错误"""
+        span = self.start_span(name, attributes, kind)
+        token = _current.set(span)
+        try:
+            yield span
+        except asyncio.CancelledError:
+            span.set_attribute("cancelled", True)
+            raise
+        except Exception as e:
+            span.set_error(e)
+            raise
+        finally:
+            _current.reset(token)
+            span.end()
+
+    def _sample(self) -> bool:
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def _on_end(self, span: Span) -> None:
+        if not self.enabled or not span.sampled:
+            return
+        if self.exporter == "console":
+            duration_ms = (span.end_ns - span.start_ns) / 1e6
+            status = " ❌ " + (span.status_message or "") if span.status == STATUS_ERROR else ""
+            print(f"🧵 {span.trace_id}/{span.span_id} {span.name} {duration_ms:.1f}ms "
+                  f"{json.dumps(span.attributes, ensure_ascii=False, default=str)}{status}")
+            return
+        with self._lock:
+            self._pending.append(span)
+            if not span.local_root and len(self._pending) < self.batch_size:
+                return
+            spans, self._pending = self._pending, []
+        self._write(spans)
+
+    def flush(self) -> None:
+        """导出尚未写出的 span（请求结束后仍在运行的后台调用等）"""
+        with self._lock:
+            spans, self._pending = self._pending, []
+        if spans:
+            self._write(spans)
+
+    def _write(self, spans: List[Span]) -> None:
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({"service.name": self.service_name, "process.pid": os.getpid()})},
+                "scopeSpans": [{"scope": {"name": "app.tracing"}, "spans": [span.to_otlp() for span in spans]}]
+            }]
+        }
+        line = json.dumps(payload, ensure_ascii=False, default=str) + "\n"
+        try:
+            with self._write_lock:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(os.path.join(self.directory, f"traces-{os.getpid()}.jsonl"), "a", encoding="utf-8") as f:
+                    f.write(line)
+                self.exported_spans += len(spans)
+        except OSError as e:
+            print(f"⚠️ 追踪数据写入失败: {e}")
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def activate(span: Span):
+    """把 span 设为当前 span，返回用于恢复的 token"""
+    return _current.set(span)
+
+
+def deactivate(token) -> None:
+    _current.reset(token)
+
+
+def request_id() -> Optional[str]:
+    span = _current.get()
+    return span.request_id if span is not None else None
+
+
+def outgoing_headers() -> Dict[str, str]:
+    """调用上游时携带的 traceparent 与 X-Request-ID"""
+    span = _current.get()
+    if span is None:
+        return {}
+    headers = {"traceparent": span.traceparent}
+    if span.request_id:
+        headers["X-Request-ID"] = span.request_id
+    return headers
+
+
+def instrument_engine(engine) -> None:
+    """为引擎执行的每条语句创建 db span；只在已有 trace（请求内）时记录，语句参数不记录"""
+    from sqlalchemy import event
+
+    system = engine.dialect.name
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is None:
+            return
+        operation = (statement.lstrip().split(None, 1) or ["QUERY"])[0].upper()
+        span = tracer.start_span(f"db {operation}", {
+            "db.system": system,
+            "db.operation": operation,
+            "db.statement": statement[:MAX_STATEMENT_LENGTH],
+            "db.executemany": executemany,
+        }, KIND_CLIENT)
+        conn.info.setdefault("trace_spans", []).append(span)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("trace_spans")
+        if spans:
+            span = spans.pop()
+            if cursor.rowcount is not None and cursor.rowcount >= 0:
+                span.set_attribute("db.rowcount", cursor.rowcount)
+            span.end()
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        conn = exception_context.connection
+        spans = conn.info.get("trace_spans") if conn is not None else None
+        if spans:
+            span = spans.pop()
+            span.set_error(exception_context.original_exception)
+            span.end()
+
+
+# 创建服务实例
+tracer = Tracer()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+One-API 本地模拟服务
+
+模拟 /v1/chat/completions，用于压测时不消耗真实 token。支持：
+- 对数正态分布的响应延迟（中位数 + sigma）
+- 按比例返回 429（带 Retry-After）和 500
+- 按比例返回非标准 JSON 的内容，覆盖备用解析路径
+- stream=true 时以 SSE 分块返回
+根据系统提示词区分小红书笔记与割草机推广内容，返回对应结构的 JSON。
+GET /stats 返回各状态的请求计数。
+
+用法：python benchmarks/mock_one_api.py [--port 9100] [--latency-median-ms 800] [--latency-sigma 0.4]
+      [--error-rate 0.01] [--rate-limit-rate 0.02] [--malformed-rate 0.02] [--stream-chunk-ms 20]
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="One-API 本地模拟服务")
+    add_mock_arguments(parser)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    return parser
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser) -> None:
+    """模拟服务的行为参数（压测脚本复用同一组参数）"""
+    parser.add_argument("--latency-median-ms", type=float, default=800.0, help="响应延迟中位数（毫秒）")
+    parser.add_argument("--latency-sigma", type=float, default=0.4, help="对数正态分布的 sigma，越大长尾越重")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回 429 的比例")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="返回非标准 JSON 内容的比例")
+    parser.add_argument("--stream-chunk-ms", type=float, default=20.0, help="流式响应每个分块的间隔（毫秒）")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子，便于复现")
+
+
+def _note_content(index: int) -> dict:
+    return {
+        "note_title": f"✨ 模拟笔记标题 {index}",
+        "note_content": "这是一篇模拟生成的小红书笔记 💕\n\n" + "正文段落内容，用于压测。\n" * 10,
+        "comment_guide": "评论区告诉我你的想法吧！",
+        "comment_questions": "你最喜欢哪一点？\n你会推荐给朋友吗？\n还想看什么内容？"
+    }
+
+
+def _lawn_mower_content(index: int) -> dict:
+    return {
+        "titles": {
+            "chinese": [f"模拟标题 {index}", "告别周末除草"],
+            "english": [f"Mock Title {index}", "Say Goodbye to Weekend Mowing"]
+        },
+        "main_content": {
+            "chinese": "模拟的割草机推广文案。\n" * 5,
+            "english": "Mock lawn mower promotional copy.\n" * 5
+        },
+        "visual_suggestions": {
+            "image_video_content": "庭院全景",
+            "scene_atmosphere": "轻松惬意",
+            "composition_focus": "割草机器人",
+            "color_tone": "明亮绿色"
+        },
+        "interaction_guide": {
+            "chinese": "你家草坪多大？",
+            "english": "How big is your lawn?"
+        },
+        "hashtags": {
+            "chinese": ["#智能割草", "#庭院生活"],
+            "english": ["#RobotMower", "#LawnCare"]
+        }
+    }
+
+
+def _malformed(content: str) -> str:
+    """生成非标准 JSON：截断的 JSON 或纯文本"""
+    if random.random() < 0.5:
+        return content[: max(1, len(content) // 2)]
+    return "标题：模拟标题\n\n正文：这是一段不是JSON的模拟内容。\n\n评论引导：欢迎留言\n\n问题：你怎么看？"
+
+
+def build_app(config: argparse.Namespace) -> FastAPI:
+    app = FastAPI(title="Mock One-API")
+    stats: Counter = Counter()
+    mu = math.log(max(config.latency_median_ms, 0.001) / 1000.0)
+
+    def sample_latency() -> float:
+        return math.exp(random.gauss(mu, config.latency_sigma)) if config.latency_median_ms > 0 else 0.0
+
+    @app.get("/stats")
+    async def get_stats():
+        return dict(stats)
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        stats.clear()
+        return {"success": True}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages") or []
+        model = body.get("model", "mock")
+        stats["requests"] += 1
+        index = stats["requests"]
+
+        roll = random.random()
+        if roll < config.rate_limit_rate:
+            stats["429"] += 1
+            await asyncio.sleep(0.01)
+            return JSONResponse(
+                status_code=429,
+                headers={"Retry-After": "1"},
+                content={"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error"}}
+            )
+        if roll < config.rate_limit_rate + config.error_rate:
+            stats["500"] += 1
+            await asyncio.sleep(sample_latency() / 4)
+            return JSONResponse(status_code=500, content={"error": {"message": "Upstream error (mock)", "type": "server_error"}})
+
+        system_prompt = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+        payload = _lawn_mower_content(index) if "Mammotion" in system_prompt else _note_content(index)
+        content = json.dumps(payload, ensure_ascii=False)
+        if random.random() < config.malformed_rate:
+            stats["malformed"] += 1
+            content = _malformed(content)
+
+        prompt_chars = sum(len(m.get("content") or "") for m in messages)
+        usage = {
+            "prompt_tokens": prompt_chars // 2,
+            "completion_tokens": len(content) // 2,
+            "total_tokens": prompt_chars // 2 + len(content) // 2
+        }
+        completion_id = f"chatcmpl-mock-{index}"
+        created = int(time.time())
+        n = max(1, int(body.get("n") or 1))
+
+        if body.get("stream"):
+            stats["stream"] += 1
+
+            async def event_stream():
+                # 首个分块前等待完整延迟，模拟首 token 时间
+                await asyncio.sleep(sample_latency())
+                step = max(1, len(content) // 20)
+                for start in range(0, len(content), step):
+                    chunk = {
+                        "id": completion_id,
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": content[start:start + step]}, "finish_reason": None}]
+                    }
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                    await asyncio.sleep(config.stream_chunk_ms / 1000.0)
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+        await asyncio.sleep(sample_latency())
+        stats["200"] += 1
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [
+                {"index": i, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+                for i in range(n)
+            ],
+            "usage": usage
+        }
+
+    return app
+
+
+def main():
+    args = build_parser().parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+    print(f"🧪 One-API 模拟服务: http://{args.host}:{args.port}/v1/chat/completions")
+    uvicorn.run(build_app(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+列表接口序列化耗时基准测试
+
+对比旧路径（逐行手工构造 dict -> FastAPI response_model 校验 -> jsonable_encoder -> json）
+与新路径（按列查询的行 -> dict(zip) -> FastJSONResponse）序列化 100/1000 行的耗时。
+不需要数据库。
+
+用法：python benchmarks/serialization_bench.py [--rows 100 1000] [--repeat 50]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 基准测试不连接数据库
+os.environ.setdefault("FASTAPI_DB_URL", "sqlite://")
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from app.models import XiaohongshuNote
+from app.schemas import NoteOut
+from app.serializers import FastJSONResponse, NOTE_OUT_FIELDS, rows_to_dicts, orjson
+
+
+def make_notes(count: int) -> List[XiaohongshuNote]:
+    now = datetime.now()
+    return [
+        XiaohongshuNote(
+            id=i,
+            input_basic_content=f"基础内容 {i} " * 5,
+            input_note_purpose="种草",
+            input_writing_style="轻松幽默",
+            input_target_audience="职场女性",
+            input_account_name="测试账号",
+            input_platform="小红书",
+            input_selected_account_id=1,
+            note_title=f"✨ 标题 {i}",
+            note_content="正文内容 💕\n\n" * 20,
+            comment_guide="评论区聊聊吧！",
+            comment_questions="问题1\n问题2\n问题3",
+            model="gpt-4o",
+            created_at=now - timedelta(minutes=i),
+            updated_at=None,
+        )
+        for i in range(count)
+    ]
+
+
+def legacy_path(notes, field) -> bytes:
+    """旧实现：逐字段构造 dict，再由 FastAPI 按 response_model 校验并编码"""
+    result = []
+    for note in notes:
+        result.append({
+            "id": note.id,
+            "input_basic_content": note.input_basic_content,
+            "input_note_purpose": note.input_note_purpose,
+            "input_recent_trends": note.input_recent_trends,
+            "input_writing_style": note.input_writing_style,
+            "input_target_audience": note.input_target_audience,
+            "input_content_type": note.input_content_type,
+            "input_reference_links": note.input_reference_links,
+            "input_account_name": note.input_account_name,
+            "input_account_type": note.input_account_type,
+            "input_topic_keywords": note.input_topic_keywords,
+            "input_platform": note.input_platform,
+            "input_selected_account_id": note.input_selected_account_id,
+            "note_title": note.note_title,
+            "note_content": note.note_content,
+            "comment_guide": note.comment_guide,
+            "comment_questions": note.comment_questions,
+            "model": note.model,
+            "created_at": note.created_at,
+            "updated_at": note.updated_at
+        })
+    content = asyncio.run(serialize_response(field=field, response_content=result))
+    return JSONResponse(content).body
+
+
+def fast_path(rows) -> bytes:
+    """新实现：按列查询的行直接 zip 成 dict，一次序列化"""
+    return FastJSONResponse(rows_to_dicts(NOTE_OUT_FIELDS, rows)).body
+
+
+def bench(func, *args, repeat: int) -> float:
+    func(*args)  # 预热
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(*args)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="列表接口序列化基准测试")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    field = create_response_field(name="Response_get_notes", type_=List[NoteOut])
+    print(f"JSON 编码器: {'orjson' if orjson else 'json（未安装 orjson）'}")
+    print(f"{'行数':>6} {'旧路径(ms)':>12} {'新路径(ms)':>12} {'加速比':>8}")
+    for count in args.rows:
+        notes = make_notes(count)
+        rows = [tuple(getattr(note, name) for name in NOTE_OUT_FIELDS) for note in notes]
+        legacy = bench(legacy_path, notes, field, repeat=args.repeat)
+        fast = bench(fast_path, rows, repeat=args.repeat)
+        print(f"{count:>6} {legacy:>12.2f} {fast:>12.2f} {legacy / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
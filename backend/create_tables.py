@@ -44,7 +44,16 @@ def create_tables():
                 ("input_platform", "VARCHAR(50)"),
                 ("input_selected_account_id", "INTEGER"),
                 ("model", "VARCHAR(50)"),
-                ("updated_at", "TIMESTAMP")
+                ("updated_at", "TIMESTAMP"),
+                ("input_fingerprint", "VARCHAR(64)"),
+                ("content_fingerprint", "VARCHAR(64)"),
+                ("content_simhash", "BIGINT"),
+                ("simhash_band_0", "INTEGER"),
+                ("simhash_band_1", "INTEGER"),
+                ("simhash_band_2", "INTEGER"),
+                ("simhash_band_3", "INTEGER"),
+                ("latency_ms", "INTEGER"),
+                ("total_tokens", "INTEGER")
             ]
             
             print("🔍 检查需要添加的字段...")
@@ -59,6 +68,20 @@ def create_tables():
                 else:
                     print(f"ℹ️  字段 {column_name} 已存在")
             
+            # 创建指纹相关索引
+            index_statements = [
+                "CREATE INDEX IF NOT EXISTS ix_xiaohongshu_notes_input_fingerprint ON xiaohongshu_notes (input_fingerprint)",
+                "CREATE INDEX IF NOT EXISTS ix_notes_account_content_fp ON xiaohongshu_notes (input_selected_account_id, content_fingerprint)",
+            ] + [
+                f"CREATE INDEX IF NOT EXISTS ix_notes_account_band_{i} ON xiaohongshu_notes (input_selected_account_id, simhash_band_{i})"
+                for i in range(4)
+            ]
+            for statement in index_statements:
+                try:
+                    conn.execute(text(statement))
+                except Exception as e:
+                    print(f"❌ 创建索引失败: {e}")
+            
             # 检查并添加 client_accounts 表的字段
             if 'client_accounts' in inspector.get_table_names():
                 client_columns = [
@@ -72,6 +95,16 @@ def create_tables():
                             print(f"✅ 成功添加 client_accounts 字段: {column_name}")
                         except Exception as e:
                             print(f"❌ 添加 client_accounts 字段 {column_name} 失败: {e}")
+                
+                # topic_keywords 转为 JSONB 并建立 GIN 索引
+                try:
+                    column_types = {col['name']: str(col['type']).upper() for col in inspector.get_columns('client_accounts')}
+                    if column_types.get('topic_keywords') == 'JSON':
+                        conn.execute(text("ALTER TABLE client_accounts ALTER COLUMN topic_keywords TYPE JSONB USING topic_keywords::jsonb"))
+                        print("✅ topic_keywords 已转换为 JSONB")
+                    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_client_accounts_topic_keywords ON client_accounts USING GIN (topic_keywords)"))
+                except Exception as e:
+                    print(f"❌ 创建 topic_keywords 索引失败: {e}")
             
             conn.commit()
             print("✅ 数据库结构更新完成")
@@ -80,6 +113,60 @@ def create_tables():
             print(f"❌ 更新表结构失败: {e}")
             conn.rollback()
 
+def backfill_fingerprints(batch_size=1000):
+    """为历史笔记补全内容指纹"""
+    from sqlalchemy.orm import Session
+    from app.models import XiaohongshuNote
+    from app.services.fingerprint_service import fingerprint_service
+    
+    engine = create_engine(DATABASE_URL)
+    total = 0
+    with Session(engine) as db:
+        while True:
+            notes = (
+                db.query(XiaohongshuNote)
+                .filter(XiaohongshuNote.content_simhash.is_(None))
+                .order_by(XiaohongshuNote.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not notes:
+                break
+            for note in notes:
+                note_data = {column.name: getattr(note, column.name) for column in XiaohongshuNote.__table__.columns}
+                for field, value in fingerprint_service.fingerprint_note(note_data).items():
+                    setattr(note, field, value)
+            db.commit()
+            total += len(notes)
+            print(f"🔄 已补全 {total} 条笔记指纹")
+    print(f"✅ 指纹补全完成，共 {total} 条")
+
+def rebuild_note_stats():
+    """根据笔记表全量重建汇总统计表"""
+    from sqlalchemy.orm import Session
+    from app.services.analytics_service import analytics_service
+    
+    engine = create_engine(DATABASE_URL)
+    with Session(engine) as db:
+        analytics_service.rebuild(db)
+    print("✅ 笔记汇总统计重建完成")
+
+def partition_notes():
+    """把笔记表迁移为按月分区表"""
+    from app.services.partition_service import partition_service
+    partition_service.migrate_to_partitioned()
+
+def archive_old_partitions(retention_months):
+    """归档早于保留期的笔记分区"""
+    from app.services.partition_service import partition_service
+    archived = partition_service.apply_retention(retention_months)
+    print(f"✅ 归档完成，共 {len(archived)} 个分区")
+
+def restore_archive(path):
+    """从归档文件恢复笔记"""
+    from app.services.partition_service import partition_service
+    partition_service.restore_archive(path)
+
 def check_database_structure():
     """检查数据库结构"""
     engine = create_engine(DATABASE_URL)
@@ -96,9 +183,24 @@ if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description='数据库表管理')
     parser.add_argument('--check', action='store_true', help='检查数据库结构')
+    parser.add_argument('--backfill-fingerprints', action='store_true', help='为历史笔记补全内容指纹')
+    parser.add_argument('--rebuild-stats', action='store_true', help='全量重建笔记汇总统计表')
+    parser.add_argument('--partition-notes', action='store_true', help='把笔记表迁移为按月分区表')
+    parser.add_argument('--archive-partitions', type=int, metavar='MONTHS', help='归档早于最近 MONTHS 个月的笔记分区')
+    parser.add_argument('--restore-archive', metavar='PATH', help='从归档文件恢复笔记')
     args = parser.parse_args()
     
     if args.check:
         check_database_structure()
+    elif args.backfill_fingerprints:
+        backfill_fingerprints()
+    elif args.rebuild_stats:
+        rebuild_note_stats()
+    elif args.partition_notes:
+        partition_notes()
+    elif args.archive_partitions is not None:
+        archive_old_partitions(args.archive_partitions)
+    elif args.restore_archive:
+        restore_archive(args.restore_archive)
     else:
         create_tables() 
\ No newline at end of file
@@ -0,0 +1,6 @@
+import os
+
+# 导入 app 前设置：单元测试不连接 PostgreSQL，也不访问上游模型
+os.environ.setdefault("FASTAPI_DB_URL", "sqlite://")
+os.environ.setdefault("ONE_API_KEY", "sk-test")
+os.environ.setdefault("ONE_API_URL", "http://127.0.0.1:9")
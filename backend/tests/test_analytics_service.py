@@ -0,0 +1,86 @@
+from collections import defaultdict
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models import NoteDailyStat, XiaohongshuNote
+from app.services.analytics_service import analytics_service
+
+FIELDS = ("note_count", "regenerate_count", "latency_ms_sum", "latency_samples", "tokens_sum", "token_samples")
+
+
+def expected_rollup(db):
+    """按 rebuild 的口径在 Python 中计算汇总结果"""
+    notes = db.query(XiaohongshuNote).all()
+    earliest = {}
+    for note in notes:
+        if note.input_fingerprint:
+            earliest[note.input_fingerprint] = min(earliest.get(note.input_fingerprint, note.created_at), note.created_at)
+    rollup = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+    for note in notes:
+        bucket = rollup[(note.created_at.date(), note.model or "", note.input_platform or "", note.input_selected_account_id or 0)]
+        bucket["note_count"] += 1
+        bucket["regenerate_count"] += int(bool(note.input_fingerprint) and note.created_at > earliest[note.input_fingerprint])
+        if note.latency_ms is not None:
+            bucket["latency_ms_sum"] += note.latency_ms
+            bucket["latency_samples"] += 1
+        if note.total_tokens is not None:
+            bucket["tokens_sum"] += note.total_tokens
+            bucket["token_samples"] += 1
+    return rollup
+
+
+def stored_rollup(db):
+    return {
+        (row.stat_date, row.model, row.platform, row.account_id): {field: getattr(row, field) for field in FIELDS}
+        for row in db.query(NoteDailyStat).all()
+        if row.note_count
+    }
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    XiaohongshuNote.__table__.create(engine)
+    NoteDailyStat.__table__.create(engine)
+    session = sessionmaker(bind=engine)()
+    notes = [
+        # id, 指纹, 创建时间, 模型, 耗时, token
+        (1, "fp-a", datetime(2024, 1, 1, 9), "gpt-4o", 1000, 300),
+        (2, "fp-a", datetime(2024, 1, 2, 9), "gpt-4o", 1200, None),
+        (3, "fp-a", datetime(2024, 1, 2, 9), "claude", None, 200),
+        (4, "fp-b", datetime(2024, 1, 2, 10), "gpt-4o", 900, 250),
+        (5, None, datetime(2024, 1, 3, 10), "gpt-4o", 800, 100),
+    ]
+    for note_id, fingerprint, created_at, model, latency_ms, total_tokens in notes:
+        session.add(XiaohongshuNote(
+            id=note_id, input_basic_content="b", note_title="t", note_content="c", comment_guide="g",
+            comment_questions="q", input_fingerprint=fingerprint, created_at=created_at, model=model,
+            input_platform="小红书", latency_ms=latency_ms, total_tokens=total_tokens
+        ))
+    session.flush()
+    for (stat_date, model, platform, account_id), values in expected_rollup(session).items():
+        session.add(NoteDailyStat(stat_date=stat_date, model=model, platform=platform, account_id=account_id, **values))
+    session.commit()
+    yield session
+    session.close()
+
+
+@pytest.mark.parametrize("note_id", [1, 2, 3, 4, 5])
+def test_remove_note_matches_rebuild(db, note_id):
+    note = db.get(XiaohongshuNote, note_id)
+    analytics_service.remove_note(db, note)
+    db.delete(note)
+    db.commit()
+    assert stored_rollup(db) == dict(expected_rollup(db))
+
+
+def test_removing_earliest_note_promotes_the_next_ones(db):
+    note = db.get(XiaohongshuNote, 1)
+    analytics_service.remove_note(db, note)
+    db.delete(note)
+    db.commit()
+    # 笔记 2、3 同时成为 fp-a 中最早的，不再算作重新生成
+    assert sum(values["regenerate_count"] for values in stored_rollup(db).values()) == 0
@@ -0,0 +1,83 @@
+import os
+import uuid
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session, sessionmaker
+
+from app import crud
+from app.models import ClientAccount
+
+ACCOUNTS = [
+    {"account_name": "a", "account_type": "家居", "platform": "小红书", "topic_keywords": ["割草机", "草坪"]},
+    {"account_name": "b", "account_type": "家居", "platform": "小红书", "topic_keywords": ["草坪"]},
+    {"account_name": "c", "account_type": "家居", "platform": "小红书", "topic_keywords": None},
+]
+
+
+class CompileOnlySession:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement):
+        self.statements.append(str(statement.compile(dialect=postgresql.dialect())))
+        return []
+
+
+def test_keyword_frequencies_only_expands_arrays():
+    db = CompileOnlySession()
+    crud.get_keyword_frequencies(db)
+    assert "jsonb_typeof(client_accounts.topic_keywords) =" in db.statements[0]
+
+
+def test_null_keywords_are_stored_as_sql_null():
+    engine = create_engine("sqlite://")
+    ClientAccount.__table__.create(engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        db.add_all(ClientAccount(**account) for account in ACCOUNTS)
+        db.commit()
+        nulls = db.execute(text("SELECT account_name FROM client_accounts WHERE topic_keywords IS NULL")).scalars().all()
+        assert nulls == ["c"]
+    finally:
+        db.close()
+
+
+@pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="需要 TEST_DATABASE_URL 指向 PostgreSQL")
+def test_keyword_frequencies_with_null_keywords_on_postgres():
+    # 在临时 schema 中建表，整个事务最后回滚，不触碰库中已有的 client_accounts
+    engine = create_engine(os.environ["TEST_DATABASE_URL"])
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            connection.execute(text(f"CREATE SCHEMA {schema}"))
+            connection.execute(text(f"SET LOCAL search_path TO {schema}"))
+            ClientAccount.__table__.create(connection)
+            db = Session(bind=connection)
+            db.add_all(ClientAccount(**account) for account in ACCOUNTS)
+            db.flush()
+            # 迁移前遗留的 JSON null
+            db.execute(text(
+                "INSERT INTO client_accounts (account_name, account_type, platform, topic_keywords) "
+                "VALUES ('d', '家居', '小红书', 'null'::jsonb)"
+            ))
+            assert crud.get_keyword_frequencies(db) == [
+                {"keyword": "草坪", "account_count": 2},
+                {"keyword": "割草机", "account_count": 1},
+            ]
+            db.close()
+        finally:
+            transaction.rollback()
+
+
+def test_update_rejects_null_for_required_columns():
+    from pydantic import ValidationError
+    from app.schemas import ClientAccountUpdate
+
+    for field in ("account_name", "account_type", "platform"):
+        with pytest.raises(ValidationError):
+            ClientAccountUpdate(**{field: None})
+    assert ClientAccountUpdate(topic_keywords=None).dict(exclude_unset=True) == {"topic_keywords": None}
+    assert ClientAccountUpdate(platform="抖音").dict(exclude_unset=True) == {"platform": "抖音"}
@@ -0,0 +1,90 @@
+import pytest
+
+from app.services.fingerprint_service import FingerprintService, SIMHASH_BANDS
+
+
+service = FingerprintService()
+
+NOTE = {
+    "note_title": "春季草坪养护指南🌱",
+    "note_content": "三月开始给草坪施肥，割草高度保持在五厘米左右，记得定期检查割草机刀片。",
+    "input_basic_content": "草坪养护",
+    "input_selected_account_id": 7,
+}
+
+
+def test_fingerprint_note_fields():
+    fields = service.fingerprint_note(NOTE)
+    assert set(fields) == {
+        "input_fingerprint", "content_fingerprint", "content_simhash",
+        *(f"simhash_band_{i}" for i in range(SIMHASH_BANDS))
+    }
+    assert len(fields["input_fingerprint"]) == 64
+    assert -(1 << 63) <= fields["content_simhash"] < (1 << 63)
+    # 分段由无符号 SimHash 切分得到
+    unsigned = fields["content_simhash"] & ((1 << 64) - 1)
+    assert [fields[f"simhash_band_{i}"] for i in range(SIMHASH_BANDS)] == service.simhash_bands(unsigned)
+
+
+def test_fingerprints_ignore_case_whitespace_and_punctuation():
+    variant = {**NOTE, "note_title": "春季草坪养护指南 🌱!", "input_basic_content": " 草坪 养护 "}
+    assert service.fingerprint_note(variant) == service.fingerprint_note(NOTE)
+
+
+def test_input_fingerprint_depends_on_account():
+    other = {**NOTE, "input_selected_account_id": 8}
+    assert service.input_fingerprint(other) != service.input_fingerprint(NOTE)
+    assert service.content_fingerprint(NOTE["note_title"], NOTE["note_content"]) == \
+        service.fingerprint_note(other)["content_fingerprint"]
+
+
+def test_small_edit_stays_close():
+    edited = NOTE["note_content"].replace("五厘米", "六厘米")
+    a = service.simhash(NOTE["note_title"] + "\n" + NOTE["note_content"])
+    b = service.simhash(NOTE["note_title"] + "\n" + edited)
+    unrelated = service.simhash("周末去海边露营，带上帐篷和烧烤架，看日落吹海风。")
+    assert service.hamming_distance(a, b) < service.hamming_distance(a, unrelated)
+
+
+def test_hamming_distance_and_bands():
+    assert service.hamming_distance(0, (1 << 64) - 1) == 64
+    assert service.hamming_distance(-1, (1 << 64) - 1) == 0
+    assert service.simhash_bands(0x0004000300020001) == [1, 2, 3, 4]
+    assert service.simhash("") == 0
+
+
+def test_find_similar_notes_stays_within_account_history():
+    from datetime import datetime
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app.models import XiaohongshuNote
+
+    engine = create_engine("sqlite://")
+    XiaohongshuNote.__table__.create(engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        for note_id, account_id in [(1, None), (2, 7), (3, None)]:
+            note = {**NOTE, "input_selected_account_id": account_id}
+            db.add(XiaohongshuNote(
+                id=note_id, created_at=datetime(2024, 1, 1), input_basic_content="草坪养护",
+                note_title=note["note_title"], note_content=note["note_content"],
+                comment_guide="", comment_questions="", input_selected_account_id=account_id,
+                **service.fingerprint_note(note)
+            ))
+        db.commit()
+        fingerprints = service.fingerprint_note(NOTE)
+        assert [item["id"] for item in service.find_similar_notes(db, fingerprints)] == [1, 3]
+        assert [item["id"] for item in service.find_similar_notes(db, fingerprints, account_id=7)] == [2]
+    finally:
+        db.close()
+
+
+def test_max_distance_from_env_is_bounded(monkeypatch):
+    for value in ("-1", "4"):
+        monkeypatch.setenv("NOTE_DUPLICATE_MAX_DISTANCE", value)
+        with pytest.raises(ValueError):
+            FingerprintService()
+    monkeypatch.setenv("NOTE_DUPLICATE_MAX_DISTANCE", "0")
+    assert FingerprintService().max_distance == 0
@@ -0,0 +1,44 @@
+import io
+import json
+
+from pydantic import BaseModel
+
+from app.services.import_service import ImportService
+
+
+class Row(BaseModel):
+    name: str
+
+
+def run(lines, write_chunk, chunk_size=4):
+    service = ImportService(chunk_size=chunk_size)
+    file = io.BytesIO("\n".join(json.dumps(line) for line in lines).encode("utf-8"))
+    return service._run_import(file, "ndjson", Row, lambda record: record, write_chunk)
+
+
+def test_bad_row_in_chunk_does_not_fail_the_others():
+    written = []
+    attempts = []
+
+    def write_chunk(records):
+        attempts.append(len(records))
+        if any(record["name"] == "bad" for record in records):
+            raise RuntimeError("duplicate key value\nDETAIL: ...")
+        written.extend(record["name"] for record in records)
+
+    lines = [{"name": f"r{i}"} for i in range(10)]
+    lines[5] = {"name": "bad"}
+    result = run(lines, write_chunk)
+
+    assert result["imported"] == 9
+    assert result["failed"] == 1
+    assert result["errors"] == [{"row": 6, "error": "写入失败: duplicate key value"}]
+    assert sorted(written) == sorted(line["name"] for line in lines if line["name"] != "bad")
+    # 失败的块二分重试，而不是逐行重试整块
+    assert len(attempts) < 10
+
+
+def test_validation_errors_are_reported_per_row():
+    result = run([{"name": "a"}, {"other": 1}, [1]], lambda records: None)
+    assert result["imported"] == 1
+    assert [error["row"] for error in result["errors"]] == [2, 3]
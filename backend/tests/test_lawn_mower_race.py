@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from app.services.lawn_mower_service import LawnMowerService
+from app.services.race_store import race_store
+
+PARAMS = {
+    "spu": "LUBA", "sku": None, "language": "chinese", "target_platform": "小红书", "opening_hook": "钩子",
+    "narrative_perspective": "第一人称", "content_logic": "逻辑", "value_proposition": "省心",
+    "key_selling_points": "卖点", "specific_scenario": "周末", "user_persona": "新手", "content_style": "轻松",
+    "holiday_season": None,
+}
+
+
+def valid(model):
+    return {"titles": {"chinese": [f"{model} 标题"]}, "main_content": {"chinese": f"{model} 正文"}}
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(race_store, "directory", str(tmp_path))
+    service = LawnMowerService()
+    outputs = {"a": valid("a"), "b": valid("b"), "bad": {"titles": {}}}
+
+    async def generate(model, messages):
+        # 不等待，所有模型在同一批完成
+        return "", outputs[model]
+
+    service._generate_with_model = generate
+    return service
+
+
+def test_valid_results_in_the_same_batch_are_not_reported_as_failed(service):
+    result = asyncio.run(service.race_lawn_mower_content(["a", "b", "bad"], **PARAMS))
+    data = result["data"]
+    assert result["success"]
+    assert len(data["results"]) == 1
+    assert data["failed_models"] == {"bad": "返回内容不符合输出格式"}
+    assert data["race_id"] is None
+
+
+def test_keep_others_stores_extra_valid_results(service):
+    result = asyncio.run(service.race_lawn_mower_content(["a", "b", "bad"], keep_others=True, **PARAMS))
+    data = result["data"]
+    record = race_store.get(data["race_id"])
+    assert sorted(item["model"] for item in record["results"]) == ["a", "b"]
+    assert record["results"][0]["model"] == data["models_used"][0]
+    assert record["failed_models"] == {"bad": "返回内容不符合输出格式"}
+    assert record["completed"]
+
+
+def test_render_prompt_accepts_request_fields():
+    service = LawnMowerService()
+    params = {**PARAMS, "variants": 2}
+    rendered = service.render_prompt(**params)
+    assert rendered == service.build_prompt(*service._content_args(params))
+    assert "LUBA" in rendered["messages"][-1]["content"]
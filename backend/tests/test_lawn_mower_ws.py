@@ -0,0 +1,28 @@
+import asyncio
+
+from app.lawn_mower_ws import LawnMowerSession
+
+PAYLOAD = {
+    "spu": "LUBA", "opening_hook": "钩子", "narrative_perspective": "第一人称", "content_logic": "逻辑",
+    "value_proposition": "省心", "key_selling_points": "卖点", "specific_scenario": "周末", "user_persona": "新手",
+    "content_style": "轻松", "ai_model": ["gpt-4o"],
+}
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, message):
+        self.sent.append(message)
+
+
+def test_generate_rejects_variants():
+    websocket = FakeWebSocket()
+    session = LawnMowerSession(websocket, service=None)
+
+    asyncio.run(session._start_generation("r1", {**PAYLOAD, "variants": 3}))
+
+    assert [message["type"] for message in websocket.sent] == ["error"]
+    assert "variants" in websocket.sent[0]["error"]
+    assert session.tasks == {}
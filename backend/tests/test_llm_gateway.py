@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from app import deadline
+from app.services.llm_gateway import LLMGateway, RetryableError
+
+
+@pytest.fixture
+def gateway():
+    gateway = LLMGateway()
+    gateway.max_retries = 2
+    gateway.retry_backoff = 0
+    gateway.min_attempt_budget = 5
+    return gateway
+
+
+def fake_send(gateway, outcomes):
+    """按顺序返回或抛出 outcomes 中的结果，记录调用次数"""
+    calls = []
+
+    async def send(backend, model, request_data, attempt=0):
+        calls.append(attempt)
+        outcome = outcomes[len(calls) - 1]
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    gateway._send = send
+    return calls
+
+
+class TestParseJsonObject:
+    def test_plain_json(self):
+        assert LLMGateway.parse_json_object('{"a": 1}') == {"a": 1}
+
+    def test_code_block(self):
+        content = '好的，结果如下：\n```json\n{"note_title": "标题"}\n```\n希望对你有帮助'
+        assert LLMGateway._parse_json_object(content, None) == ({"note_title": "标题"}, "code-block")
+
+    def test_fragment_with_one_level_of_nesting(self):
+        content = '前言 {"titles": {"chinese": ["a"]}, "main_content": "b"} 结尾'
+        parsed, path = LLMGateway._parse_json_object(content, None)
+        assert path == "fragment"
+        assert parsed == {"titles": {"chinese": ["a"]}, "main_content": "b"}
+
+    def test_required_key_skips_other_objects(self):
+        content = '示例 {"x": 1} 实际 {"note_title": "t"}'
+        assert LLMGateway.parse_json_object(content, required_key="note_title") == {"note_title": "t"}
+
+    def test_returns_none_when_nothing_matches(self):
+        assert LLMGateway._parse_json_object("没有 JSON", None) == (None, "none")
+        assert LLMGateway.parse_json_object('{"x": 1}', required_key="note_title") is None
+
+    def test_non_object_json_is_rejected(self):
+        assert LLMGateway.parse_json_object("[1, 2]") is None
+
+
+class TestParseRoutes:
+    def test_backend_and_upstream_model(self):
+        routes = LLMGateway._parse_routes("deepseek-r1=deepseek:deepseek-reasoner, deepseek-chat = deepseek")
+        assert routes == {
+            "deepseek-r1": ("deepseek", "deepseek-reasoner"),
+            "deepseek-chat": ("deepseek", None),
+        }
+
+    def test_ignores_malformed_items(self):
+        assert LLMGateway._parse_routes("") == {}
+        assert LLMGateway._parse_routes("gpt-4o,,claude=one_api") == {"claude": ("one_api", None)}
+
+
+class TestRetry:
+    def test_retries_retryable_errors(self, gateway):
+        calls = fake_send(gateway, [RetryableError("HTTP错误 429"), {"ok": True}])
+        assert asyncio.run(gateway.chat_completion("gpt-4o", [])) == {"ok": True}
+        assert calls == [0, 1]
+
+    def test_gives_up_after_max_retries(self, gateway):
+        calls = fake_send(gateway, [RetryableError("HTTP错误 503")] * 3)
+        with pytest.raises(Exception, match="HTTP错误 503"):
+            asyncio.run(gateway.chat_completion("gpt-4o", []))
+        assert calls == [0, 1, 2]
+
+    def test_does_not_retry_other_errors(self, gateway):
+        calls = fake_send(gateway, [Exception("HTTP错误 400"), {"ok": True}])
+        with pytest.raises(Exception, match="HTTP错误 400"):
+            asyncio.run(gateway.chat_completion("gpt-4o", []))
+        assert calls == [0]
+
+    def test_no_retry_when_deadline_leaves_too_little_time(self, gateway):
+        calls = fake_send(gateway, [RetryableError("HTTP错误 429"), {"ok": True}])
+
+        async def run():
+            # 剩余 3 秒，小于单次尝试所需的 5 秒
+            deadline.start(3)
+            return await gateway.chat_completion("gpt-4o", [])
+
+        with pytest.raises(Exception, match="HTTP错误 429"):
+            asyncio.run(run())
+        assert calls == [0]
+
+    def test_retry_after_counts_against_deadline(self, gateway):
+        calls = fake_send(gateway, [RetryableError("HTTP错误 429", retry_after=10), {"ok": True}])
+
+        async def run():
+            deadline.start(12)
+            return await gateway.chat_completion("gpt-4o", [])
+
+        with pytest.raises(Exception, match="HTTP错误 429"):
+            asyncio.run(run())
+        assert calls == [0]
@@ -0,0 +1,52 @@
+import asyncio
+
+from app import deadline
+from app.services.note_writer import NoteWriteBehind
+
+
+def make_writer(monkeypatch, tmp_path):
+    writer = NoteWriteBehind()
+    writer.spill_dir = str(tmp_path)
+    writer.max_retries = 5
+    attempts = []
+
+    def write_batch(rows):
+        attempts.append(len(rows))
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(writer, "_write_batch", write_batch)
+    monkeypatch.setattr(writer, "_spill", lambda rows: writer.stats.__setitem__("spilled", len(rows)))
+    return writer, attempts
+
+
+def test_write_within_request_spills_instead_of_outliving_deadline(monkeypatch, tmp_path):
+    writer, attempts = make_writer(monkeypatch, tmp_path)
+
+    async def write():
+        token = deadline.start(0.2)
+        try:
+            await writer._write_with_retry([{"id": 1}])
+        finally:
+            deadline.reset(token)
+
+    asyncio.run(write())
+
+    # 第一次重试需等待 0.5 秒，超过剩余时间，直接落盘
+    assert attempts == [1]
+    assert writer.stats["retries"] == 0
+    assert writer.stats["spilled"] == 1
+
+
+def test_background_write_retries_without_deadline(monkeypatch, tmp_path):
+    writer, attempts = make_writer(monkeypatch, tmp_path)
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    asyncio.run(writer._write_with_retry([{"id": 1}], max_retries=2))
+
+    assert attempts == [1, 1, 1]
+    assert delays == [0.5, 1.0]
+    assert writer.stats["spilled"] == 1
@@ -0,0 +1,215 @@
+import gzip
+import json
+import os
+from contextlib import contextmanager
+from datetime import date
+
+import pytest
+
+from app.services.partition_service import PartitionService
+
+
+class FakeResult:
+    def __init__(self, value=None, rows=(), rowcount=0):
+        self.value = value
+        self.rows = list(rows)
+        self.rowcount = rowcount
+
+    def scalar(self):
+        return self.value
+
+    def fetchone(self):
+        return self.value
+
+    def fetchall(self):
+        return self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class FakeRow:
+    def __init__(self, mapping):
+        self._mapping = mapping
+
+
+class FakeConnection:
+    """按语句返回预设结果，记录执行过的 SQL"""
+
+    def __init__(self, existing=(), stranded_months=(), rows=()):
+        self.existing = set(existing)
+        self.stranded_months = set(stranded_months)
+        self.rows = rows
+        self.statements = []
+
+    def execution_options(self, **options):
+        return self
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        self.statements.append(sql)
+        if "to_regclass" in sql:
+            return FakeResult(params["name"] in self.existing)
+        if "pg_try_advisory_lock" in sql:
+            return FakeResult(True)
+        if "relkind" in sql:
+            return FakeResult("p")
+        if "pg_inherits" in sql:
+            return FakeResult(rows=[(name,) for name in sorted(self.existing)])
+        if sql.startswith("SELECT DISTINCT date_trunc"):
+            return FakeResult(rows=[(month,) for month in sorted(self.stranded_months)])
+        if sql.startswith("CREATE TABLE"):
+            self.existing.add(sql.split()[2])
+        if sql.startswith("SELECT EXISTS"):
+            return FakeResult(params["start"] in self.stranded_months)
+        if sql.startswith("WITH moved"):
+            self.stranded_months.discard(params["start"])
+            return FakeResult(rowcount=3)
+        if sql.startswith("SELECT count(*), sum(id)"):
+            return FakeResult((len(self.rows), sum(row["id"] for row in self.rows), None))
+        if sql.startswith("SELECT *"):
+            return FakeResult(rows=[FakeRow(row) for row in self.rows])
+        return FakeResult()
+
+
+class FakeEngine:
+    def __init__(self, connection):
+        self.connection = connection
+
+    @contextmanager
+    def begin(self):
+        yield self.connection
+
+    connect = begin
+
+
+def test_creates_partition_directly_when_default_has_no_rows():
+    conn = FakeConnection(existing={"xiaohongshu_notes_default"})
+    PartitionService(FakeEngine(conn)).create_partition(conn, date(2030, 1, 15))
+    assert [sql.split(" (")[0] for sql in conn.statements if not sql.startswith("SELECT")] == [
+        "CREATE TABLE xiaohongshu_notes_p2030_01 PARTITION OF xiaohongshu_notes FOR VALUES FROM"
+    ]
+
+
+def test_skips_existing_partition():
+    conn = FakeConnection(existing={"xiaohongshu_notes_p2030_01"})
+    PartitionService(FakeEngine(conn)).create_partition(conn, date(2030, 1, 1))
+    assert len(conn.statements) == 1
+
+
+def test_moves_rows_out_of_default_partition():
+    conn = FakeConnection(existing={"xiaohongshu_notes_default"}, stranded_months={date(2030, 1, 1)})
+    PartitionService(FakeEngine(conn)).create_partition(conn, date(2030, 1, 1))
+    changes = [sql for sql in conn.statements if not sql.startswith("SELECT")]
+    assert changes[0] == "ALTER TABLE xiaohongshu_notes DETACH PARTITION xiaohongshu_notes_default"
+    assert changes[1].startswith("CREATE TABLE xiaohongshu_notes_p2030_01 PARTITION OF")
+    assert changes[2].startswith("WITH moved AS (DELETE FROM xiaohongshu_notes_default")
+    assert changes[3] == "ALTER TABLE xiaohongshu_notes ATTACH PARTITION xiaohongshu_notes_default DEFAULT"
+
+
+def test_one_failing_month_does_not_block_the_others(monkeypatch):
+    service = PartitionService(FakeEngine(FakeConnection()))
+    calls = []
+
+    def create_partition(connection, month):
+        calls.append(month)
+        if len(calls) == 2:
+            raise RuntimeError("boom")
+        return month.isoformat()
+
+    monkeypatch.setattr(service, "create_partition", create_partition)
+    created = service.ensure_future_partitions(months_ahead=3)
+    assert len(calls) == 4
+    assert len(created) == 3
+
+
+def make_archive_service(conn, tmp_path):
+    service = PartitionService(FakeEngine(conn))
+    service.archive_dir = str(tmp_path)
+    return service
+
+
+def test_archive_is_complete_before_partition_is_detached(tmp_path):
+    rows = [{"id": i, "note_title": f"t{i}"} for i in range(5)]
+    conn = FakeConnection(rows=rows)
+    service = make_archive_service(conn, tmp_path)
+    archive = tmp_path / "xiaohongshu_notes_p2020_01.ndjson.gz"
+
+    original_execute = conn.execute
+
+    def execute(statement, params=None):
+        if str(statement).startswith("ALTER TABLE xiaohongshu_notes DETACH"):
+            # 卸载分区时归档文件已完整落盘
+            with gzip.open(archive, "rt", encoding="utf-8") as f:
+                assert [json.loads(line) for line in f] == rows
+            assert not os.path.exists(f"{archive}.tmp")
+        return original_execute(statement, params)
+
+    conn.execute = execute
+    assert service.archive_partition("xiaohongshu_notes_p2020_01") == str(archive)
+    # 导出在只读事务中进行，主表的排他锁只在最后的短事务中持有
+    assert conn.statements[0].startswith("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+    assert conn.statements[-4:] == [
+        "LOCK TABLE xiaohongshu_notes_p2020_01 IN SHARE MODE",
+        "SELECT count(*), sum(id), max(updated_at) FROM xiaohongshu_notes_p2020_01",
+        "ALTER TABLE xiaohongshu_notes DETACH PARTITION xiaohongshu_notes_p2020_01",
+        "DROP TABLE xiaohongshu_notes_p2020_01",
+    ]
+
+
+def test_partition_written_during_export_is_kept(tmp_path):
+    conn = FakeConnection(rows=[{"id": 1}])
+    service = make_archive_service(conn, tmp_path)
+
+    original_execute = conn.execute
+
+    def execute(statement, params=None):
+        if str(statement).startswith("LOCK TABLE"):
+            # 导出完成后又写入了一条
+            conn.rows = conn.rows + [{"id": 2}]
+        return original_execute(statement, params)
+
+    conn.execute = execute
+    with pytest.raises(RuntimeError):
+        service.archive_partition("xiaohongshu_notes_p2020_01")
+    assert not any(sql.startswith(("ALTER", "DROP")) for sql in conn.statements)
+
+
+def test_failed_archive_keeps_partition(tmp_path, monkeypatch):
+    conn = FakeConnection(rows=[{"id": 1}])
+    service = make_archive_service(conn, tmp_path)
+
+    def broken_dumps(*args, **kwargs):
+        raise ValueError("无法序列化")
+
+    monkeypatch.setattr("app.services.partition_service.json.dumps", broken_dumps)
+    with pytest.raises(ValueError):
+        service.archive_partition("xiaohongshu_notes_p2020_01")
+    assert not any(sql.startswith(("ALTER", "DROP")) for sql in conn.statements)
+    assert not (tmp_path / "xiaohongshu_notes_p2020_01.ndjson.gz").exists()
+
+
+def test_maintenance_partitions_and_archives_imported_old_month(tmp_path):
+    # 通过 /notes/import 导入的历史笔记没有对应的月分区，落在默认分区
+    conn = FakeConnection(existing={"xiaohongshu_notes_default"}, stranded_months={date(2019, 5, 1)})
+    service = make_archive_service(conn, tmp_path)
+    service.retention_months = 12
+
+    service.run_maintenance()
+
+    assert "xiaohongshu_notes_p2019_05" in conn.existing
+    assert not conn.stranded_months
+    assert (tmp_path / "xiaohongshu_notes_p2019_05.ndjson.gz").exists()
+    assert "DROP TABLE xiaohongshu_notes_p2019_05" in conn.statements
+
+
+def test_rearchiving_a_month_keeps_the_earlier_archive(tmp_path):
+    earlier = tmp_path / "xiaohongshu_notes_p2019_05.ndjson.gz"
+    earlier.write_bytes(b"earlier")
+    service = make_archive_service(FakeConnection(rows=[{"id": 1}]), tmp_path)
+
+    path = service.archive_partition("xiaohongshu_notes_p2019_05")
+
+    assert path != str(earlier)
+    assert os.path.basename(path).split(".")[0] == "xiaohongshu_notes_p2019_05"
+    assert earlier.read_bytes() == b"earlier"
@@ -0,0 +1,64 @@
+from app.services.prompt_templates import (
+    PromptSection, PromptTemplate, TRUNCATION_MARK, estimate_tokens
+)
+
+
+def make_template(budget=None):
+    return PromptTemplate(
+        name="test",
+        system_prompt="系统",
+        user_prefix="前缀\n",
+        sections=[
+            PromptSection("body", "正文：{value}\n", required=True, truncatable=True),
+            PromptSection("links", "链接：{value}\n", priority=1, truncatable=True),
+            PromptSection("style", "风格：{value}\n", priority=2),
+        ],
+        budget=budget or 1000
+    )
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("中文") == 2
+    assert estimate_tokens("abcdefgh") == 2
+    assert estimate_tokens("中a") == 2
+
+
+def test_within_budget_keeps_everything_in_section_order():
+    result = make_template()._render({"body": "内容", "links": "http://a", "style": "活泼"})
+    assert result["trimmed"] == []
+    assert result["messages"][1]["content"] == "前缀\n正文：内容\n链接：http://a\n风格：活泼\n"
+    assert result["estimated_tokens"] <= result["budget"]
+
+
+def test_empty_values_are_skipped():
+    result = make_template()._render({"body": "内容", "links": "", "style": None})
+    assert result["messages"][1]["content"] == "前缀\n正文：内容\n"
+
+
+def test_optional_sections_are_trimmed_by_priority_first():
+    template = make_template()
+    values = {"body": "内容" * 20, "links": "链" * 200, "style": "活泼"}
+    budget = template.static_tokens + estimate_tokens("正文：" + "内容" * 20 + "\n") + 30
+    result = template._render(values, budget=budget)
+
+    assert result["trimmed"][0] == {"section": "links", "action": "truncated"}
+    assert "style" not in [item["section"] for item in result["trimmed"]]
+    assert TRUNCATION_MARK in result["messages"][1]["content"]
+    assert "内容" * 20 in result["messages"][1]["content"]
+    assert result["estimated_tokens"] <= budget
+
+
+def test_required_section_is_truncated_not_dropped():
+    template = make_template()
+    budget = template.static_tokens + 30
+    result = template._render({"body": "内容" * 200, "style": "活泼"}, budget=budget)
+
+    actions = {item["section"]: item["action"] for item in result["trimmed"]}
+    assert actions == {"style": "dropped", "body": "truncated"}
+    assert result["messages"][1]["content"].startswith("前缀\n正文：")
+    assert result["estimated_tokens"] <= budget
+
+
+def test_truncate_returns_empty_when_nothing_fits():
+    assert PromptTemplate._truncate("内容" * 10, 1) == ""
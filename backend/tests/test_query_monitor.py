@@ -0,0 +1,82 @@
+import pytest
+
+from app.query_monitor import QueryMonitor
+
+
+@pytest.mark.parametrize("statement", [
+    "SELECT id FROM xiaohongshu_notes WHERE id = %(id)s",
+    "  select count(*) from client_accounts",
+    "SELECT note_title FROM xiaohongshu_notes WHERE note_title LIKE %(pattern)s",
+])
+def test_read_only_select_is_explainable(statement):
+    assert QueryMonitor._explainable(statement)
+
+
+@pytest.mark.parametrize("statement", [
+    "SELECT nextval('xiaohongshu_notes_id_seq') FROM generate_series(1, %(count)s)",
+    "SELECT setval('xiaohongshu_notes_id_seq', %(value)s)",
+    "SELECT pg_advisory_xact_lock(%(key)s)",
+    "SELECT PG_TRY_ADVISORY_LOCK (42)",
+    "UPDATE xiaohongshu_notes SET note_title = %(title)s",
+    "INSERT INTO xiaohongshu_notes (id) VALUES (%(id)s) RETURNING id",
+])
+def test_statements_with_side_effects_are_skipped(statement):
+    assert not QueryMonitor._explainable(statement)
+
+
+class FakeCursor:
+    def __init__(self, executed):
+        self.executed = executed
+
+    def execute(self, statement, parameters=None):
+        self.executed.append(statement)
+
+    def fetchall(self):
+        return [("Seq Scan on xiaohongshu_notes",)]
+
+
+class FakeConnection:
+    def __init__(self):
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self.executed)
+
+    def rollback(self):
+        self.executed.append("ROLLBACK")
+
+    def close(self):
+        pass
+
+
+def test_explain_runs_in_read_only_transaction():
+    monitor = QueryMonitor()
+    connection = FakeConnection()
+    monitor._engine = type("Engine", (), {"raw_connection": lambda self: connection})()
+
+    plan = monitor._explain("SELECT 1", {})
+
+    assert plan == "Seq Scan on xiaohongshu_notes"
+    assert connection.executed[0] == "SET TRANSACTION READ ONLY"
+    assert connection.executed[2].startswith("EXPLAIN (ANALYZE, BUFFERS) SELECT 1")
+    assert connection.executed[-1] == "ROLLBACK"
+
+
+def test_failed_statement_does_not_leave_start_time_on_connection():
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.exc import OperationalError
+
+    engine = create_engine("sqlite://")
+    monitor = QueryMonitor()
+    monitor.instrument(engine)
+    token = monitor.start_request()
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        with pytest.raises(OperationalError):
+            connection.execute(text("SELECT * FROM missing_table"))
+        assert connection.connection.info.get("query_start_times") == []
+    stats = monitor.finish_request(token, "GET /test")
+
+    # 失败的语句同样计入请求统计
+    assert stats.count == 2
+    assert "SELECT * FROM missing_table" in stats.statements
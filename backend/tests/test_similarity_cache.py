@@ -0,0 +1,62 @@
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models import XiaohongshuNote
+from app.services.similarity_cache import SimilarityCache
+
+
+def make_db():
+    engine = create_engine("sqlite://")
+    XiaohongshuNote.__table__.create(engine)
+    return sessionmaker(bind=engine)()
+
+
+def insert(db, *ids):
+    db.add_all(
+        XiaohongshuNote(
+            id=note_id, created_at=datetime(2030, 1, 1), model="gpt-4o", note_title="t", note_content="c",
+            comment_guide="g", comment_questions="q",
+            input_basic_content=f"割草机草坪养护 {note_id}"
+        )
+        for note_id in ids
+    )
+    db.commit()
+
+
+def test_notes_committed_below_watermark_are_loaded_later():
+    db = make_db()
+    cache = SimilarityCache()
+    insert(db, 1, 2, 3)
+    cache.refresh(db, force=True)
+
+    # 其他 worker 预分配的 4、5 尚未写入，更大的 6、7 已先提交
+    insert(db, 6, 7)
+    cache.refresh(db, force=True)
+    assert cache._last_id == 7
+    assert [gap[:2] for gap in cache._gaps] == [(4, 5)]
+
+    insert(db, 5)
+    cache.refresh(db, force=True)
+    assert [gap[:2] for gap in cache._gaps] == [(4, 4)]
+
+    insert(db, 4)
+    cache.refresh(db, force=True)
+    assert sorted(cache._entries) == [1, 2, 3, 4, 5, 6, 7]
+    assert cache._gaps == []
+
+
+def test_gaps_expire_after_ttl():
+    db = make_db()
+    cache = SimilarityCache()
+    insert(db, 1)
+    cache.refresh(db, force=True)
+    insert(db, 3)
+    cache.refresh(db, force=True)
+    assert [gap[:2] for gap in cache._gaps] == [(2, 2)]
+
+    # 空洞超过存活时间仍未出现，视为已回滚或删除
+    cache.gap_ttl = 0
+    cache.refresh(db, force=True)
+    assert cache._gaps == []
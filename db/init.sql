@@ -22,9 +22,9 @@ CREATE TABLE IF NOT EXISTS users (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
--- 创建小红书笔记表
+-- 创建小红书笔记表（按 created_at 月分区，月分区由后端启动时自动创建）
 CREATE TABLE IF NOT EXISTS xiaohongshu_notes (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     input_basic_content TEXT NOT NULL,
     input_note_purpose TEXT,
     input_recent_trends TEXT,
@@ -42,9 +42,30 @@ CREATE TABLE IF NOT EXISTS xiaohongshu_notes (
     comment_guide TEXT,
     comment_questions TEXT,
     model VARCHAR(50),
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP
-);
+    latency_ms INTEGER,
+    total_tokens INTEGER,
+    input_fingerprint VARCHAR(64),
+    content_fingerprint VARCHAR(64),
+    content_simhash BIGINT,
+    simhash_band_0 INTEGER,
+    simhash_band_1 INTEGER,
+    simhash_band_2 INTEGER,
+    simhash_band_3 INTEGER,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+-- 默认分区，兜底尚未创建月分区的数据
+CREATE TABLE IF NOT EXISTS xiaohongshu_notes_default PARTITION OF xiaohongshu_notes DEFAULT;
+
+-- 笔记指纹索引（重复检测）
+CREATE INDEX IF NOT EXISTS ix_xiaohongshu_notes_input_fingerprint ON xiaohongshu_notes (input_fingerprint);
+CREATE INDEX IF NOT EXISTS ix_notes_account_content_fp ON xiaohongshu_notes (input_selected_account_id, content_fingerprint);
+CREATE INDEX IF NOT EXISTS ix_notes_account_band_0 ON xiaohongshu_notes (input_selected_account_id, simhash_band_0);
+CREATE INDEX IF NOT EXISTS ix_notes_account_band_1 ON xiaohongshu_notes (input_selected_account_id, simhash_band_1);
+CREATE INDEX IF NOT EXISTS ix_notes_account_band_2 ON xiaohongshu_notes (input_selected_account_id, simhash_band_2);
+CREATE INDEX IF NOT EXISTS ix_notes_account_band_3 ON xiaohongshu_notes (input_selected_account_id, simhash_band_3);
 
 -- 创建客户账号信息表
 CREATE TABLE IF NOT EXISTS client_accounts (
@@ -57,8 +78,29 @@ CREATE TABLE IF NOT EXISTS client_accounts (
     updated_at TIMESTAMP
 );
 
+-- 话题关键词 GIN 索引（支持 ?| / ?& / @> 查询）
+CREATE INDEX IF NOT EXISTS ix_client_accounts_topic_keywords ON client_accounts USING GIN (topic_keywords);
+
+-- 创建笔记按天汇总统计表
+CREATE TABLE IF NOT EXISTS note_daily_stats (
+    id SERIAL PRIMARY KEY,
+    stat_date DATE NOT NULL,
+    model VARCHAR(50) NOT NULL DEFAULT '',
+    platform VARCHAR(50) NOT NULL DEFAULT '',
+    account_id INTEGER NOT NULL DEFAULT 0,
+    note_count INTEGER NOT NULL DEFAULT 0,
+    regenerate_count INTEGER NOT NULL DEFAULT 0,
+    latency_ms_sum BIGINT NOT NULL DEFAULT 0,
+    latency_samples INTEGER NOT NULL DEFAULT 0,
+    tokens_sum BIGINT NOT NULL DEFAULT 0,
+    token_samples INTEGER NOT NULL DEFAULT 0,
+    CONSTRAINT uq_note_daily_stats_key UNIQUE (stat_date, model, platform, account_id)
+);
+
 -- 为新表设置权限
 GRANT ALL PRIVILEGES ON TABLE users TO fp_user;
 GRANT ALL PRIVILEGES ON TABLE xiaohongshu_notes TO fp_user;
+GRANT ALL PRIVILEGES ON TABLE xiaohongshu_notes_default TO fp_user;
 GRANT ALL PRIVILEGES ON TABLE client_accounts TO fp_user;
+GRANT ALL PRIVILEGES ON TABLE note_daily_stats TO fp_user;
 GRANT ALL PRIVILEGES ON ALL SEQUENCES IN SCHEMA public TO fp_user;
\ No newline at end of file
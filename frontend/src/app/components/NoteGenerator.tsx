@@ -376,7 +376,9 @@ export function NoteGenerator({ onNoteGenerated }: NoteGeneratorProps) {
         target_audience: targetAudience.trim() || null,
         content_type: contentType.trim() || null,
         reference_links: referenceLinks.trim() || null,
-        ai_model: modelsToUse.join(',')
+        ai_model: modelsToUse.join(','),
+        // 账号资料由后端根据账号ID补全
+        selected_account_id: selectedAccountId
       })
 
       if (response.data.success) {